@@ -15,5 +15,41 @@ with open(SHOPS_FILE_PATH, "r", encoding="utf-8") as f:
     _shops_data = json.load(f)
 
 SHOPS = _shops_data["shops"]
-
-SHEETS_TOKEN = os.path.join(os.path.dirname(__file__), "sheets_token.json")
\ No newline at end of file
+# Per-shop region of interest of the camera, relative to the frame: {"ShopA": {"crop":
+# [x1, y1, x2, y2], "mask": [[[x, y], ...], ...]}}. Detection only runs on the crop, with the
+# mask polygons (street windows, screens) blanked out. Shops without an entry use the whole frame
+SHOP_ROIS = _shops_data.get("rois", {})
+
+SHEETS_TOKEN = os.path.join(os.path.dirname(__file__), "sheets_token.json")
+
+# Streaming pipeline: workers per stage and size of the queue in front of each stage.
+# "track" is the number of tracking processes, each with its own resident models.
+PIPELINE_WORKERS = {
+    "download": 2,
+    "compress": 2,
+    "track": max(1, (os.cpu_count() or 1) // 2),
+    **_config_data.get("PIPELINE_WORKERS", {}),
+}
+PIPELINE_QUEUE_SIZE = _config_data.get("PIPELINE_QUEUE_SIZE", 2)
+# torch threads per tracking process, None splits the cores evenly between them
+TRACKING_THREADS_PER_WORKER = _config_data.get("TRACKING_THREADS_PER_WORKER")
+# Feed the tracker raw frames piped from ffmpeg instead of writing *_compressed.mp4 first
+FFMPEG_INGEST = _config_data.get("FFMPEG_INGEST", True)
+# Per-shop ReID galleries of the salesman (memory-mapped embeddings), kept between runs.
+# Videos where the gallery finds nobody (or overlapping tracks) fall back to the longest
+# non-overlapping tracks, which the gallery then learns. Set to null to use that selection only.
+SALESMAN_GALLERY_DIR = _config_data.get("SALESMAN_GALLERY_DIR", os.path.join("data", "galleries"))
+# Skip the detector on frames that do not differ from the last detected one. Off until its
+# HOTA impact is validated with tracking/generate_mot_results.py --motion-gate and val.py
+MOTION_GATE = _config_data.get("MOTION_GATE", False)
+# Every VID_STRIDE-th frame is tracked. With ADAPTIVE_STRIDE the stride drops to 1 while
+# tracked people overlap and grows up to MAX_VID_STRIDE while nobody is in the frame
+VID_STRIDE = _config_data.get("VID_STRIDE", 3)
+ADAPTIVE_STRIDE = _config_data.get("ADAPTIVE_STRIDE", False)
+MAX_VID_STRIDE = _config_data.get("MAX_VID_STRIDE", 24)
+# Wall-clock hours the daily backlog has to be tracked in. The stride of every video is then
+# raised above VID_STRIDE as far as needed (see StrideBudget); null keeps VID_STRIDE
+TRACKING_BUDGET_HOURS = _config_data.get("TRACKING_BUDGET_HOURS")
+# Detector weights of the tracking workers, e.g. an export of yolo/tracking/detector_export.py
+# (yolov8n.onnx, yolov8n_openvino_model) for CPU-only machines. null keeps the default yolov8n
+DETECTOR_MODEL = _config_data.get("DETECTOR_MODEL")
@@ -2,54 +2,110 @@ import os
 import schedule
 import time
 import shutil
+from functools import partial
+from pathlib import Path
 from datetime import datetime
 
-from utility.yandex_disk_connector import download_new_videos, ensure_shops_on_ydisk
-from utility.video_compressor import batch_compress_videos
+from src.config import PIPELINE_WORKERS, PIPELINE_QUEUE_SIZE, TRACKING_THREADS_PER_WORKER, FFMPEG_INGEST, SALESMAN_GALLERY_DIR, MOTION_GATE
+from src.config import DETECTOR_MODEL, SHOP_ROIS, VID_STRIDE, ADAPTIVE_STRIDE, MAX_VID_STRIDE, TRACKING_BUDGET_HOURS
+from utility.yandex_disk_connector import list_new_videos, download_video, ensure_shops_on_ydisk
+from utility.video_compressor import compress_to_sibling
+from utility.stage_pipeline import Stage, run_stages
 from utility.google_sheets_connector import get_salesman_data, ensure_shop_columns, store_metrics
-from yolo.tracking.track import run
-from metrics_evaluation.metrics import calculate_all_metrics
+from yolo.tracking.executor import TrackingExecutor, video_duration
+from yolo.tracking.stride import StrideBudget
 
 
 last_invoke_time = None
+# tracking worker processes keep detector, tracker and ReID weights loaded between daily runs
+tracking_executor = None
+
+def track_and_measure(session, vid, vid_stride=VID_STRIDE):
+    """Runs in a tracking worker process: tracks one video and computes its metrics."""
+    shop_name = os.path.basename(os.path.dirname(vid))
+    video_name = os.path.basename(vid)
+    # nobody watches the daily results, so no annotated or overlay videos are written, and
+    # the metrics are computed while tracking, so no label files either
+    session.process(source=vid, project="data/results", name=f'{shop_name}/{video_name}', vid_stride=vid_stride,
+                    adaptive_stride=ADAPTIVE_STRIDE, max_stride=max(MAX_VID_STRIDE, vid_stride), ingest='ffmpeg' if FFMPEG_INGEST else None, save=False, save_txt=False, render=False,
+                    online_metrics=True, motion_gate=MOTION_GATE, roi=SHOP_ROIS.get(shop_name),
+                    salesman_gallery=os.path.join(SALESMAN_GALLERY_DIR, shop_name) if SALESMAN_GALLERY_DIR else None)
+
+    metrics = dict(session.metrics)
+
+    metrics["date"] = datetime.strptime(video_name[:10], "%Y-%m-%d").date()
+    metrics["shop_name"] = shop_name
+    return metrics
+
+
+def add_salesman(metrics, salesmen):
+    try:
+        metrics["salesman"] = salesmen[metrics["date"]][metrics["shop_name"]]
+    except KeyError:
+        metrics["salesman"] = 'Unknown'
+    return metrics
+
+
+def _budget_key(video):
+    """Original video of a local (possibly compressed) copy, without extension."""
+    base = os.path.splitext(video)[0]
+    return base[:-len("_compressed")] if base.endswith("_compressed") else base
 
-def pipeline():
-    global last_invoke_time
 
-    new_files = download_new_videos(last_check_time=last_invoke_time)
+def track_within_budget(video, budget):
+    """Tracks a video with the stride that keeps the whole backlog within the budget."""
+    duration = video_duration(video)
+    stride = budget.stride_for(_budget_key(video), duration)
+    started = time.monotonic()
+    metrics = tracking_executor.process(video, stride)
+    budget.done(duration, stride, time.monotonic() - started)
+    return metrics
+
+
+def pipeline():
+    global last_invoke_time, tracking_executor
 
     g_sheets_table = 'Продавцы в магазинах'
 
     ensure_shops_on_ydisk()
     ensure_shop_columns(g_sheets_table)
 
-    compressed_files = batch_compress_videos(new_files)
-
     salesmen = get_salesman_data(g_sheets_table)
-    
 
-    all_metrics = []
-    for vid in compressed_files:
-        shop_name = os.path.basename(os.path.dirname(vid))
-        video_name = os.path.basename(vid)
-        run(source=vid, project="data/results", name=f'{shop_name}/{video_name}', vid_stride=3)
-
-        res_path = f"data/results/{shop_name}/{video_name}"
-        
-        metrics = calculate_all_metrics(detections_folder=f'{res_path}/labels',
-                              video_path=f'{res_path}/salesman_labeled.mp4',
-                              video_stride=3)
-        
-        metrics["date"] = datetime.strptime(video_name[:10], "%Y-%m-%d").date()
-        metrics["shop_name"] = shop_name
-        try:
-            metrics["salesman"] = salesmen[metrics["date"]][metrics["shop_name"]]
-        except KeyError:
-            metrics["salesman"] = 'Unknown'
-
-        all_metrics.append(metrics)
-    
-    store_metrics(all_metrics, g_sheets_table)
+    if tracking_executor is None:
+        tracking_executor = TrackingExecutor(
+            track_and_measure,
+            workers=PIPELINE_WORKERS["track"],
+            threads_per_worker=TRACKING_THREADS_PER_WORKER,
+            **({"yolo_model": Path(DETECTOR_MODEL)} if DETECTOR_MODEL else {}),
+        )
+
+    videos = list_new_videos(last_check_time=last_invoke_time, with_size=True)
+    if TRACKING_BUDGET_HOURS:
+        budget = StrideBudget(
+            TRACKING_BUDGET_HOURS * 3600,
+            {_budget_key(local_path): size for _, local_path, size in videos},
+            workers=PIPELINE_WORKERS["track"],
+            min_stride=VID_STRIDE,
+        )
+        track = partial(track_within_budget, budget=budget)
+    else:
+        track = tracking_executor.process
+
+    # video N is tracked while N+1 is compressed and N+2 is downloaded; one "track"
+    # thread per worker process keeps every process busy
+    stages = [
+        Stage("download", lambda v: download_video(v[0], v[1]), PIPELINE_WORKERS["download"], PIPELINE_QUEUE_SIZE),
+        Stage("compress", compress_to_sibling, PIPELINE_WORKERS["compress"], PIPELINE_QUEUE_SIZE),
+        Stage("track", lambda v: add_salesman(track(v), salesmen), PIPELINE_WORKERS["track"], PIPELINE_QUEUE_SIZE),
+    ]
+    if FFMPEG_INGEST:
+        # ffmpeg scales and strides the original video straight into the detector
+        stages = [stage for stage in stages if stage.name != "compress"]
+    all_metrics = run_stages(videos, stages)
+
+    if all_metrics:
+        store_metrics(all_metrics, g_sheets_table)
 
     try:
         shutil.rmtree("data/results")
@@ -0,0 +1,278 @@
+"""
+Benchmark of the vectorized metric calculators against the dict/loop implementations
+they replaced, on a real label folder or on a synthetic full-day track table.
+
+    python -m metrics_evaluation.benchmark --synthetic --hours 8
+    python -m metrics_evaluation.benchmark --labels data/results/<shop>/<video>/labels --width 640 --height 360
+"""
+import argparse
+import time
+
+import numpy as np
+
+from metrics_evaluation.metrics import METRIC_CALCULATORS
+from metrics_evaluation.track_table import TRACK_DTYPE, TrackTable
+from metrics_evaluation.track_log import is_track_log, load_track_table
+
+
+def dict_views(table):
+    """
+    Dict views of a TrackTable in the layout the loop implementations expect.
+
+    Returns:
+        tracks_dict: {track_id: [list_of_frame_indices]}
+        frames_info: {frame_index: {track_id: (x1, x2, y1, y2)}}
+    """
+    tracks_dict = {}
+    frames_info = {}
+    columns = table.columns(('frame', 'track_id', 'x1', 'y1', 'x2', 'y2'))
+    for frame, track_id, x1, y1, x2, y2 in zip(*(column.tolist() for column in columns.values())):
+        tracks_dict.setdefault(track_id, []).append(frame)
+        frames_info.setdefault(frame, {})[track_id] = (x1, x2, y1, y2)
+    return tracks_dict, frames_info
+
+
+def area_metric(tracks_dict, frames_info):
+    """Loop implementation the vectorized calculator replaced."""
+    # Helper to get area of track_id at a specific frame
+    def find_area(tid, fidx):
+        x1, x2, y1, y2 = frames_info[fidx][tid]
+        return abs(x2 - x1) * abs(y2 - y1)
+
+    # 1) Salesman track is -1
+    if -1 not in tracks_dict or len(tracks_dict[-1]) == 0:
+        # No salesman track found
+        return 0
+
+    salesman_frames = tracks_dict[-1]
+    # Average bounding-box area of the salesman across all frames he appears
+    salesman_areas = [find_area(-1, f) for f in salesman_frames]
+    salesman_area_mean = np.mean(salesman_areas) if salesman_areas else 0
+
+    # 2) Count how many other tracks have a max area > salesman's mean area
+    bigger_count = 0
+    for tid, frames in tracks_dict.items():
+        if tid == -1:
+            continue  # skip the salesman
+        track_areas = [find_area(tid, f) for f in frames if f in frames_info and tid in frames_info[f]]
+        if track_areas and max(track_areas) > salesman_area_mean:
+            bigger_count += 1
+
+    return bigger_count
+
+
+def speed_metric(tracks_dict, frames_info):
+    """Loop implementation the vectorized calculator replaced."""
+    significant_reduction_count = 0
+    threshold = 0.5  # 50% slowdown threshold
+
+    def compute_center(box):
+        x1, x2, y1, y2 = box
+        cx = (x1 + x2) / 2
+        cy = (y1 + y2) / 2
+        return (cx, cy)
+
+    def compute_speed(track_id, f1, f2):
+        box1 = frames_info[f1][track_id]
+        box2 = frames_info[f2][track_id]
+        cx1, cy1 = compute_center(box1)
+        cx2, cy2 = compute_center(box2)
+        return np.sqrt((cx2 - cx1)**2 + (cy2 - cy1)**2)
+
+    for tid, frames in tracks_dict.items():
+        # Sort frames so we measure speeds in chronological order
+        sorted_frames = sorted(frames)
+        speeds = []
+        # Compute speeds between consecutive frames
+        for i in range(1, len(sorted_frames)):
+            f_prev = sorted_frames[i - 1]
+            f_curr = sorted_frames[i]
+            if (f_prev in frames_info and f_curr in frames_info and
+                    tid in frames_info[f_prev] and tid in frames_info[f_curr]):
+                s = compute_speed(tid, f_prev, f_curr)
+                speeds.append(s)
+
+        slowdown_detected = False
+        for i in range(1, len(speeds)):
+            prev_s, curr_s = speeds[i - 1], speeds[i]
+            if prev_s > 0 and (prev_s - curr_s) / prev_s > threshold:
+                slowdown_detected = True
+                break
+        if slowdown_detected:
+            significant_reduction_count += 1
+
+    return significant_reduction_count
+
+
+def interaction_metric(tracks_dict, frames_info):
+    """Loop implementation the vectorized calculator replaced."""
+    salesman_id = -1
+    if salesman_id not in tracks_dict:
+        # No salesman present
+        return 0
+
+    def _normalize_box(box):
+        x1, x2, y1, y2 = box
+        left = min(x1, x2)
+        right = max(x1, x2)
+        top = min(y1, y2)
+        bottom = max(y1, y2)
+        return (left, right, top, bottom)
+
+    def _intersection_area(boxA, boxB):
+        Ax1, Ax2, Ay1, Ay2 = _normalize_box(boxA)
+        Bx1, Bx2, By1, By2 = _normalize_box(boxB)
+
+        inter_left = max(Ax1, Bx1)
+        inter_right = min(Ax2, Bx2)
+        inter_top = max(Ay1, By1)
+        inter_bottom = min(Ay2, By2)
+
+        if inter_right > inter_left and inter_bottom > inter_top:
+            return (inter_right - inter_left) * (inter_bottom - inter_top)
+        return 0
+
+    salesman_frames = tracks_dict[salesman_id]
+    interacting_tracks = set()
+
+    for frame_idx in salesman_frames:
+        if frame_idx not in frames_info:
+            continue
+        salesman_box = frames_info[frame_idx].get(salesman_id, None)
+        if salesman_box is None:
+            continue
+        # Check other TIDs in the same frame
+        for other_tid, other_box in frames_info[frame_idx].items():
+            if other_tid == salesman_id:
+                continue
+            if _intersection_area(salesman_box, other_box) > 0:
+                interacting_tracks.add(other_tid)
+
+    return len(interacting_tracks)
+
+
+def salesman_attendance(tracks_dict, frames_info):
+    """Loop implementation the vectorized calculator replaced."""
+    salesman_id = -1
+    # Gather all frame indices from the detection files (keys of frames_info)
+    all_frames = sorted(list(frames_info.keys()))
+    total_frames_count = len(all_frames)
+    if total_frames_count == 0:
+        return 0.0  # No frames to analyze
+
+    if salesman_id not in tracks_dict:
+        # No salesman at all
+        return 0.0
+
+    # Unique frames in which salesman appears
+    salesman_frames = set(tracks_dict[salesman_id])
+    # Intersection with all_frames just in case
+    # But presumably all frames in tracks_dict are in frames_info anyway
+    frames_with_salesman = salesman_frames.intersection(all_frames)
+    salesman_frames_count = len(frames_with_salesman)
+
+    # Return fraction of frames that include salesman
+    return salesman_frames_count / total_frames_count
+
+
+REFERENCE_METRICS = {
+    "area_metric": area_metric,
+    "speed_metric": speed_metric,
+    "interaction_metric": interaction_metric,
+    "salesman_attendance": salesman_attendance,
+}
+
+
+def synthetic_table(hours=8, fps=25, vid_stride=3, width=640, height=360, customers_per_hour=60, seed=0):
+    """
+    Track table resembling a day of one shop camera: a salesman present in most frames
+    and short customer tracks walking through the scene.
+    """
+    rng = np.random.default_rng(seed)
+    n_frames = int(hours * 3600 * fps / vid_stride)
+    chunks = []
+
+    # salesman, missing in ~10% of the frames
+    frames = np.flatnonzero(rng.random(n_frames) < 0.9) + 1
+    cx = width * 0.5 + np.cumsum(rng.normal(0, 1, len(frames))).clip(-150, 150)
+    cy = np.full(len(frames), height * 0.5)
+    chunks.append((frames, np.full(len(frames), -1), cx, cy, 60, 160))
+
+    # customers: random walks of 10-300 processed frames
+    n_customers = int(hours * customers_per_hour)
+    starts = rng.integers(1, n_frames, n_customers)
+    lengths = rng.integers(10, 300, n_customers)
+    for track_id, (start, length) in enumerate(zip(starts, lengths), start=1):
+        frames = np.arange(start, min(start + length, n_frames + 1))
+        speed = rng.uniform(0, 8, len(frames))
+        cx = rng.uniform(0, width) + np.cumsum(speed * rng.choice([-1, 1]))
+        cy = rng.uniform(0, height) + np.cumsum(rng.normal(0, 2, len(frames)))
+        chunks.append((frames, np.full(len(frames), track_id), cx, cy, rng.integers(30, 90), rng.integers(80, 220)))
+
+    rows = np.empty(sum(len(c[0]) for c in chunks), dtype=TRACK_DTYPE)
+    i = 0
+    for frames, ids, cx, cy, w, h in chunks:
+        j = i + len(frames)
+        rows['frame'][i:j] = frames
+        rows['track_id'][i:j] = ids
+        rows['cls'][i:j] = 0
+        rows['x1'][i:j] = cx - w / 2
+        rows['x2'][i:j] = cx + w / 2
+        rows['y1'][i:j] = cy - h / 2
+        rows['y2'][i:j] = cy + h / 2
+        i = j
+    return TrackTable(rows)
+
+
+def _best_time(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def benchmark(table, repeat=3):
+    """Times both implementations of every metric, returns {name: (loop_s, vectorized_s)}."""
+    print(f"{len(table)} boxes, {len(table.track_ids)} tracks, {len(table.frames)} frames")
+
+    views_time, (tracks_dict, frames_info) = _best_time(lambda: dict_views(table), repeat)
+    print(f"{'dict views':22s} {views_time:9.3f}s (needed by the loop versions only)")
+
+    timings = {}
+    for name, calculator in METRIC_CALCULATORS.items():
+        loop_time, expected = _best_time(lambda: REFERENCE_METRICS[name](tracks_dict, frames_info), repeat)
+        vec_time, result = _best_time(lambda: calculator(table).compute_metric(), repeat)
+        match = "ok" if np.isclose(expected, result) else f"MISMATCH {expected} != {result}"
+        print(f"{name:22s} loop {loop_time:9.3f}s  vectorized {vec_time:9.3f}s  x{loop_time / max(vec_time, 1e-9):7.1f}  {match}")
+        timings[name] = (loop_time, vec_time)
+    return timings
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--labels', type=str, default=None,
+                        help='folder with YOLO label files or the track log of one tracked video')
+    parser.add_argument('--width', type=int, default=640,
+                        help='width of the tracked frames')
+    parser.add_argument('--height', type=int, default=360,
+                        help='height of the tracked frames')
+    parser.add_argument('--synthetic', action='store_true',
+                        help='benchmark on a generated full-day track table')
+    parser.add_argument('--hours', type=float, default=8,
+                        help='length of the synthetic recording')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='timing repetitions, the best one is reported')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    opt = parse_opt()
+    if opt.labels is not None and is_track_log(opt.labels):
+        table = load_track_table(opt.labels)
+    elif opt.labels is not None:
+        table = TrackTable.from_folder(opt.labels, opt.width, opt.height)
+    else:
+        table = synthetic_table(hours=opt.hours, width=opt.width, height=opt.height)
+    benchmark(table, opt.repeat)
@@ -1,106 +1,20 @@
-import cv2
-import re
 import numpy as np
 from abc import ABC, abstractmethod
 
+from metrics_evaluation.track_table import TrackTable, get_video_dimensions
+from metrics_evaluation.track_log import is_track_log, load_track_table
+
 class MetricCalculator(ABC):
     """
     Abstract class to calculate metrics on objects tracked in video frames.
     Each subclass should implement the compute_metric method.
     """
 
-    def __init__(self, files, video_path, video_stride):
-        """
-        :param files: list of .txt file paths for each frame's YOLO detections
-        :param video_path: path to the source video
-        :param video_stride: frame stride (not always used, but left here for reference)
+    def __init__(self, table):
         """
-        self.video_stride = video_stride
-        self.files = files  # Expecting a list of strings (paths)
-        self.video_path = video_path
-
-        self.width, self.height = self._get_video_dimensions(video_path)
-        # Build dictionaries to track bounding boxes, frames, etc.
-        self.tracks_dict, self.frames_info, self.tracks_info = self._process_files(self.files)
-
-    @staticmethod
-    def _get_video_dimensions(video_path):
-        """Return (width, height) of the video."""
-        video = cv2.VideoCapture(video_path)
-        if not video.isOpened():
-            print(f"Error: Could not open video file {video_path}")
-            return None, None
-
-        width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        video.release()
-        return width, height
-
-    def _process_files(self, file_paths):
+        :param table: TrackTable with all tracked boxes of the video, shared between calculators
         """
-        Reads each YOLO .txt detection file; extracts bounding boxes,
-        organizes them by track ID, by frame, etc.
-        
-        Returns:
-            tracks_dict: {track_id: [list_of_frame_indices]}
-            frames_info: {frame_index: {track_id: (x1, x2, y1, y2)}}
-            tracks_info: {track_id: (class_id, 'salesman'/'other')}
-        """
-        tracks_dict = {}
-        frames_info = {}
-        tracks_info = {}
-
-        for file_path in file_paths:
-            # 1) Parse the frame index from file name, e.g. "video_123.txt" -> frame_index=123
-            match = re.search(r'_(\d+)\.txt$', file_path)
-            if not match:
-                print(f"Warning: Could not parse frame index from {file_path}")
-                continue
-
-            frame_index = int(match.group(1))
-
-            # 2) Read each detection line
-            with open(file_path, 'r') as f:
-                for line in f:
-                    parts = line.strip().split()
-                    if len(parts) < 6:
-                        # Expecting at least: class_id, x_center, y_center, w, h, track_id
-                        continue
-
-                    class_id = int(parts[0])
-                    x_center, y_center, w, h = map(float, parts[1:5])
-
-                    # Convert track_id to int (assuming -1 for salesman)
-                    try:
-                        track_id = int(parts[5])
-                    except ValueError:
-                        # If not parseable, store as string
-                        track_id = parts[5]
-
-                    # 3) Convert YOLO-normalized coords into pixel bounding box
-                    x1 = int((x_center - w * 0.5) * self.width)
-                    x2 = int((x_center + w * 0.5) * self.width)
-                    y1 = int((y_center - h * 0.5) * self.height)
-                    y2 = int((y_center + h * 0.5) * self.height)
-
-                    # Ensure track dict entry
-                    if track_id not in tracks_dict:
-                        tracks_dict[track_id] = []
-                    tracks_dict[track_id].append(frame_index)
-
-                    # Ensure frames_info entry
-                    if frame_index not in frames_info:
-                        frames_info[frame_index] = {}
-                    frames_info[frame_index][track_id] = (x1, x2, y1, y2)
-
-                    # Ensure tracks_info entry (class label, role, etc.)
-                    if track_id not in tracks_info:
-                        if track_id == -1:
-                            tracks_info[track_id] = (class_id, 'salesman')
-                        else:
-                            tracks_info[track_id] = (class_id, 'other')
-
-        return tracks_dict, frames_info, tracks_info
+        self.table = table
 
     @abstractmethod
     def compute_metric(self):
@@ -116,31 +30,21 @@ class AreaMetricCalculator(MetricCalculator):
     """
 
     def compute_metric(self):
-        # Helper to get area of track_id at a specific frame
-        def find_area(tid, fidx):
-            x1, x2, y1, y2 = self.frames_info[fidx][tid]
-            return abs(x2 - x1) * abs(y2 - y1)
+        table = self.table
 
         # 1) Salesman track is -1
-        if -1 not in self.tracks_dict or len(self.tracks_dict[-1]) == 0:
+        salesman = table.track(-1)
+        if len(salesman) == 0:
             # No salesman track found
             return 0
 
-        salesman_frames = self.tracks_dict[-1]
         # Average bounding-box area of the salesman across all frames he appears
-        salesman_areas = [find_area(-1, f) for f in salesman_frames]
-        salesman_area_mean = np.mean(salesman_areas) if salesman_areas else 0
+        salesman_area_mean = np.mean(_box_areas(salesman))
 
         # 2) Count how many other tracks have a max area > salesman's mean area
-        bigger_count = 0
-        for tid, frames in self.tracks_dict.items():
-            if tid == -1:
-                continue  # skip the salesman
-            track_areas = [find_area(tid, f) for f in frames if f in self.frames_info and tid in self.frames_info[f]]
-            if track_areas and max(track_areas) > salesman_area_mean:
-                bigger_count += 1
-
-        return bigger_count
+        max_areas = np.maximum.reduceat(_box_areas(table.columns(('x1', 'y1', 'x2', 'y2'))), table.track_starts)
+        others = table.track_ids != -1
+        return int(np.count_nonzero(max_areas[others] > salesman_area_mean))
 
 
 class SpeedReductionMetricCalculator(MetricCalculator):
@@ -152,45 +56,26 @@ class SpeedReductionMetricCalculator(MetricCalculator):
     """
 
     def compute_metric(self):
-        significant_reduction_count = 0
         threshold = 0.5  # 50% slowdown threshold
+        if len(self.table) < 3:
+            return 0
+        rows = self.table.columns(('track_id', 'x1', 'y1', 'x2', 'y2'))
+
+        # Rows are sorted by (track_id, frame), so consecutive rows of the same track are
+        # consecutive observations and np.diff gives the displacement between them
+        cx = (rows['x1'] + rows['x2']) / 2
+        cy = (rows['y1'] + rows['y2']) / 2
+        speeds = np.hypot(np.diff(cx), np.diff(cy))
+        same_track = np.diff(rows['track_id']) == 0
+
+        # speeds[i - 1] -> speeds[i] is a step of one track if both speeds are
+        prev_s, curr_s = speeds[:-1], speeds[1:]
+        valid = same_track[:-1] & same_track[1:] & (prev_s > 0)
+        slowdown = np.zeros_like(valid)
+        slowdown[valid] = (prev_s[valid] - curr_s[valid]) / prev_s[valid] > threshold
 
-        def compute_center(box):
-            x1, x2, y1, y2 = box
-            cx = (x1 + x2) / 2
-            cy = (y1 + y2) / 2
-            return (cx, cy)
-
-        def compute_speed(track_id, f1, f2):
-            box1 = self.frames_info[f1][track_id]
-            box2 = self.frames_info[f2][track_id]
-            cx1, cy1 = compute_center(box1)
-            cx2, cy2 = compute_center(box2)
-            return np.sqrt((cx2 - cx1)**2 + (cy2 - cy1)**2)
-
-        for tid, frames in self.tracks_dict.items():
-            # Sort frames so we measure speeds in chronological order
-            sorted_frames = sorted(frames)
-            speeds = []
-            # Compute speeds between consecutive frames
-            for i in range(1, len(sorted_frames)):
-                f_prev = sorted_frames[i - 1]
-                f_curr = sorted_frames[i]
-                if (f_prev in self.frames_info and f_curr in self.frames_info and
-                        tid in self.frames_info[f_prev] and tid in self.frames_info[f_curr]):
-                    s = compute_speed(tid, f_prev, f_curr)
-                    speeds.append(s)
-            
-            slowdown_detected = False
-            for i in range(1, len(speeds)):
-                prev_s, curr_s = speeds[i - 1], speeds[i]
-                if prev_s > 0 and (prev_s - curr_s) / prev_s > threshold:
-                    slowdown_detected = True
-                    break
-            if slowdown_detected:
-                significant_reduction_count += 1
-
-        return significant_reduction_count
+        # speeds[i] ends at row i + 1, so a slowdown at pair i belongs to the track of row i + 2
+        return len(np.unique(rows['track_id'][2:][slowdown]))
 
 
 class SalesmanInteractionMetricCalculator(MetricCalculator):
@@ -202,48 +87,30 @@ class SalesmanInteractionMetricCalculator(MetricCalculator):
 
     def compute_metric(self):
         salesman_id = -1
-        if salesman_id not in self.tracks_dict:
+        table = self.table
+        salesman = table.track(salesman_id)
+        if len(salesman) == 0:
             # No salesman present
             return 0
 
-        def _normalize_box(box):
-            x1, x2, y1, y2 = box
-            left = min(x1, x2)
-            right = max(x1, x2)
-            top = min(y1, y2)
-            bottom = max(y1, y2)
-            return (left, right, top, bottom)
-
-        def _intersection_area(boxA, boxB):
-            Ax1, Ax2, Ay1, Ay2 = _normalize_box(boxA)
-            Bx1, Bx2, By1, By2 = _normalize_box(boxB)
-
-            inter_left = max(Ax1, Bx1)
-            inter_right = min(Ax2, Bx2)
-            inter_top = max(Ay1, By1)
-            inter_bottom = min(Ay2, By2)
-
-            if inter_right > inter_left and inter_bottom > inter_top:
-                return (inter_right - inter_left) * (inter_bottom - inter_top)
+        others = table.columns(('frame', 'track_id', 'x1', 'y1', 'x2', 'y2'), table.track_id != salesman_id)
+        if len(others['frame']) == 0:
             return 0
 
-        salesman_frames = self.tracks_dict[salesman_id]
-        interacting_tracks = set()
+        # Salesman box co-occurring with every other box (the last one if a frame has several)
+        idx = np.searchsorted(salesman['frame'], others['frame'], side='right') - 1
+        co_occurring = idx >= 0
+        co_occurring[co_occurring] = salesman['frame'][idx[co_occurring]] == others['frame'][co_occurring]
+        others = {name: column[co_occurring] for name, column in others.items()}
+        salesman = salesman[idx[co_occurring]]
 
-        for frame_idx in salesman_frames:
-            if frame_idx not in self.frames_info:
-                continue
-            salesman_box = self.frames_info[frame_idx].get(salesman_id, None)
-            if salesman_box is None:
-                continue
-            # Check other TIDs in the same frame
-            for other_tid, other_box in self.frames_info[frame_idx].items():
-                if other_tid == salesman_id:
-                    continue
-                if _intersection_area(salesman_box, other_box) > 0:
-                    interacting_tracks.add(other_tid)
-
-        return len(interacting_tracks)
+        s_left, s_right, s_top, s_bottom = _normalized_boxes(salesman)
+        o_left, o_right, o_top, o_bottom = _normalized_boxes(others)
+        intersects = (
+            (np.minimum(s_right, o_right) > np.maximum(s_left, o_left)) &
+            (np.minimum(s_bottom, o_bottom) > np.maximum(s_top, o_top))
+        )
+        return len(np.unique(others['track_id'][intersects]))
 
 
 class SalesmanAttendanceMetricCalculator(MetricCalculator):
@@ -256,52 +123,69 @@ class SalesmanAttendanceMetricCalculator(MetricCalculator):
 
     def compute_metric(self):
         salesman_id = -1
-        # Gather all frame indices from the detection files (keys of frames_info)
-        all_frames = sorted(list(self.frames_info.keys()))
+        # All frame indices that have at least one box
+        all_frames = self.table.frames
         total_frames_count = len(all_frames)
         if total_frames_count == 0:
             return 0.0  # No frames to analyze
 
-        if salesman_id not in self.tracks_dict:
+        salesman_frames = self.table.track(salesman_id)['frame']
+        if len(salesman_frames) == 0:
             # No salesman at all
             return 0.0
 
-        # Unique frames in which salesman appears
-        salesman_frames = set(self.tracks_dict[salesman_id])
-        # Intersection with all_frames just in case
-        # But presumably all frames in tracks_dict are in frames_info anyway
-        frames_with_salesman = salesman_frames.intersection(all_frames)
-        salesman_frames_count = len(frames_with_salesman)
+        # Unique frames in which salesman appears (track rows are already in frame order)
+        salesman_frames = salesman_frames[np.r_[True, np.diff(salesman_frames) != 0]]
+        # Intersection with all_frames, both sorted so a binary search is enough
+        idx = np.searchsorted(all_frames, salesman_frames).clip(max=total_frames_count - 1)
+        frames_with_salesman = salesman_frames[all_frames[idx] == salesman_frames]
 
         # Return fraction of frames that include salesman
-        return salesman_frames_count / total_frames_count
+        return len(frames_with_salesman) / total_frames_count
+
+
+def _box_areas(rows):
+    # int64, pixel areas of a 4k frame overflow int32
+    return (np.abs(rows['x2'].astype(np.int64) - rows['x1']) *
+            np.abs(rows['y2'].astype(np.int64) - rows['y1']))
+
+
+def _normalized_boxes(rows):
+    """(left, right, top, bottom) arrays of the boxes, whatever the corner order."""
+    return (np.minimum(rows['x1'], rows['x2']), np.maximum(rows['x1'], rows['x2']),
+            np.minimum(rows['y1'], rows['y2']), np.maximum(rows['y1'], rows['y2']))
+
+
+# name in the results dict -> calculator, all computed from one shared TrackTable
+METRIC_CALCULATORS = {
+    "area_metric": AreaMetricCalculator,
+    "speed_metric": SpeedReductionMetricCalculator,
+    "interaction_metric": SalesmanInteractionMetricCalculator,
+    "salesman_attendance": SalesmanAttendanceMetricCalculator,
+}
 
 
-import os
-def calculate_all_metrics(detections_folder, video_path, video_stride):
+def calculate_all_metrics(detections_folder, video_path, video_stride, frame_size=None):
     """
     Convenience function that:
-      - Creates each metric calculator
-      - Computes the metric
+      - Parses the detection files once into a TrackTable (or memory-maps the track log)
+      - Computes every metric from that table
       - Returns a dictionary of results
-    :param detections_folder: path to the folder containing detection files (.txt)
+    :param detections_folder: path to the folder containing detection files (.txt), or to a
+        track log written by TrackLogWriter
     :param video_path: path to the corresponding video
     :param video_stride: the frame stride, if applicable
+    :param frame_size: (width, height) of the tracked frames, avoids opening video_path
     :return: dict with named metric results
     """
-    files = [os.path.join(detections_folder, f) for f in os.listdir(detections_folder) if f.endswith(".txt")]
-    area_calc = AreaMetricCalculator(files, video_path, video_stride)
-    speed_calc = SpeedReductionMetricCalculator(files, video_path, video_stride)
-    interaction_calc = SalesmanInteractionMetricCalculator(files, video_path, video_stride)
-    attendance_calc = SalesmanAttendanceMetricCalculator(files, video_path, video_stride)
-
-    results = {
-        "area_metric": area_calc.compute_metric(),
-        "speed_metric": speed_calc.compute_metric(),
-        "interaction_metric": interaction_calc.compute_metric(),
-        "salesman_attendance": attendance_calc.compute_metric()
-    }
-    return results
+    if is_track_log(detections_folder):
+        # already in pixels, the video is not needed
+        table = load_track_table(detections_folder)
+    else:
+        width, height = frame_size if frame_size is not None else get_video_dimensions(video_path)
+        table = TrackTable.from_folder(detections_folder, width, height)
+
+    return {name: calculator(table).compute_metric() for name, calculator in METRIC_CALCULATORS.items()}
 
 
 if __name__ == "__main__":
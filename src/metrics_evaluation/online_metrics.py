@@ -0,0 +1,168 @@
+import numpy as np
+
+
+class _TrackState:
+    """Running aggregates of one track."""
+
+    def __init__(self):
+        self.frames = []
+        self.times = []
+        self.centers = []
+        self.count = 0
+        self.area_sum = 0
+        self.max_area = 0
+        self.last_center = None
+        self.last_frame = None
+        self.last_time = None
+        self.last_speed = None
+        self.slowdown = False
+        # tracks whose box intersected this one in at least one frame
+        self.touched = set()
+
+
+class OnlineMetrics:
+    """
+    Streaming version of calculate_all_metrics, fed with the tracker output frame by frame.
+
+    The salesman is only known once the whole video is tracked, so everything is kept per
+    track and combined in result() for the salesman tracks:
+
+    - area: sum, count and maximum of the box areas
+    - speed: the slowdown flag, updated from the last center and speed of the track
+    - interaction: the set of tracks each track intersected with
+    - attendance: the frames of each track and the number of frames with any tracked box
+
+    Boxes are truncated to integer pixels, the same way the label files are read, so the
+    results match calculate_all_metrics on the labels of the same run.
+
+    With a variable stride (see StrideController) every frame also gets its time. Speeds
+    are then scaled to the same units as with a constant stride, and attendance is weighted
+    by the time every processed frame stands for.
+
+    :param slowdown_threshold: relative speed drop between two steps counted as a slowdown
+    """
+
+    def __init__(self, slowdown_threshold=0.5):
+        self.slowdown_threshold = slowdown_threshold
+        self.tracks = {}
+        # time represented by each processed frame with tracked boxes
+        self.frame_weights = {}
+        self.last_time = 0
+
+    def update(self, frame_index, boxes, time=None):
+        """
+        :param frame_index: 1-based index of the processed frame
+        :param boxes: array (N, 5) of x1, y1, x2, y2, track_id in pixels
+        :param time: position of the frame in the video, in processed frames at the nominal
+            stride. Defaults to frame_index, i.e. a constant stride. Must be passed for every
+            frame, also the ones without boxes, when given at all.
+        """
+        if time is None:
+            time, weight = frame_index, 1
+        else:
+            weight = time - self.last_time
+        self.last_time = time
+
+        boxes = np.trunc(np.asarray(boxes, dtype=np.float64).reshape(-1, 5)).astype(np.int64)
+        if len(boxes) == 0:
+            return
+        self.frame_weights[frame_index] = weight
+
+        left = np.minimum(boxes[:, 0], boxes[:, 2])
+        right = np.maximum(boxes[:, 0], boxes[:, 2])
+        top = np.minimum(boxes[:, 1], boxes[:, 3])
+        bottom = np.maximum(boxes[:, 1], boxes[:, 3])
+        areas = (right - left) * (bottom - top)
+        centers = np.column_stack([boxes[:, 0] + boxes[:, 2], boxes[:, 1] + boxes[:, 3]]) / 2
+
+        for (x1, y1, x2, y2, tid), area, center in zip(boxes.tolist(), areas.tolist(), centers.tolist()):
+            track = self.tracks.get(tid)
+            if track is None:
+                track = self.tracks[tid] = _TrackState()
+            track.frames.append(frame_index)
+            track.times.append(time)
+            track.centers.append(center)
+            track.count += 1
+            track.area_sum += area
+            track.max_area = max(track.max_area, area)
+
+            if track.last_center is not None:
+                speed = np.hypot(center[0] - track.last_center[0], center[1] - track.last_center[1])
+                # displacement per processed frame, as if the stride had been constant
+                if time != track.last_time:
+                    speed *= (frame_index - track.last_frame) / (time - track.last_time)
+                prev = track.last_speed
+                if prev is not None and prev > 0 and (prev - speed) / prev > self.slowdown_threshold:
+                    track.slowdown = True
+                track.last_speed = speed
+            track.last_center = center
+            track.last_frame = frame_index
+            track.last_time = time
+
+        if len(boxes) > 1:
+            # all pairwise intersections of this frame at once
+            intersects = (
+                (np.minimum.outer(right, right) > np.maximum.outer(left, left)) &
+                (np.minimum.outer(bottom, bottom) > np.maximum.outer(top, top))
+            )
+            np.fill_diagonal(intersects, False)
+            ids = boxes[:, 4].tolist()
+            for a, b in zip(*np.nonzero(intersects)):
+                self.tracks[ids[a]].touched.add(ids[b])
+
+    def track_frames(self):
+        """{track_id: [frame indices]}, the input of select_main_character_tracks."""
+        return {tid: track.frames for tid, track in self.tracks.items()}
+
+    def result(self, salesman_ids=()):
+        """
+        Final metric values, the tracks in salesman_ids together form the salesman.
+
+        :return: dict with the same keys as calculate_all_metrics
+        """
+        salesman = [self.tracks[tid] for tid in salesman_ids if tid in self.tracks]
+        salesman_ids = set(tid for tid in salesman_ids if tid in self.tracks)
+        others = [track for tid, track in self.tracks.items() if tid not in salesman_ids]
+
+        return {
+            "area_metric": self._area_metric(salesman, others),
+            "speed_metric": self._speed_metric(salesman, others),
+            "interaction_metric": self._interaction_metric(salesman, salesman_ids),
+            "salesman_attendance": self._salesman_attendance(salesman),
+        }
+
+    def _area_metric(self, salesman, others):
+        if not salesman:
+            return 0
+        salesman_area_mean = sum(t.area_sum for t in salesman) / sum(t.count for t in salesman)
+        return sum(1 for t in others if t.max_area > salesman_area_mean)
+
+    def _speed_metric(self, salesman, others):
+        count = sum(1 for t in others if t.slowdown)
+        if not salesman:
+            return count
+
+        # the salesman tracks become one track, whose steps also cross from one to the next
+        frames = np.concatenate([t.frames for t in salesman])
+        order = np.argsort(frames, kind='stable')
+        times = np.concatenate([t.times for t in salesman])[order]
+        centers = np.concatenate([t.centers for t in salesman]).reshape(-1, 2)[order]
+        speeds = np.hypot(*np.diff(centers, axis=0).T) * np.diff(frames[order]) / np.diff(times)
+        prev_s, curr_s = speeds[:-1], speeds[1:]
+        valid = prev_s > 0
+        if np.any((prev_s[valid] - curr_s[valid]) / prev_s[valid] > self.slowdown_threshold):
+            count += 1
+        return count
+
+    def _interaction_metric(self, salesman, salesman_ids):
+        touched = set()
+        for t in salesman:
+            touched |= t.touched
+        return len(touched - salesman_ids)
+
+    def _salesman_attendance(self, salesman):
+        total = sum(self.frame_weights.values())
+        if total == 0 or not salesman:
+            return 0.0
+        frames_with_salesman = set().union(*(t.frames for t in salesman))
+        return sum(self.frame_weights[f] for f in frames_with_salesman) / total
@@ -0,0 +1,193 @@
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+
+import numpy as np
+
+from metrics_evaluation.utils import select_main_character_tracks
+
+EMBEDDINGS_FILE = 'embeddings.npy'
+STATE_FILE = 'state.json'
+LOCK_FILE = '.lock'
+
+
+def _normalize(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    embeddings = embeddings.reshape(len(embeddings), -1)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+class SalesmanGallery:
+    """
+    Per-shop gallery of ReID embeddings of the salesman, kept on disk as a memory-mapped
+    (capacity, dim) float32 matrix of L2-normalized rows.
+
+    New embeddings overwrite the oldest ones (ring buffer), so the gallery follows the
+    staff of the shop as it changes. Unused rows are zero and never match anything.
+    Embeddings of another size (a different ReID model) match nothing, and the first ones
+    added replace the whole gallery. Several tracking processes may work on videos of the
+    same shop, so writes are done under a file lock.
+
+    :param folder: gallery folder of one shop, created if needed
+    :param capacity: maximum number of embeddings kept
+    :param threshold: cosine similarity from which a track is taken as the salesman
+    """
+
+    def __init__(self, folder, capacity=1024, threshold=0.7):
+        self.folder = str(folder)
+        self.capacity = capacity
+        self.threshold = threshold
+        os.makedirs(self.folder, exist_ok=True)
+        self.embeddings = self._load()
+
+    @property
+    def path(self):
+        return os.path.join(self.folder, EMBEDDINGS_FILE)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return None
+        return np.load(self.path, mmap_mode='r')
+
+    @property
+    def ready(self):
+        """Whether there is anything to match against."""
+        return self.embeddings is not None
+
+    def similarity(self, embeddings):
+        """Highest cosine similarity of every embedding to the gallery, a single matrix product."""
+        embeddings = _normalize(embeddings)
+        if not self.ready or len(embeddings) == 0 or embeddings.shape[1] != self.embeddings.shape[1]:
+            return np.zeros(len(embeddings), dtype=np.float32)
+        return (embeddings @ self.embeddings.T).max(axis=1)
+
+    def match(self, embeddings):
+        """Boolean mask of the embeddings that belong to the salesman."""
+        return self.similarity(embeddings) >= self.threshold
+
+    @contextmanager
+    def _locked(self):
+        with open(os.path.join(self.folder, LOCK_FILE), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def add(self, embeddings):
+        """Appends embeddings, overwriting the oldest ones once the gallery is full."""
+        embeddings = _normalize(embeddings)[-self.capacity:]
+        if len(embeddings) == 0:
+            return
+
+        with self._locked():
+            state_path = os.path.join(self.folder, STATE_FILE)
+            path = self.path
+            gallery = np.load(path, mmap_mode='r+') if os.path.exists(path) else None
+            if gallery is not None and gallery.shape[1] != embeddings.shape[1]:
+                print(f"ReID embeddings of size {embeddings.shape[1]} instead of {gallery.shape[1]}, "
+                      f"the salesman gallery {self.folder} is rebuilt")
+                gallery = None
+                # written aside and swapped in, other processes may have the old one mapped
+                path = self.path + '.new'
+
+            if gallery is not None:
+                with open(state_path, 'r', encoding='utf-8') as f:
+                    count = json.load(f)['count']
+            else:
+                gallery = np.lib.format.open_memmap(
+                    path, mode='w+', dtype=np.float32, shape=(self.capacity, embeddings.shape[1])
+                )
+                count = 0
+
+            rows = (count + np.arange(len(embeddings))) % len(gallery)
+            gallery[rows] = embeddings
+            gallery.flush()
+            del gallery
+            if path != self.path:
+                os.replace(path, self.path)
+
+            with open(state_path, 'w', encoding='utf-8') as f:
+                json.dump({'count': count + len(embeddings)}, f)
+
+        self.embeddings = self._load()
+
+
+class SalesmanIdentifier:
+    """
+    Resolves the salesman online while tracking: the embedding the tracker keeps for every
+    new track, computed by its ReID model while associating, is compared with the shop
+    gallery, one matrix product per frame with new tracks. No crop is embedded again.
+
+    The matches are only trusted when they do not share a frame. Otherwise, or when
+    nothing matched (empty gallery, another salesman on shift, new clothes, a new ReID
+    model), the salesman is picked by select_main_character_tracks. The first embedding of
+    every track is kept, so that the gallery learns the tracks finally taken as the
+    salesman (commit()), and follows the staff of the shop.
+
+    :param gallery: SalesmanGallery of the shop
+    :param tracker: tracker with a ReID model, get_track_embs() gives the embeddings of
+        its tracks keyed by track id
+    :param min_share: only the salesman tracks at least min_share as long as the longest
+        one are added to the gallery, the short ones of a fallback selection are often
+        customers
+    """
+
+    def __init__(self, gallery, tracker, min_share=0.5):
+        self.gallery = gallery
+        self.tracker = tracker
+        self.min_share = min_share
+        self.embeddings = {}
+        self.matched = set()
+
+    def update(self, boxes):
+        """
+        :param boxes: array (N, 5) of x1, y1, x2, y2, track_id in pixels, as output by the
+            tracker on the current frame
+        """
+        boxes = np.asarray(boxes).reshape(-1, 5)
+        new_ids = [tid for tid in boxes[:, 4].astype(int).tolist() if tid not in self.embeddings]
+        if not new_ids:
+            return
+
+        track_embs = self.tracker.get_track_embs() or {}
+        # a track without an embedding yet is tried again on the next frame
+        new_ids = [tid for tid in new_ids if tid in track_embs]
+        if not new_ids:
+            return
+
+        embeddings = _normalize([track_embs[tid] for tid in new_ids])
+        for tid, embedding, is_salesman in zip(new_ids, embeddings, self.gallery.match(embeddings)):
+            self.embeddings[tid] = embedding
+            if is_salesman:
+                self.matched.add(tid)
+
+    def salesman_ids(self, track_frames):
+        """
+        Track ids of the salesman, sorted: the tracks matched against the gallery if they
+        do not share a frame, select_main_character_tracks(track_frames) otherwise.
+
+        :param track_frames: {track_id: frame indices} of all tracks of the video
+        """
+        matched = {tid: track_frames[tid] for tid in self.matched if tid in track_frames}
+        if matched and len(select_main_character_tracks(matched)) == len(matched):
+            return sorted(matched)
+        return select_main_character_tracks(track_frames)
+
+    def commit(self, salesman_ids, track_frames):
+        """
+        Adds the embeddings of the long salesman tracks to the gallery, see min_share.
+
+        :param salesman_ids: track ids finally taken as the salesman
+        :param track_frames: {track_id: frame indices} of all tracks of the video
+        """
+        lengths = {tid: len(track_frames.get(tid, ())) for tid in salesman_ids}
+        longest = max(lengths.values(), default=0)
+        embeddings = [
+            self.embeddings[tid] for tid in salesman_ids
+            if tid in self.embeddings and lengths[tid] >= self.min_share * longest
+        ]
+        if embeddings:
+            self.gallery.add(np.stack(embeddings))
@@ -0,0 +1,103 @@
+import glob
+import os
+
+import numpy as np
+
+from metrics_evaluation.track_table import TRACK_DTYPE, TrackTable
+
+CHUNK_PATTERN = 'tracks_{:05d}.npy'
+SALESMAN_FILE = 'salesman_ids.npy'
+
+
+class TrackLogWriter:
+    """
+    Append-only columnar log of the tracked boxes of one video, written by the tracking
+    loop instead of one YOLO label file per frame.
+
+    Rows (TRACK_DTYPE, pixel coordinates) are buffered and written as .npy chunks of
+    chunk_rows rows, so the reader can memory-map them. A day of one camera fits into a
+    single chunk with the default size; smaller chunks bound the memory of the buffer and
+    what is lost if tracking crashes.
+
+    :param folder: folder of the log, created if needed
+    :param chunk_rows: rows per .npy chunk
+    """
+
+    def __init__(self, folder, chunk_rows=1 << 20):
+        self.folder = str(folder)
+        self.chunk_rows = chunk_rows
+        self.buffer = np.empty(chunk_rows, dtype=TRACK_DTYPE)
+        self.size = 0
+        self.chunks = 0
+        os.makedirs(self.folder, exist_ok=True)
+
+    def append(self, frame_index, boxes, classes=None):
+        """
+        :param frame_index: 1-based index of the processed frame
+        :param boxes: array (N, 5) of x1, y1, x2, y2, track_id in pixels
+        :param classes: array (N,) of class ids, 0 if not given
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 5)
+        start = 0
+        while start < len(boxes):
+            n = min(len(boxes) - start, self.chunk_rows - self.size)
+            part = boxes[start:start + n]
+            rows = self.buffer[self.size:self.size + n]
+            rows['frame'] = frame_index
+            rows['track_id'] = part[:, 4]
+            rows['cls'] = 0 if classes is None else np.asarray(classes)[start:start + n]
+            # truncated like the coordinates read from the label files
+            rows['x1'] = np.trunc(part[:, 0])
+            rows['y1'] = np.trunc(part[:, 1])
+            rows['x2'] = np.trunc(part[:, 2])
+            rows['y2'] = np.trunc(part[:, 3])
+            self.size += n
+            start += n
+            if self.size == self.chunk_rows:
+                self.flush()
+
+    def flush(self):
+        # an empty log still gets its first chunk, so that it can be told from a missing one
+        if self.size == 0 and self.chunks > 0:
+            return
+        np.save(os.path.join(self.folder, CHUNK_PATTERN.format(self.chunks)), self.buffer[:self.size])
+        self.chunks += 1
+        self.size = 0
+
+    def close(self):
+        self.flush()
+
+
+def is_track_log(folder):
+    return os.path.exists(os.path.join(folder, CHUNK_PATTERN.format(0)))
+
+
+def write_salesman_ids(folder, salesman_ids):
+    """Stores the salesman tracks next to the log, the rows themselves are never rewritten."""
+    np.save(os.path.join(folder, SALESMAN_FILE), np.asarray(sorted(salesman_ids), dtype=np.int32))
+
+
+def read_track_log(folder, mmap_mode='r'):
+    """
+    Memory-maps the chunks of a track log.
+
+    :return: (chunks, salesman_ids). chunks is the list of memory-mapped chunks, in writing
+        order; salesman_ids is None if they were not stored.
+    """
+    paths = sorted(glob.glob(os.path.join(folder, 'tracks_*.npy')))
+    chunks = [np.load(path, mmap_mode=mmap_mode) for path in paths]
+    if not chunks:
+        chunks = [np.empty(0, dtype=TRACK_DTYPE)]
+
+    salesman_path = os.path.join(folder, SALESMAN_FILE)
+    salesman_ids = np.load(salesman_path).tolist() if os.path.exists(salesman_path) else None
+    return chunks, salesman_ids
+
+
+def load_track_table(folder, salesman_ids=None):
+    """
+    TrackTable of a track log, over its memory-mapped chunks. Unless given, the salesman
+    tracks stored next to the log are merged into track -1.
+    """
+    chunks, stored_salesman_ids = read_track_log(folder)
+    return TrackTable(chunks, stored_salesman_ids if salesman_ids is None else salesman_ids)
@@ -0,0 +1,178 @@
+import os
+
+import cv2
+import numpy as np
+
+# one row per tracked box, pixel coordinates
+TRACK_DTYPE = np.dtype([
+    ('frame', np.int32),
+    ('track_id', np.int32),
+    ('cls', np.int16),
+    ('x1', np.int32),
+    ('y1', np.int32),
+    ('x2', np.int32),
+    ('y2', np.int32),
+])
+
+
+def get_video_dimensions(video_path):
+    """Return (width, height) of the video."""
+    video = cv2.VideoCapture(video_path)
+    if not video.isOpened():
+        print(f"Error: Could not open video file {video_path}")
+        return None, None
+
+    width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    video.release()
+    return width, height
+
+
+def _frame_index(file_path):
+    # "<video>_<frame_index>.txt" -> frame_index
+    stem = os.path.basename(file_path)[:-4]
+    index = stem.rsplit('_', 1)[-1]
+    return int(index) if index.isdigit() else None
+
+
+class TrackTable:
+    """
+    Columnar table of all tracked boxes of one video.
+
+    The rows are kept as given, e.g. the memory-mapped chunks of a track log, and only index
+    arrays are built over them. In table order, rows are sorted by (track_id, frame):
+
+    - order: positions of the table rows in the concatenated chunks, column(name) gathers a
+      column in table order
+    - track_ids, track_starts, track_counts: rows track_starts[i]:track_starts[i] + track_counts[i]
+      of the table are the boxes of track_ids[i], in frame order
+    - frame_order, frames, frame_starts, frame_counts: table rows frame_order[frame_starts[j]:...]
+      are the boxes of frames[j]
+
+    :param rows: array of TRACK_DTYPE, or list of such arrays (the chunks of a track log),
+        left untouched (they may be read-only memmaps)
+    :param salesman_ids: tracks merged into the salesman track -1
+    """
+
+    def __init__(self, rows, salesman_ids=None):
+        chunks = rows if isinstance(rows, (list, tuple)) else [rows]
+        self.chunks = [np.asarray(chunk, dtype=TRACK_DTYPE) for chunk in chunks]
+        self.offsets = np.cumsum([0] + [len(chunk) for chunk in self.chunks])
+
+        track_id = self._concatenated('track_id')
+        if salesman_ids:
+            track_id = np.where(np.isin(track_id, list(salesman_ids)), -1, track_id)
+        self.order = np.lexsort((self._concatenated('frame'), track_id))
+        # the only column kept, the salesman tracks are merged in it
+        self.track_id = track_id[self.order]
+
+        self.track_ids, self.track_starts, self.track_counts = np.unique(
+            self.track_id, return_index=True, return_counts=True
+        )
+
+        frame = self.column('frame')
+        self.frame_order = np.argsort(frame, kind='stable')
+        self.frames, self.frame_starts, self.frame_counts = np.unique(
+            frame[self.frame_order], return_index=True, return_counts=True
+        )
+
+    def _concatenated(self, name):
+        # a view into the rows for a single chunk, a temporary copy of the column otherwise
+        if len(self.chunks) == 1:
+            return self.chunks[0][name]
+        return np.concatenate([chunk[name] for chunk in self.chunks])
+
+    def _gather(self, positions, name):
+        """Column name of the rows at positions of the concatenated chunks."""
+        if len(self.chunks) == 1:
+            return self.chunks[0][name][positions]
+        out = np.empty(len(positions), dtype=TRACK_DTYPE[name])
+        chunk = np.searchsorted(self.offsets, positions, side='right') - 1
+        for i, rows in enumerate(self.chunks):
+            selected = chunk == i
+            out[selected] = rows[name][positions[selected] - self.offsets[i]]
+        return out
+
+    def __len__(self):
+        return len(self.order)
+
+    def column(self, name, rows=None):
+        """
+        A column of TRACK_DTYPE in table order, with the salesman tracks merged into -1.
+
+        :param rows: index or mask of the table rows to take, all of them if not given
+        """
+        if name == 'track_id':
+            return self.track_id if rows is None else self.track_id[rows]
+        return self._gather(self.order if rows is None else self.order[rows], name)
+
+    def columns(self, names, rows=None):
+        """{name: column(name, rows)} of several columns."""
+        return {name: self.column(name, rows) for name in names}
+
+    def track(self, track_id):
+        """Rows (TRACK_DTYPE) of a single track in frame order (empty if the track does not exist)."""
+        i = np.searchsorted(self.track_ids, track_id)
+        if i == len(self.track_ids) or self.track_ids[i] != track_id:
+            return np.empty(0, dtype=TRACK_DTYPE)
+        start = self.track_starts[i]
+        index = slice(start, start + self.track_counts[i])
+        rows = np.empty(self.track_counts[i], dtype=TRACK_DTYPE)
+        for name in TRACK_DTYPE.names:
+            rows[name] = self.column(name, index)
+        return rows
+
+    def track_frames(self):
+        """{track_id: array of frame indices}, the input of select_main_character_tracks."""
+        frames = self.column('frame')
+        # in order of appearance, like when the tracks are collected frame by frame
+        order = np.argsort(frames[self.track_starts], kind='stable')
+        return {
+            tid: frames[start:start + count]
+            for tid, start, count in zip(self.track_ids[order].tolist(), self.track_starts[order], self.track_counts[order])
+        }
+
+    @classmethod
+    def from_files(cls, file_paths, width, height):
+        """
+        Parses YOLO label files (class, x_center, y_center, w, h, track_id, normalized
+        coordinates) in a single pass. Lines without a track id are skipped.
+        """
+        frames = []
+        values = []
+        for file_path in file_paths:
+            frame_index = _frame_index(file_path)
+            if frame_index is None:
+                print(f"Warning: Could not parse frame index from {file_path}")
+                continue
+
+            with open(file_path, 'r') as f:
+                for line in f.read().splitlines():
+                    parts = line.split()
+                    if len(parts) < 6:
+                        # Expecting at least: class_id, x_center, y_center, w, h, track_id
+                        continue
+                    frames.append(frame_index)
+                    values.append(parts[:6])
+
+        rows = np.empty(len(values), dtype=TRACK_DTYPE)
+        if not values:
+            return cls(rows)
+
+        values = np.array(values, dtype=np.float64)
+        x_center, y_center, w, h = values[:, 1], values[:, 2], values[:, 3], values[:, 4]
+
+        rows['frame'] = frames
+        rows['track_id'] = values[:, 5]
+        rows['cls'] = values[:, 0]
+        # YOLO-normalized coords into pixels, truncated like int() does
+        rows['x1'] = np.trunc((x_center - w * 0.5) * width)
+        rows['x2'] = np.trunc((x_center + w * 0.5) * width)
+        rows['y1'] = np.trunc((y_center - h * 0.5) * height)
+        rows['y2'] = np.trunc((y_center + h * 0.5) * height)
+        return cls(rows)
+
+    @classmethod
+    def from_folder(cls, folder_path, width, height):
+        files = [os.path.join(folder_path, f) for f in os.listdir(folder_path) if f.endswith('.txt')]
+        return cls.from_files(files, width, height)
@@ -1,9 +1,19 @@
+import bisect
 import cv2
+import itertools
 import os
+import numpy as np
 import matplotlib.pyplot as plt
 import re
 
+from utility.frame_source import StridedFrameSource
+
 def find_main_character_tracks(folder_path, in_place=True):
+    """
+    Picks the salesman tracks from the label files of a tracked video, see
+    select_main_character_tracks. With in_place the label files are rewritten with the
+    salesman tracks relabeled to -1, otherwise only the chosen track ids are returned.
+    """
     # List all .txt files in the folder, assuming filenames are in the format <filename>_<frame_index>.txt
     files = [os.path.join(folder_path, f) for f in os.listdir(folder_path) if f.endswith('.txt')]
     # Sort files by their frame index to ensure chronological order
@@ -25,52 +35,165 @@ def find_main_character_tracks(folder_path, in_place=True):
                     track_frames[index] = []
                 track_frames[index].append(frame_index)
 
-    # Sort tracks by their length (number of frames) in descending order
-    sorted_tracks = sorted(track_frames.items(), key=lambda x: len(x[1]), reverse=True)
-    # Concatenate tracks to cover the whole video length without frame overlap
+    main_character_tracks = select_main_character_tracks(track_frames)
+    if in_place:
+        relabel_salesman_tracks(folder_path, main_character_tracks)
+
+    return main_character_tracks
+
+def relabel_salesman_tracks(folder_path, salesman_ids):
+    """Rewrites the label files with the salesman tracks relabeled to -1."""
+    salesman_ids = set(salesman_ids)
+    files = [os.path.join(folder_path, f) for f in os.listdir(folder_path) if f.endswith('.txt')]
+    for file_path in files:
+        with open(file_path, 'r+') as file:
+            lines = []
+            for line in file:
+                parts = line.split()
+                if len(parts) < 6:
+                    continue
+                index = int(parts[5])
+                if index in salesman_ids:
+                    parts[5] = '-1'
+                lines.append(' '.join(parts) + '\n')
+        with open(file_path, 'w') as file:
+            for line in lines:
+                file.write(line)
+
+def select_main_character_tracks(track_frames):
+    """
+    Picks the tracks that make up the salesman from {track_id: frame indices}, the
+    longest tracks first as long as they do not share a frame with the ones already picked.
+
+    Works in memory and never touches the label files. The [start, end] span of every
+    candidate is looked up in the sorted, merged spans of the picked tracks, and only if
+    they overlap are its frames checked against a coverage bitmap of the used frames.
+    """
+    track_ids = list(track_frames)
+    counts = np.array([len(frames) for frames in track_frames.values()], dtype=np.int64)
+    if not counts.sum():
+        # nothing to overlap, every track is picked
+        return sorted(track_ids)
+
+    # All frames in one array, track i is frames[offsets[i]:offsets[i + 1]]
+    values = list(track_frames.values())
+    if all(isinstance(v, np.ndarray) for v in values):
+        # TrackTable.track_frames() slices
+        frames = np.concatenate(values).astype(np.int64, copy=False)
+    else:
+        frames = np.fromiter(itertools.chain.from_iterable(values), dtype=np.int64, count=counts.sum())
+    offsets = np.concatenate([[0], np.cumsum(counts)]).tolist()
+    # [start, end] span of every track, empty tracks get an empty span
+    present = counts > 0
+    starts = np.zeros(len(counts), dtype=np.int64)
+    ends = np.full(len(counts), -1, dtype=np.int64)
+    starts[present] = np.minimum.reduceat(frames, np.asarray(offsets[:-1])[present])
+    ends[present] = np.maximum.reduceat(frames, np.asarray(offsets[:-1])[present])
+    starts = starts.tolist()
+    ends = ends.tolist()
+
+    # Coverage bitmap over frame indices, True for frames used by a picked track
+    used = np.zeros(max(ends) + 1, dtype=bool)
+    # Merged spans of the picked tracks, sorted and disjoint
+    span_starts = []
+    span_ends = []
     main_character_tracks = []
-    used_frames = set()  # Set to keep track of used frame indices
 
-    for index, frames in sorted_tracks:
-        # Filter out track segments whose frames have already been used
-        new_segments = len(set(frames) & used_frames) == 0
-        if new_segments:
-            main_character_tracks.append(index)
-            used_frames.update(frames)
+    # Longest tracks first, ties in the order the tracks appeared
+    for i in np.argsort(-counts, kind='stable').tolist():
+        start, end = starts[i], ends[i]
+        # Spans j..k-1 overlap [start, end]
+        j = bisect.bisect_left(span_ends, start)
+        k = bisect.bisect_right(span_starts, end)
+        track = frames[offsets[i]:offsets[i + 1]]
+        if j < k and used[track].any():
+            # Shares a frame with an already picked track
+            continue
+
+        main_character_tracks.append(track_ids[i])
+        used[track] = True
+        if j < k:
+            start = min(start, span_starts[j])
+            end = max(end, span_ends[k - 1])
+        span_starts[j:k] = [start]
+        span_ends[j:k] = [end]
 
     # Sort the final track by frame index to maintain chronological order
     main_character_tracks.sort()
-    if in_place:
-        for file_path in files:
-            with open(file_path, 'r+') as file:
-                lines = []
-                for line in file:
-                    parts = line.split()
-                    if len(parts) < 6:
-                        continue
-                    index = int(parts[5])
-                    if index in main_character_tracks:
-                        parts[5] = '-1'
-                    lines.append(' '.join(parts) + '\n')
-            with open(file_path, 'w') as file:
-                for line in lines:
-                    file.write(line)
-
     return main_character_tracks
 
-def process_video_and_plot_boxes(video_path, video_stride, tracking_folder, output_path):
-    # Create a dictionary to map indices to colors
-    color_map = {}
+def draw_salesman_boxes(frame, boxes, salesman_ids=()):
+    """
+    Draws tracked boxes on frame in place, salesman tracks in red, customers in green.
+
+    :param boxes: iterable of (x1, y1, x2, y2, track_id) in pixels
+    :param salesman_ids: track ids that belong to the salesman; id -1 is always the salesman
+    """
+    for x1, y1, x2, y2, index in boxes:
+        x1, y1, x2, y2, index = int(x1), int(y1), int(x2), int(y2), int(index)
+        is_salesman = index == -1 or index in salesman_ids
+        color = (0, 0, 255) if is_salesman else (0, 255, 0)
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+        cv2.putText(frame, 'Salesman' if is_salesman else f'customer {index}', (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+    return frame
+
+
+class SalesmanClipSink:
+    """
+    Collects short sampled clips while the tracker runs, so the salesman overlay can be
+    rendered without decoding the video a second time.
+
+    The salesman is only known once the whole video is tracked, so clip frames are kept
+    JPEG-encoded in memory together with their boxes and drawn and written on close().
+
+    :param output_path: path of the mp4 with all clips one after another
+    :param fps: frame rate of the written video
+    :param clip_length: number of processed frames per clip
+    :param clip_every: a clip starts every clip_every processed frames
+    :param max_clips: stop collecting after this many clips, bounds the memory use
+    """
+
+    def __init__(self, output_path, fps, clip_length=100, clip_every=3000, max_clips=10):
+        self.output_path = str(output_path)
+        self.fps = fps
+        self.clip_length = clip_length
+        self.clip_every = clip_every
+        self.max_clips = max_clips
+        self.frames = []
+
+    def wants(self, frame_index):
+        """Whether the 1-based processed frame frame_index falls into a sampled clip."""
+        i = frame_index - 1
+        return i // self.clip_every < self.max_clips and i % self.clip_every < self.clip_length
+
+    def add(self, frame_index, frame, boxes):
+        if not self.wants(frame_index):
+            return
+        ok, jpg = cv2.imencode('.jpg', frame)
+        if ok:
+            self.frames.append((jpg, np.asarray(boxes).reshape(-1, 5)))
+
+    def close(self, salesman_ids=()):
+        if not self.frames:
+            return
+        salesman_ids = set(salesman_ids)
+        h, w = cv2.imdecode(self.frames[0][0], cv2.IMREAD_COLOR).shape[:2]
+        out = cv2.VideoWriter(self.output_path, cv2.VideoWriter_fourcc(*'mp4v'), self.fps, (w, h))
+        for jpg, boxes in self.frames:
+            frame = cv2.imdecode(jpg, cv2.IMREAD_COLOR)
+            out.write(draw_salesman_boxes(frame, boxes, salesman_ids))
+        out.release()
+        self.frames = []
 
-    # Open the video file
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        raise IOError("Cannot open video file")
+
+def process_video_and_plot_boxes(video_path, video_stride, tracking_folder, output_path):
+    # Open the video, only every video_stride-th frame is retrieved
+    source = StridedFrameSource(video_path, video_stride)
 
     # Get video properties
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
+    width = source.width
+    height = source.height
+    fps = int(source.fps)
 
     # Define the codec and create a VideoWriter object to write the video
     fourcc = cv2.VideoWriter_fourcc(*'mp4v')
@@ -78,36 +201,29 @@ def process_video_and_plot_boxes(video_path, video_stride, tracking_folder, outp
 
     video_name = video_path.split('/')[-1][:-4]
 
-    frame_count = 1
-    curr_frame = 0
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        if curr_frame % video_stride == 0:
-            # Construct the filename for the tracking results
-            tracking_file = os.path.join(tracking_folder, f"{video_name}_{frame_count}.txt")
-            if os.path.exists(tracking_file):
-                with open(tracking_file, 'r') as file:
-                    for line in file:
-                        parts = line.strip().split()
-                        class_id, x_center, y_center, w, h, index = list(map(float, parts[:5])) + [int(parts[5])]
-
-                        # Scale coordinates
-                        x1 = int((x_center - w * 0.5) * width)
-                        x2 = int((x_center + w * 0.5) * width)
-                        y1 = int((y_center + h * 0.5) * height)
-                        y2 = int((y_center - h * 0.5) * height)
-
-                        # Draw the rectangle on the frame
-                        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255) if index  == -1 else (0, 255, 0), 2)
-                        cv2.putText(frame, 'Salesman' if index == -1 else f'customer {index}', (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255) if index  == -1 else (0, 255, 0), 2)
-            frame_count += 1
-            # Write the frame into the file 'output_video.mp4'
-            out.write(frame)
-        curr_frame += 1
+    for frame_count, frame in source:
+        # Construct the filename for the tracking results
+        tracking_file = os.path.join(tracking_folder, f"{video_name}_{frame_count}.txt")
+        if os.path.exists(tracking_file):
+            boxes = []
+            with open(tracking_file, 'r') as file:
+                for line in file:
+                    parts = line.strip().split()
+                    class_id, x_center, y_center, w, h, index = list(map(float, parts[:5])) + [int(parts[5])]
+
+                    # Scale coordinates
+                    x1 = int((x_center - w * 0.5) * width)
+                    x2 = int((x_center + w * 0.5) * width)
+                    y1 = int((y_center + h * 0.5) * height)
+                    y2 = int((y_center - h * 0.5) * height)
+                    boxes.append((x1, y1, x2, y2, index))
+
+            # Draw the rectangles on the frame
+            draw_salesman_boxes(frame, boxes)
+        # Write the frame into the file 'output_video.mp4'
+        out.write(frame)
 
     # Release everything if job is finished
-    cap.release()
+    source.release()
     out.release()
     cv2.destroyAllWindows()
\ No newline at end of file
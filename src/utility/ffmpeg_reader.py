@@ -0,0 +1,128 @@
+import json
+import subprocess
+
+import cv2
+import numpy as np
+
+
+def probe_video(input_path: str):
+    """
+    Reads the video stream properties with ffprobe.
+
+    :return: dict with width, height, fps and frames (0 if the container does not store it)
+    """
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=width,height,avg_frame_rate,nb_frames",
+        "-of", "json",
+        input_path
+    ]
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    stream = json.loads(out)["streams"][0]
+
+    num, den = stream.get("avg_frame_rate", "0/1").split("/")
+    fps = float(num) / float(den) if float(den) else 0.0
+    nb_frames = stream.get("nb_frames", "0")
+    return {
+        "width": int(stream["width"]),
+        "height": int(stream["height"]),
+        "fps": fps,
+        "frames": int(nb_frames) if nb_frames.isdigit() else 0,
+    }
+
+
+class FFmpegCapture:
+    """
+    Minimal cv2.VideoCapture replacement that lets ffmpeg scale the video and drop the
+    frames skipped by vid_stride, and reads the remaining frames as raw BGR from a pipe.
+
+    Frames n = vid_stride - 1, 2 * vid_stride - 1, ... are kept, the same ones ultralytics
+    keeps when it strides a cv2.VideoCapture, so frame numbering of the labels does not change.
+    Nothing is encoded and the audio stream is never touched. Reading past the last frame
+    raises CalledProcessError if ffmpeg did not exit cleanly.
+
+    :param input_path: path to the original video
+    :param width: output width, height follows the aspect ratio (rounded to even)
+    :param vid_stride: keep every vid_stride-th frame
+    """
+
+    def __init__(self, input_path: str, width: int = 640, vid_stride: int = 1):
+        info = probe_video(input_path)
+        self.width = width
+        self.height = max(2, int(round(info["height"] * width / info["width"] / 2)) * 2)
+        self.fps = info["fps"] / vid_stride
+        self.frames = info["frames"] // vid_stride
+        self.frame_size = self.width * self.height * 3
+        self.frame = None
+
+        filters = [f"scale={self.width}:{self.height}"]
+        if vid_stride > 1:
+            filters.insert(0, f"select='not(mod(n+1,{vid_stride}))'")
+
+        self.cmd = [
+            "ffmpeg", "-v", "error", "-nostdin",
+            "-i", input_path,
+            "-an", "-sn",
+            "-vf", ",".join(filters),
+            "-vsync", "passthrough",
+            "-f", "rawvideo",
+            "-pix_fmt", "bgr24",
+            "pipe:1"
+        ]
+        # a few frames of read-ahead so ffmpeg keeps decoding while the detector runs
+        self.proc = subprocess.Popen(self.cmd, stdout=subprocess.PIPE, bufsize=self.frame_size * 4)
+
+    def isOpened(self):
+        return self.proc is not None
+
+    def grab(self):
+        if self.proc is None:
+            return False
+        frame = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        view = memoryview(frame).cast("B")
+        read = 0
+        while read < self.frame_size:
+            n = self.proc.stdout.readinto(view[read:])
+            if not n:
+                self.frame = None
+                self._check_exit()
+                return False
+            read += n
+        self.frame = frame
+        return True
+
+    def _check_exit(self):
+        """
+        At the end of the pipe: raises CalledProcessError if ffmpeg failed, e.g. on a truncated
+        or corrupt file, so that a video cut short is not taken for a complete one.
+        """
+        returncode = self.proc.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, self.cmd)
+
+    def retrieve(self):
+        return self.frame is not None, self.frame
+
+    def read(self):
+        self.grab()
+        return self.retrieve()
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return self.frames
+        return 0
+
+    def release(self):
+        if self.proc is None:
+            return
+        self.proc.stdout.close()
+        self.proc.kill()
+        self.proc.wait()
+        self.proc = None
@@ -0,0 +1,58 @@
+import cv2
+
+
+class StridedFrameSource:
+    """
+    Iterates over every vid_stride-th frame of a video without retrieving the skipped ones.
+
+    Skipped frames are only grabbed: OpenCV still decodes them (inter frames depend on
+    them), only their retrieve (conversion to BGR) is saved. For strides far above the
+    keyframe interval, seek_threshold switches to seeking, which lets the decoder jump to
+    the keyframe before every kept frame.
+
+    Frame numbering matches the ultralytics video loader and therefore the label files:
+    label index k (1-based) is source frame k * vid_stride - 1 (0-based).
+
+    :param video_path: path to the video
+    :param vid_stride: keep every vid_stride-th frame
+    :param seek_threshold: seek instead of grabbing when vid_stride >= seek_threshold
+    """
+
+    def __init__(self, video_path, vid_stride=1, seek_threshold=None):
+        self.video_path = str(video_path)
+        self.vid_stride = max(1, int(vid_stride))
+        self.seek = seek_threshold is not None and self.vid_stride >= seek_threshold
+
+        self.cap = cv2.VideoCapture(self.video_path)
+        if not self.cap.isOpened():
+            raise IOError(f"Cannot open video file {self.video_path}")
+
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT)) // self.vid_stride
+
+    def __iter__(self):
+        """Yields (label_index, frame) tuples."""
+        label_index = 0
+        while True:
+            if self.seek:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, (label_index + 1) * self.vid_stride - 1)
+            else:
+                for _ in range(self.vid_stride - 1):
+                    if not self.cap.grab():
+                        return
+            ok, frame = self.cap.read()
+            if not ok:
+                return
+            label_index += 1
+            yield label_index, frame
+
+    def release(self):
+        self.cap.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
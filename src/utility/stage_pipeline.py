@@ -0,0 +1,112 @@
+import queue
+import threading
+
+# marks the end of the stream inside the queues
+_END = object()
+
+
+class Stage:
+    """
+    One step of a streaming pipeline.
+
+    :param name: human readable stage name, used in log messages
+    :param func: callable applied to every item; returning None drops the item
+    :param workers: number of threads running func concurrently
+    :param queue_size: maximum number of items waiting in front of this stage
+    """
+
+    def __init__(self, name, func, workers=1, queue_size=2):
+        if workers < 1:
+            raise ValueError(f"Stage '{name}' needs at least one worker, got {workers}")
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue_size = queue_size
+
+
+def _feed(items, out_queue, errors):
+    try:
+        for item in items:
+            out_queue.put(item)
+    except Exception as e:
+        errors.append(e)
+    finally:
+        out_queue.put(_END)
+
+
+def _work(stage, in_queue, out_queue, state):
+    ended = False
+    try:
+        while True:
+            item = in_queue.get()
+            if item is _END:
+                # let the sibling workers see the end marker as well
+                in_queue.put(_END)
+                ended = True
+                break
+            try:
+                result = stage.func(item)
+            except Exception as e:
+                print(f"Stage '{stage.name}' failed on {item}: {e}")
+                continue
+            if result is not None:
+                out_queue.put(result)
+    finally:
+        # also when func raises a BaseException (SystemExit, KeyboardInterrupt), or the
+        # stages after this one and run_stages would wait for the end marker forever
+        with state["lock"]:
+            state["alive"] -= 1
+            last = state["alive"] == 0
+        if last:
+            out_queue.put(_END)
+            if not ended:
+                # nobody takes the items of this stage any more, drop them so that the
+                # stages before it do not block on a full queue
+                while in_queue.get() is not _END:
+                    pass
+
+
+def run_stages(items, stages):
+    """
+    Streams items through the stages, each stage running in its own worker threads and
+    connected to the next one by a bounded queue, so item N can be in the last stage while
+    item N+1 is still in an earlier one.
+
+    A failing item is reported and dropped, the remaining items keep flowing.
+
+    :param items: iterable producing the pipeline input; consumed lazily
+    :param stages: list of Stage objects, applied in order
+    :return: list with the outputs of the last stage, in completion order
+    """
+    queues = [queue.Queue(maxsize=stage.queue_size) for stage in stages]
+    # the output of the last stage is drained here, no need to bound it
+    queues.append(queue.Queue())
+
+    errors = []
+    threads = [threading.Thread(target=_feed, args=(items, queues[0], errors), daemon=True)]
+    for i, stage in enumerate(stages):
+        state = {"lock": threading.Lock(), "alive": stage.workers}
+        for _ in range(stage.workers):
+            threads.append(threading.Thread(
+                target=_work,
+                args=(stage, queues[i], queues[i + 1], state),
+                name=f"{stage.name}-worker",
+                daemon=True,
+            ))
+
+    for t in threads:
+        t.start()
+
+    results = []
+    while True:
+        item = queues[-1].get()
+        if item is _END:
+            break
+        results.append(item)
+
+    for t in threads:
+        t.join()
+
+    if errors:
+        raise errors[0]
+    return results
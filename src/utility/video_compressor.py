@@ -20,11 +20,17 @@ def compress_video(input_path: str, output_path: str):
     ]
     subprocess.run(cmd, check=True)
 
+def compress_to_sibling(input_path: str):
+    """
+    Compresses input_path next to the original as <name>_compressed.mp4 and returns that path.
+    """
+    base, ext = os.path.splitext(input_path)
+    output_file = base + "_compressed.mp4"
+    compress_video(input_path, output_file)
+    return output_file
+
 def batch_compress_videos(file_paths):
     compressed_files = []
     for f in file_paths:
-        base, ext = os.path.splitext(f)
-        output_file = base + "_compressed.mp4"
-        compress_video(f, output_file)
-        compressed_files.append(output_file)
+        compressed_files.append(compress_to_sibling(f))
     return compressed_files
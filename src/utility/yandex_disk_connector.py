@@ -5,16 +5,24 @@ import yadisk
 from datetime import datetime
 from src.config import YANDEX_TOKEN, SHOPS
 
-def download_new_videos(
+def list_new_videos(
     yandex_folder: str = "Varvikas Video",
     local_folder: str = "data/incoming",
-    last_check_time: datetime = None
+    last_check_time: datetime = None,
+    with_size: bool = False
 ):
+    """
+    Lists the videos modified on Yandex.Disk since last_check_time without downloading them.
+    The largest (longest) videos come first so they start tracking as early as possible.
+
+    :return: list of (remote_path, local_path) tuples, (remote_path, local_path, size in bytes)
+        with with_size
+    """
     y = yadisk.YaDisk(token=YANDEX_TOKEN)
     os.makedirs(local_folder, exist_ok=True)
 
     items = y.listdir(yandex_folder)
-    all_new_files = []
+    new_videos = []
 
     for item in items:
         if item['type'] == 'dir':
@@ -34,10 +42,31 @@ def download_new_videos(
                     if last_check_time is None or file_mod_time > last_check_time:
                         filename = file_info["name"]
                         local_path = os.path.join(shop_local_folder, filename)
-                        print(f"Downloading {filename} from '{shop_path}' to '{local_path}'...")
-                        y.download(f"{shop_path}/{filename}", local_path)
-                        all_new_files.append(local_path)
-    
+                        new_videos.append((file_info["size"] or 0, f"{shop_path}/{filename}", local_path))
+
+    new_videos.sort(key=lambda v: v[0], reverse=True)
+    if with_size:
+        return [(remote_path, local_path, size) for size, remote_path, local_path in new_videos]
+    return [(remote_path, local_path) for _, remote_path, local_path in new_videos]
+
+
+def download_video(remote_path: str, local_path: str):
+    """Downloads a single video and returns its local path."""
+    y = yadisk.YaDisk(token=YANDEX_TOKEN)
+    print(f"Downloading '{remote_path}' to '{local_path}'...")
+    y.download(remote_path, local_path)
+    return local_path
+
+
+def download_new_videos(
+    yandex_folder: str = "Varvikas Video",
+    local_folder: str = "data/incoming",
+    last_check_time: datetime = None
+):
+    all_new_files = []
+    for remote_path, local_path in list_new_videos(yandex_folder, local_folder, last_check_time):
+        all_new_files.append(download_video(remote_path, local_path))
+
     return all_new_files
 
 def ensure_shops_on_ydisk(yandex_folder="Varvikas Video"):
@@ -11,6 +11,10 @@ class CMCInterface(ABC):
     def apply(self, im):
         pass
 
+    def reset(self):
+        # the first frame after a reset is treated as the new reference frame
+        self.prev_img = None
+
     def generate_mask(self, img, dets, scale):
         h, w = img.shape
         mask = np.zeros_like(img)
@@ -0,0 +1,233 @@
+# Mikel Broström 🔥 Yolo Tracking 🧾 AGPL-3.0 license
+
+import numpy as np
+
+
+class BatchedKalmanFilter(object):
+    """
+    The linear Kalman filters of all the tracks of an OC-SORT style tracker, stored as a
+    structure of arrays: the means of the tracks are the rows of x (N, dim_x) and their
+    covariances the matrices of P (N, dim_x, dim_x). Each track owns a row, returned by
+    add(), and predict / update / apply_affine_correction work on many rows at once, so
+    a frame costs a handful of matrix products whatever the number of tracks.
+
+    Behaves like the per track KalmanFilter of ocsort_kf.py, including the observation
+    centric re-update (ORU) of OC-SORT: the state of a track is frozen when it loses its
+    observations and, once it is observed again, it is re-updated from the frozen state
+    along a virtual trajectory interpolated between the last and the new observation.
+
+    The measurements are [x, y, s, r, ...]: center, scale (area) and aspect ratio, the
+    virtual trajectory interpolates the width and height they give linearly, like the
+    other values.
+
+    :param F: state transition matrix (dim_x, dim_x)
+    :param H: measurement function (dim_z, dim_x)
+    :param Q: process noise (dim_x, dim_x), used when predict() is given none
+    :param R: measurement noise (dim_z, dim_z), used when update() is given none
+    :param P: covariance of new tracks (dim_x, dim_x), used when add() is given none
+    :param capacity: rows allocated up front, doubled when exceeded
+    """
+
+    def __init__(self, F, H, Q, R, P, capacity=32):
+        self.F = np.asarray(F, dtype=float)
+        self.H = np.asarray(H, dtype=float)
+        self.Q = np.asarray(Q, dtype=float)
+        self.R = np.asarray(R, dtype=float)
+        self.P0 = np.asarray(P, dtype=float)
+        self.dim_z, self.dim_x = self.H.shape
+        self._I = np.eye(self.dim_x)
+
+        self.x = np.zeros((capacity, self.dim_x))
+        self.P = np.zeros((capacity, self.dim_x, self.dim_x))
+        # last measurement of each row, and the state frozen for the re-update
+        self.last_z = np.zeros((capacity, self.dim_z))
+        self.x_saved = np.zeros((capacity, self.dim_x))
+        self.P_saved = np.zeros((capacity, self.dim_x, self.dim_x))
+        self.z_saved = np.zeros((capacity, self.dim_z))
+        self.saved = np.zeros(capacity, dtype=bool)
+        self.observed = np.zeros(capacity, dtype=bool)
+        # updates without a measurement since the last one
+        self.missed = np.zeros(capacity, dtype=int)
+
+        self._free = list(range(capacity - 1, -1, -1))
+        self._pending = []
+
+    def __len__(self):
+        return len(self.x) - len(self._free)
+
+    def _grow(self):
+        capacity = len(self.x)
+        for name in ('x', 'P', 'last_z', 'x_saved', 'P_saved', 'z_saved', 'saved', 'observed', 'missed'):
+            a = getattr(self, name)
+            setattr(self, name, np.concatenate([a, np.zeros_like(a)]))
+        self._free = list(range(2 * capacity - 1, capacity - 1, -1)) + self._free
+
+    def add(self, x, P=None):
+        """
+        Allocates the row of a new track.
+
+        :param x: initial state, the missing trailing values (velocities) are 0
+        :param P: initial covariance, P of the constructor if not given
+        :return: the row of the track
+        """
+        if not self._free:
+            self._grow()
+        row = self._free.pop()
+        x = np.asarray(x, dtype=float).reshape(-1)
+        self.x[row] = 0
+        self.x[row, :len(x)] = x
+        self.P[row] = self.P0 if P is None else P
+        self.saved[row] = False
+        self.observed[row] = False
+        self.missed[row] = 0
+        return row
+
+    def release(self, rows):
+        """Frees the rows of removed tracks for the next ones."""
+        rows = np.atleast_1d(np.asarray(rows, dtype=int))
+        pending = set(rows.tolist())
+        self._pending = [p for p in self._pending if p[0] not in pending]
+        self._free.extend(rows.tolist())
+
+    def predict(self, rows, Q=None):
+        """
+        Predicts the next state of the rows: x = Fx, P = FPF' + Q.
+
+        :param Q: process noise, (dim_x, dim_x) or one per row (n, dim_x, dim_x)
+        """
+        rows = np.asarray(rows, dtype=int)
+        if len(rows) == 0:
+            return
+        if Q is None:
+            Q = self.Q
+        self.x[rows] = self.x[rows] @ self.F.T
+        self.P[rows] = self.F @ self.P[rows] @ self.F.T + Q
+
+    def _update(self, rows, z, R=None):
+        if R is None:
+            R = self.R
+        x = self.x[rows]
+        P = self.P[rows]
+
+        # y = z - Hx, S = HPH' + R, K = PH'inv(S)
+        y = z - x @ self.H.T
+        PHT = P @ self.H.T
+        S = self.H @ PHT + R
+        K = PHT @ np.linalg.inv(S)
+        self.x[rows] = x + np.einsum('nij,nj->ni', K, y)
+
+        # P = (I-KH)P(I-KH)' + KRK', more stable than (I-KH)P
+        I_KH = self._I - K @ self.H
+        self.P[rows] = I_KH @ P @ I_KH.transpose(0, 2, 1) + K @ R @ K.transpose(0, 2, 1)
+
+    def _virtual_trajectory(self, z1, z2, gaps):
+        """
+        The boxes of the frames between the frozen measurements z1 and the new ones z2,
+        z2 included: (n, max(gaps), dim_z), linear in center, width, height and the rest.
+        """
+        def unpack(z):
+            w = np.sqrt(z[:, 2] * z[:, 3])
+            h = np.sqrt(z[:, 2] / z[:, 3])
+            return np.column_stack([z[:, :2], w, h, z[:, 4:]])
+
+        v1 = unpack(z1)
+        dv = (unpack(z2) - v1) / gaps[:, None]
+        steps = np.arange(1, gaps.max() + 1)
+        v = v1[:, None] + steps[None, :, None] * dv[:, None]
+        w, h = v[..., 2], v[..., 3]
+        return np.concatenate([v[..., :2], (w * h)[..., None], (w / h)[..., None], v[..., 4:]], axis=-1)
+
+    def _reupdate(self, rows, z):
+        """Observation centric re-update of rows observed again after having been frozen."""
+        self.x[rows] = self.x_saved[rows]
+        self.P[rows] = self.P_saved[rows]
+        gaps = self.missed[rows] + 1
+        boxes = self._virtual_trajectory(self.z_saved[rows], z, gaps)
+        for i in range(gaps.max()):
+            step = gaps > i
+            self._update(rows[step], boxes[step, i])
+            self.predict(rows[gaps > i + 1])
+        self.last_z[rows] = boxes[np.arange(len(rows)), gaps - 1]
+
+    def update(self, rows, z, R=None):
+        """
+        Updates the rows with their measurements, the rows observed again after missed
+        ones are re-updated first.
+
+        :param z: measurements (n, dim_z)
+        :param R: measurement noise, (dim_z, dim_z) or one per row (n, dim_z, dim_z)
+        """
+        rows = np.asarray(rows, dtype=int)
+        if len(rows) == 0:
+            return
+        z = np.asarray(z, dtype=float).reshape(len(rows), self.dim_z)
+
+        reupdate = ~self.observed[rows] & self.saved[rows]
+        if reupdate.any():
+            self._reupdate(rows[reupdate], z[reupdate])
+        self.last_z[rows[~reupdate]] = z[~reupdate]
+        self.observed[rows] = True
+        self.missed[rows] = 0
+        self._update(rows, z, R)
+
+    def miss(self, rows):
+        """The rows got no measurement: the ones observed until now are frozen."""
+        rows = np.asarray(rows, dtype=int)
+        if len(rows) == 0:
+            return
+        freeze = rows[self.observed[rows]]
+        self.x_saved[freeze] = self.x[freeze]
+        self.P_saved[freeze] = self.P[freeze]
+        self.z_saved[freeze] = self.last_z[freeze]
+        self.saved[freeze] = True
+        self.observed[rows] = False
+        self.missed[rows] += 1
+
+    def observe(self, row, z=None, R=None):
+        """
+        Queues the measurement of a row (None when it got none) for the next flush(), so
+        the tracks of a frame are updated together once the associations are done.
+        """
+        self._pending.append((row, z, R))
+
+    def flush(self):
+        """Applies the measurements queued by observe()."""
+        pending, self._pending = self._pending, []
+        self.miss([row for row, z, _ in pending if z is None])
+        observed = [(row, z, R) for row, z, R in pending if z is not None]
+        if not observed:
+            return
+        rows, z, R = zip(*observed)
+        z = np.stack([np.asarray(z_, dtype=float).reshape(-1) for z_ in z])
+        if all(R_ is None for R_ in R):
+            R = None
+        else:
+            R = np.stack([self.R if R_ is None else R_ for R_ in R])
+        self.update(rows, z, R)
+
+    def apply_affine_correction(self, rows, A, b, A_z=None, b_z=None):
+        """
+        Moves the rows by a camera motion: x = Ax + b, P = APA'. The frozen states are
+        moved as well, with their measurements (z = A_z z + b_z).
+        """
+        rows = np.asarray(rows, dtype=int)
+        if len(rows) == 0:
+            return
+        self.x[rows] = self.x[rows] @ A.T + b
+        self.P[rows] = A @ self.P[rows] @ A.T
+
+        frozen = rows[~self.observed[rows] & self.saved[rows]]
+        if len(frozen) == 0:
+            return
+        self.x_saved[frozen] = self.x_saved[frozen] @ A.T + b
+        self.P_saved[frozen] = A @ self.P_saved[frozen] @ A.T
+        if A_z is not None:
+            self.z_saved[frozen] = self.z_saved[frozen] @ A_z.T + b_z
+
+    def mahalanobis(self, row, z):
+        """Mahalanobis distance of a measurement to the predicted state of a row."""
+        x = self.x[row]
+        P = self.P[row]
+        y = np.asarray(z, dtype=float).reshape(-1) - self.H @ x
+        S = self.H @ P @ self.H.T + self.R
+        return np.sqrt(y @ np.linalg.solve(S, y))
@@ -0,0 +1,118 @@
+# Mikel Broström 🔥 Yolo Tracking 🧾 AGPL-3.0 license
+
+"""
+Microbenchmark of the vectorized correction and gating of the BoT-SORT and ByteTrack
+Kalman filters against the per track calls they replace:
+
+    python -m src.yolo.boxmot.motion.kalman_filters.benchmark --tracks 10 100 500
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from src.yolo.boxmot.motion.kalman_filters.botsort_kf import KalmanFilter as BoTSORTKalmanFilter
+from src.yolo.boxmot.motion.kalman_filters.bytetrack_kf import KalmanFilter as ByteTrackKalmanFilter
+
+KALMAN_FILTERS = {
+    'botsort': BoTSORTKalmanFilter,
+    'bytetrack': ByteTrackKalmanFilter,
+}
+
+
+def _measurements(rng, n, kf_name):
+    """n random (x, y, w, h) boxes, or (x, y, a, h) ones for ByteTrack."""
+    boxes = np.column_stack([
+        rng.uniform(0, 1920, n),
+        rng.uniform(0, 1080, n),
+        rng.uniform(20, 200, n),
+        rng.uniform(40, 400, n),
+    ])
+    if kf_name == 'bytetrack':
+        boxes[:, 2] /= boxes[:, 3]
+    return boxes
+
+
+def _states(kf, rng, n, kf_name):
+    """n predicted track states, as the trackers hold them when they associate."""
+    states = [kf.initiate(z) for z in _measurements(rng, n, kf_name)]
+    mean = np.asarray([m for m, _ in states])
+    covariance = np.asarray([c for _, c in states])
+    return kf.multi_predict(mean, covariance)
+
+
+def _best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t)
+    return best, out
+
+
+def benchmark(kf_name, n, repeat=20, seed=0):
+    """
+    Times the per track update / gating_distance loops and multi_update /
+    multi_gating_distance on n tracks (and n measurements for the gating).
+
+    :return: dict of the timings (ms) and the largest differences of the results
+    """
+    kf = KALMAN_FILTERS[kf_name]()
+    rng = np.random.default_rng(seed)
+    mean, covariance = _states(kf, rng, n, kf_name)
+    measurement = mean[:, :4] + rng.normal(0, 1, (n, 4)) * np.array([2, 2, 0.01, 2])
+    measurements = _measurements(rng, n, kf_name)
+
+    def loop_update():
+        return [kf.update(m, c, z) for m, c, z in zip(mean, covariance, measurement)]
+
+    def loop_gating():
+        return np.stack([kf.gating_distance(m, c, measurements) for m, c in zip(mean, covariance)])
+
+    t_loop_update, looped = _best_of(loop_update, repeat)
+    t_multi_update, (multi_mean, multi_covariance) = _best_of(
+        lambda: kf.multi_update(mean, covariance, measurement), repeat
+    )
+    t_loop_gating, looped_gating = _best_of(loop_gating, repeat)
+    t_multi_gating, multi_gating = _best_of(
+        lambda: kf.multi_gating_distance(mean, covariance, measurements), repeat
+    )
+
+    return {
+        'kf': kf_name,
+        'tracks': n,
+        'update_loop_ms': 1000 * t_loop_update,
+        'multi_update_ms': 1000 * t_multi_update,
+        'gating_loop_ms': 1000 * t_loop_gating,
+        'multi_gating_ms': 1000 * t_multi_gating,
+        'mean_diff': np.abs(np.asarray([m for m, _ in looped]) - multi_mean).max(),
+        'covariance_diff': np.abs(np.asarray([c for _, c in looped]) - multi_covariance).max(),
+        'gating_rel_diff': (np.abs(looped_gating - multi_gating) / np.maximum(looped_gating, 1)).max(),
+    }
+
+
+def print_results(results):
+    print(f"{'kf':<10}{'tracks':>7}{'update':>10}{'multi':>10}{'gating':>10}{'multi':>10}"
+          f"{'mean diff':>12}{'cov diff':>12}{'gating diff':>13}")
+    for r in results:
+        print(f"{r['kf']:<10}{r['tracks']:>7}"
+              f"{r['update_loop_ms']:>8.2f}ms{r['multi_update_ms']:>8.2f}ms"
+              f"{r['gating_loop_ms']:>8.2f}ms{r['multi_gating_ms']:>8.2f}ms"
+              f"{r['mean_diff']:>12.1e}{r['covariance_diff']:>12.1e}{r['gating_rel_diff']:>13.1e}")
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser(description="Kalman filter update and gating benchmark")
+    parser.add_argument('--tracks', nargs='+', type=int, default=[10, 100, 500],
+                        help='numbers of concurrent tracks')
+    parser.add_argument('--kf', nargs='+', default=list(KALMAN_FILTERS),
+                        help=f'Kalman filters, of {list(KALMAN_FILTERS)}')
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='runs per timing, the best one is kept')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    opt = parse_opt()
+    print_results([benchmark(kf, n, opt.repeat) for kf in opt.kf for n in opt.tracks])
@@ -2,9 +2,13 @@ import numpy as np
 import cv2 as cv
 import hashlib
 import colorsys
+from functools import lru_cache
 
 
 class BaseTracker(object):
+    # the track lists kept apart for every class with per_class, see PerClassDecorator
+    per_class_attributes = ('active_tracks',)
+
     def __init__(self, det_thresh: float = 0.3, max_age: int = 30, min_hits: int = 3, iou_threshold: float = 0.3):
         """
         Initialize the BaseTracker object with detection threshold, maximum age, minimum hits, 
@@ -19,12 +23,17 @@ class BaseTracker(object):
         Attributes:
         - frame_count (int): Counter for the frames processed.
         - active_tracks (list): List to hold active tracks, may be used differently in subclasses.
+        - keep_history (bool): Whether new tracks record the history of their boxes, only needed
+        by plot_results. Set it before the first update, tracks created before do not record it.
         """
         self.det_thresh = det_thresh
         self.max_age = max_age
         self.min_hits = min_hits
         self.iou_threshold = iou_threshold
-        self.per_class_active_tracks = {}
+        self.per_class_state = {}
+        self.keep_history = False
+        # detections (and camera motion) of the frame shared by its per class updates
+        self.shared_frame = None
 
         self.frame_count = 0
         self.active_tracks = []  # This might be handled differently in derived classes
@@ -44,9 +53,76 @@ class BaseTracker(object):
         """
         raise NotImplementedError("The update method needs to be implemented by the subclass.")
 
+    def reset(self) -> None:
+        """
+        Clears all per-sequence state so the tracker can be reused on a new video. Loaded
+        models (e.g. the ReID backend) are kept, only tracks, counters and the camera
+        motion compensation reference frame are dropped. Subclasses holding extra track
+        lists or id counters should extend this method.
+        """
+        self.frame_count = 0
+        self.active_tracks = []
+        self.per_class_state = {}
+        if getattr(self, 'cmc', None) is not None:
+            self.cmc.reset()
+
+    def get_embs(self, dets: np.ndarray, img: np.ndarray) -> np.ndarray:
+        """
+        Appearance features of the detections, computed by the ReID model of the tracker.
+
+        Parameters:
+        - dets (np.ndarray): Detections of the frame, (x1, y1, x2, y2, conf, cls, ...) rows.
+        - img (np.ndarray): The frame the detections were made on.
+
+        Returns:
+        - np.ndarray: One row of features per detection, zeros for the detections the tracker
+        does not use them for, or None for trackers without a ReID model.
+        """
+        return None
+
+    def _reid_features(self, dets: np.ndarray, img: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        """
+        Features of the detections selected by mask from self.model, in an array with a row per
+        detection (zeros for the others, (N, 0) when none is selected).
+        """
+        if not mask.any():
+            return np.zeros((len(dets), 0))
+        features = self.model.get_features(dets[mask, 0:4], img)
+        embs = np.zeros((len(dets), features.shape[1]), dtype=features.dtype)
+        embs[mask] = features
+        return embs
+
+    def camera_motion(self, img: np.ndarray, dets: np.ndarray) -> np.ndarray:
+        """
+        Camera motion since the previous frame, self.cmc.apply(img, dets). In the per class
+        updates of a frame it is estimated once, with all the detections of the frame masked.
+        """
+        if self.shared_frame is None:
+            return self.cmc.apply(img, dets)
+        if 'warp' not in self.shared_frame:
+            self.shared_frame['warp'] = self.cmc.apply(img, self.shared_frame['dets'][:, :4])
+        return self.shared_frame['warp']
+
+    def get_track_embs(self) -> dict:
+        """
+        Appearance features the tracker keeps for its active tracks, computed by its ReID model
+        while tracking.
+
+        Returns:
+        - dict: {track id of the outputs: feature vector}, or None for trackers without a ReID model.
+        """
+        return None
+
+    def _all_active_tracks(self) -> list:
+        """The active tracks of every class with per_class, self.active_tracks otherwise."""
+        if self.per_class_state:
+            return [a for state in self.per_class_state.values() for a in state['active_tracks']]
+        return self.active_tracks
+
     def id_to_color(self, id: int, saturation: float = 0.75, value: float = 0.95) -> tuple:
         """
-        Generates a consistent unique BGR color for a given ID using hashing.
+        Generates a consistent unique BGR color for a given ID using hashing. Colors are
+        computed once per ID and then served from a table.
 
         Parameters:
         - id (int): Unique identifier for which to generate a color.
@@ -56,28 +132,7 @@ class BaseTracker(object):
         Returns:
         - tuple: A tuple representing the BGR color.
         """
-
-        # Hash the ID to get a consistent unique value
-        hash_object = hashlib.sha256(str(id).encode())
-        hash_digest = hash_object.hexdigest()
-        
-        # Convert the first few characters of the hash to an integer
-        # and map it to a value between 0 and 1 for the hue
-        hue = int(hash_digest[:8], 16) / 0xffffffff
-        
-        # Convert HSV to RGB
-        rgb = colorsys.hsv_to_rgb(hue, saturation, value)
-        
-        # Convert RGB from 0-1 range to 0-255 range and format as hexadecimal
-        rgb_255 = tuple(int(component * 255) for component in rgb)
-        hex_color = '#%02x%02x%02x' % rgb_255
-        # Strip the '#' character and convert the string to RGB integers
-        rgb = tuple(int(hex_color.strip('#')[i:i+2], 16) for i in (0, 2, 4))
-        
-        # Convert RGB to BGR for OpenCV
-        bgr = rgb[::-1]
-        
-        return bgr
+        return _id_to_color(int(id), saturation, value)
 
     def plot_box_on_img(self, img: np.ndarray, box: tuple, conf: float, cls: int, id: int) -> np.ndarray:
         """
@@ -118,9 +173,8 @@ class BaseTracker(object):
 
     def plot_trackers_trajectories(self, img: np.ndarray, observations: list, id: int) -> np.ndarray:
         """
-        Draws the trajectories of tracked objects based on historical observations. Each point
-        in the trajectory is represented by a circle, with the thickness increasing for more
-        recent observations to visualize the path of movement.
+        Draws the trajectory of a tracked object through the centers of its historical
+        observations, as a single polyline.
 
         Parameters:
         - img (np.ndarray): The image array on which to draw the trajectories.
@@ -131,17 +185,9 @@ class BaseTracker(object):
         Returns:
         - np.ndarray: The image array with the trajectories drawn on it.
         """
-        for i, box in enumerate(observations):
-            trajectory_thickness = int(np.sqrt(float (i + 1)) * 1.2)
-            img = cv.circle(
-                img,
-                (int((box[0] + box[2]) / 2),
-                int((box[1] + box[3]) / 2)), 
-                2,
-                color=self.id_to_color(int(id)),
-                thickness=trajectory_thickness
-            )
-        return img
+        boxes = np.asarray(observations, dtype=np.float64)[:, :4]
+        centers = ((boxes[:, :2] + boxes[:, 2:]) / 2).astype(np.int32)
+        return cv.polylines(img, [centers], isClosed=False, color=self.id_to_color(id), thickness=2)
 
 
     def plot_results(self, img: np.ndarray, show_trajectories: bool) -> np.ndarray:
@@ -158,25 +204,24 @@ class BaseTracker(object):
         - np.ndarray: The image array with trajectories and bounding boxes of all active tracks.
         """
 
-        # if values in dict
-        if self.per_class_active_tracks:
-            for k in self.per_class_active_tracks.keys():
-                active_tracks = self.per_class_active_tracks[k]
-                for a in active_tracks:
-                    if a.history_observations:
-                        if len(a.history_observations) > 2:
-                            box = a.history_observations[-1]
-                            img = self.plot_box_on_img(img, box, a.conf, a.cls, a.id)
-                            if show_trajectories:
-                                img = self.plot_trackers_trajectories(img, a.history_observations, a.id)
-        else:
-            for a in self.active_tracks:
-                if a.history_observations:
-                    if len(a.history_observations) > 2:
-                        box = a.history_observations[-1]
-                        img = self.plot_box_on_img(img, box, a.conf, a.cls, a.id)
-                        if show_trajectories:
-                            img = self.plot_trackers_trajectories(img, a.history_observations, a.id)
-                
+        for a in self._all_active_tracks():
+            if a.history_observations and len(a.history_observations) > 2:
+                box = a.history_observations[-1]
+                img = self.plot_box_on_img(img, box, a.conf, a.cls, a.id)
+                if show_trajectories:
+                    img = self.plot_trackers_trajectories(img, a.history_observations, a.id)
+
         return img
 
+
+@lru_cache(maxsize=None)
+def _id_to_color(id: int, saturation: float, value: float) -> tuple:
+    # Hash the ID to get a consistent unique value, the first 8 hex digits give the hue
+    hash_digest = hashlib.sha256(str(id).encode()).hexdigest()
+    hue = int(hash_digest[:8], 16) / 0xffffffff
+
+    rgb = colorsys.hsv_to_rgb(hue, saturation, value)
+    rgb_255 = tuple(int(component * 255) for component in rgb)
+
+    # Convert RGB to BGR for OpenCV
+    return rgb_255[::-1]
@@ -16,8 +16,17 @@ from src.yolo.boxmot.utils import PerClassDecorator
 
 class STrack(BaseTrack):
     shared_kalman = KalmanFilter()
+    __slots__ = (
+        'xywh', 'conf', 'cls', 'det_ind', 'kalman_filter', 'mean', 'covariance', 'cls_hist',
+        'history_observations', 'tracklet_len', 'smooth_feat', 'curr_feat', 'features', 'alpha', 'id',
+    )
 
-    def __init__(self, det, feat=None, feat_history=50):
+    def __init__(self, det, feat=None, feat_history=50, keep_history=False):
+        """
+        The features and observed boxes of the track are only recorded (features,
+        history_observations) with keep_history, None otherwise.
+        """
+        super(STrack, self).__init__()
         # wait activate
         self.xywh = xyxy2xywh(det[0:4])  # (x1, y1, x2, y2) --> (xc, yc, w, h)
         self.conf = det[4]
@@ -28,16 +37,16 @@ class STrack(BaseTrack):
         self.is_activated = False
         self.cls_hist = []  # (cls id, freq)
         self.update_cls(self.cls, self.conf)
-        self.history_observations = deque([], maxlen=50)
+        self.history_observations = deque([], maxlen=50) if keep_history else None
 
         self.tracklet_len = 0
 
         self.smooth_feat = None
         self.curr_feat = None
+        self.features = deque([], maxlen=feat_history) if keep_history else None
+        self.alpha = 0.9
         if feat is not None:
             self.update_features(feat)
-        self.features = deque([], maxlen=feat_history)
-        self.alpha = 0.9
 
     def update_features(self, feat):
         feat /= np.linalg.norm(feat)
@@ -46,7 +55,8 @@ class STrack(BaseTrack):
             self.smooth_feat = feat
         else:
             self.smooth_feat = self.alpha * self.smooth_feat + (1 - self.alpha) * feat
-        self.features.append(feat)
+        if self.features is not None:
+            self.features.append(feat)
         self.smooth_feat /= np.linalg.norm(self.smooth_feat)
 
     def update_cls(self, cls, conf):
@@ -90,9 +100,11 @@ class STrack(BaseTrack):
             multi_mean, multi_covariance = STrack.shared_kalman.multi_predict(
                 multi_mean, multi_covariance
             )
+            # copies, views would keep the arrays of the whole batch alive as long as any of
+            # its tracks, lost and removed ones included
             for i, (mean, cov) in enumerate(zip(multi_mean, multi_covariance)):
-                stracks[i].mean = mean
-                stracks[i].covariance = cov
+                stracks[i].mean = mean.copy()
+                stracks[i].covariance = cov.copy()
 
     @staticmethod
     def multi_gmc(stracks, H=np.eye(2, 3)):
@@ -112,6 +124,20 @@ class STrack(BaseTrack):
                 stracks[i].mean = mean
                 stracks[i].covariance = cov
 
+    @staticmethod
+    def multi_update(stracks, detections):
+        """Kalman filter correction of the matched stracks with their detections, all at once"""
+        if len(stracks) > 0:
+            multi_mean = np.asarray([st.mean for st in stracks])
+            multi_covariance = np.asarray([st.covariance for st in stracks])
+            measurement = np.asarray([det.xywh for det in detections])
+            multi_mean, multi_covariance = STrack.shared_kalman.multi_update(
+                multi_mean, multi_covariance, measurement
+            )
+            for i, (mean, cov) in enumerate(zip(multi_mean, multi_covariance)):
+                stracks[i].mean = mean.copy()
+                stracks[i].covariance = cov.copy()
+
     def activate(self, kalman_filter, frame_id):
         """Start a new tracklet"""
         self.kalman_filter = kalman_filter
@@ -126,10 +152,11 @@ class STrack(BaseTrack):
         self.frame_id = frame_id
         self.start_frame = frame_id
 
-    def re_activate(self, new_track, frame_id, new_id=False):
-        self.mean, self.covariance = self.kalman_filter.update(
-            self.mean, self.covariance, new_track.xywh
-        )
+    def re_activate(self, new_track, frame_id, new_id=False, update_kf=True):
+        if update_kf:
+            self.mean, self.covariance = self.kalman_filter.update(
+                self.mean, self.covariance, new_track.xywh
+            )
         if new_track.curr_feat is not None:
             self.update_features(new_track.curr_feat)
         self.tracklet_len = 0
@@ -144,22 +171,24 @@ class STrack(BaseTrack):
 
         self.update_cls(new_track.cls, new_track.conf)
 
-    def update(self, new_track, frame_id):
+    def update(self, new_track, frame_id, update_kf=True):
         """
         Update a matched track
         :type new_track: STrack
         :type frame_id: int
-        :type update_feature: bool
+        :type update_kf: bool, False when the state is corrected by multi_update
         :return:
         """
         self.frame_id = frame_id
         self.tracklet_len += 1
 
-        self.history_observations.append(self.xyxy)
+        if self.history_observations is not None:
+            self.history_observations.append(self.xyxy)
 
-        self.mean, self.covariance = self.kalman_filter.update(
-            self.mean, self.covariance, new_track.xywh
-        )
+        if update_kf:
+            self.mean, self.covariance = self.kalman_filter.update(
+                self.mean, self.covariance, new_track.xywh
+            )
 
         if new_track.curr_feat is not None:
             self.update_features(new_track.curr_feat)
@@ -186,6 +215,8 @@ class STrack(BaseTrack):
 
 
 class BoTSORT(BaseTracker):
+    per_class_attributes = ('active_tracks', 'lost_stracks', 'removed_stracks')
+
     def __init__(
         self,
         model_weights,
@@ -232,6 +263,24 @@ class BoTSORT(BaseTracker):
         self.cmc = SOF()
         self.fuse_first_associate = fuse_first_associate
 
+    def reset(self):
+        super().reset()
+        self.lost_stracks = []  # type: list[STrack]
+        self.removed_stracks = []  # type: list[STrack]
+        BaseTrack.clear_count()
+
+    def get_embs(self, dets, img):
+        """Features of the first association detections (conf above track_high_thresh)"""
+        if not self.with_reid:
+            return None
+        return self._reid_features(dets, img, dets[:, 4] > self.track_high_thresh)
+
+    def get_track_embs(self):
+        """Smoothed features of the active tracks that have any, keyed by their output id"""
+        if not self.with_reid:
+            return None
+        return {t.id: t.smooth_feat for t in self._all_active_tracks() if t.smooth_feat is not None}
+
     @PerClassDecorator
     def update(self, dets, img, embs=None):
         assert isinstance(
@@ -269,18 +318,19 @@ class BoTSORT(BaseTracker):
         """Extract embeddings """
         # appearance descriptor extraction
         if self.with_reid:
-            if embs is not None:
-                features_high = embs
-            else:
+            if embs is None:
                 # (Ndets x X) [512, 1024, 2048]
-                features_high = self.model.get_features(dets_first[:, 0:4], img)
+                embs = self.get_embs(dets, img)
+            features_high = embs[first_mask]
 
         if len(dets) > 0:
             """Detections"""
             if self.with_reid:
-                detections = [STrack(det, f) for (det, f) in zip(dets_first, features_high)]
+                detections = [
+                    STrack(det, f, keep_history=self.keep_history) for (det, f) in zip(dets_first, features_high)
+                ]
             else:
-                detections = [STrack(det) for (det) in np.array(dets_first)]
+                detections = [STrack(det, keep_history=self.keep_history) for (det) in np.array(dets_first)]
         else:
             detections = []
 
@@ -300,7 +350,7 @@ class BoTSORT(BaseTracker):
         STrack.multi_predict(strack_pool)
 
         # Fix camera motion
-        warp = self.cmc.apply(img, dets_first)
+        warp = self.camera_motion(img, dets_first)
         STrack.multi_gmc(strack_pool, warp)
         STrack.multi_gmc(unconfirmed, warp)
 
@@ -322,15 +372,21 @@ class BoTSORT(BaseTracker):
             dists, thresh=self.match_thresh
         )
 
+        # the Kalman filters of the matched tracks are corrected together, once all the
+        # associations are done, none of them reads the state of a track matched before
+        matched_stracks = []
+        matched_detections = []
         for itracked, idet in matches:
             track = strack_pool[itracked]
             det = detections[idet]
             if track.state == TrackState.Tracked:
-                track.update(detections[idet], self.frame_count)
+                track.update(detections[idet], self.frame_count, update_kf=False)
                 activated_starcks.append(track)
             else:
-                track.re_activate(det, self.frame_count, new_id=False)
+                track.re_activate(det, self.frame_count, new_id=False, update_kf=False)
                 refind_stracks.append(track)
+            matched_stracks.append(track)
+            matched_detections.append(det)
 
         """ Step 3: Second association, with low conf detection boxes"""
         if len(dets_second) > 0:
@@ -350,11 +406,13 @@ class BoTSORT(BaseTracker):
             track = r_tracked_stracks[itracked]
             det = detections_second[idet]
             if track.state == TrackState.Tracked:
-                track.update(det, self.frame_count)
+                track.update(det, self.frame_count, update_kf=False)
                 activated_starcks.append(track)
             else:
-                track.re_activate(det, self.frame_count, new_id=False)
+                track.re_activate(det, self.frame_count, new_id=False, update_kf=False)
                 refind_stracks.append(track)
+            matched_stracks.append(track)
+            matched_detections.append(det)
 
         for it in u_track:
             track = r_tracked_stracks[it]
@@ -379,8 +437,11 @@ class BoTSORT(BaseTracker):
 
         matches, u_unconfirmed, u_detection = linear_assignment(dists, thresh=0.7)
         for itracked, idet in matches:
-            unconfirmed[itracked].update(detections[idet], self.frame_count)
+            unconfirmed[itracked].update(detections[idet], self.frame_count, update_kf=False)
             activated_starcks.append(unconfirmed[itracked])
+            matched_stracks.append(unconfirmed[itracked])
+            matched_detections.append(detections[idet])
+        STrack.multi_update(matched_stracks, matched_detections)
         for it in u_unconfirmed:
             track = unconfirmed[it]
             track.mark_removed()
@@ -14,22 +14,25 @@ class TrackState(object):
 
 class BaseTrack(object):
     _count = 0
+    __slots__ = ('is_activated', 'state', 'start_frame', 'frame_id')
 
+    # defaults only, subclasses setting them declare them in their own __slots__
     track_id = 0
-    is_activated = False
-    state = TrackState.New
-
     history = OrderedDict()
     features = []
     curr_feature = None
     conf = 0
-    start_frame = 0
-    frame_id = 0
     time_since_update = 0
 
     # multi-camera
     location = (np.inf, np.inf)
 
+    def __init__(self):
+        self.is_activated = False
+        self.state = TrackState.New
+        self.start_frame = 0
+        self.frame_id = 0
+
     @property
     def end_frame(self):
         return self.frame_id
@@ -53,3 +56,7 @@ class BaseTrack(object):
 
     def mark_removed(self):
         self.state = TrackState.Removed
+
+    @staticmethod
+    def clear_count():
+        BaseTrack._count = 0
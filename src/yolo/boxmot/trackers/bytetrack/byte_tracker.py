@@ -13,8 +13,14 @@ from src.yolo.boxmot.utils import PerClassDecorator
 
 class STrack(BaseTrack):
     shared_kalman = KalmanFilter()
-
-    def __init__(self, det):
+    __slots__ = (
+        'xywh', 'tlwh', 'xyah', 'conf', 'cls', 'det_ind', 'kalman_filter', 'mean', 'covariance', 'tracklet_len',
+        'history_observations', 'id',
+    )
+
+    def __init__(self, det, keep_history=False):
+        """The observed boxes of the track are only recorded with keep_history, None otherwise."""
+        super(STrack, self).__init__()
         # wait activate
         self.xywh = xyxy2xywh(det[0:4])  # (x1, y1, x2, y2) --> (xc, yc, w, h)
         self.tlwh = xywh2tlwh(self.xywh)  # (xc, yc, w, h) --> (t, l, w, h)
@@ -26,7 +32,7 @@ class STrack(BaseTrack):
         self.mean, self.covariance = None, None
         self.is_activated = False
         self.tracklet_len = 0
-        self.history_observations = deque([], maxlen=50)
+        self.history_observations = deque([], maxlen=50) if keep_history else None
 
     def predict(self):
         mean_state = self.mean.copy()
@@ -47,9 +53,25 @@ class STrack(BaseTrack):
             multi_mean, multi_covariance = STrack.shared_kalman.multi_predict(
                 multi_mean, multi_covariance
             )
+            # copies, views would keep the arrays of the whole batch alive as long as any of
+            # its tracks, lost and removed ones included
+            for i, (mean, cov) in enumerate(zip(multi_mean, multi_covariance)):
+                stracks[i].mean = mean.copy()
+                stracks[i].covariance = cov.copy()
+
+    @staticmethod
+    def multi_update(stracks, detections):
+        """Kalman filter correction of the matched stracks with their detections, all at once"""
+        if len(stracks) > 0:
+            multi_mean = np.asarray([st.mean for st in stracks])
+            multi_covariance = np.asarray([st.covariance for st in stracks])
+            measurement = np.asarray([det.xyah for det in detections])
+            multi_mean, multi_covariance = STrack.shared_kalman.multi_update(
+                multi_mean, multi_covariance, measurement
+            )
             for i, (mean, cov) in enumerate(zip(multi_mean, multi_covariance)):
-                stracks[i].mean = mean
-                stracks[i].covariance = cov
+                stracks[i].mean = mean.copy()
+                stracks[i].covariance = cov.copy()
 
     def activate(self, kalman_filter, frame_id):
         """Start a new tracklet"""
@@ -65,10 +87,11 @@ class STrack(BaseTrack):
         self.frame_id = frame_id
         self.start_frame = frame_id
 
-    def re_activate(self, new_track, frame_id, new_id=False):
-        self.mean, self.covariance = self.kalman_filter.update(
-            self.mean, self.covariance, new_track.xyah
-        )
+    def re_activate(self, new_track, frame_id, new_id=False, update_kf=True):
+        if update_kf:
+            self.mean, self.covariance = self.kalman_filter.update(
+                self.mean, self.covariance, new_track.xyah
+            )
         self.tracklet_len = 0
         self.state = TrackState.Tracked
         self.is_activated = True
@@ -79,21 +102,23 @@ class STrack(BaseTrack):
         self.cls = new_track.cls
         self.det_ind = new_track.det_ind
 
-    def update(self, new_track, frame_id):
+    def update(self, new_track, frame_id, update_kf=True):
         """
         Update a matched track
         :type new_track: STrack
         :type frame_id: int
-        :type update_feature: bool
+        :type update_kf: bool, False when the state is corrected by multi_update
         :return:
         """
         self.frame_id = frame_id
         self.tracklet_len += 1
-        self.history_observations.append(self.xyxy)
+        if self.history_observations is not None:
+            self.history_observations.append(self.xyxy)
 
-        self.mean, self.covariance = self.kalman_filter.update(
-            self.mean, self.covariance, new_track.xyah
-        )
+        if update_kf:
+            self.mean, self.covariance = self.kalman_filter.update(
+                self.mean, self.covariance, new_track.xyah
+            )
         self.state = TrackState.Tracked
         self.is_activated = True
 
@@ -116,6 +141,8 @@ class STrack(BaseTrack):
 
 
 class BYTETracker(BaseTracker):
+    per_class_attributes = ('active_tracks', 'lost_stracks', 'removed_stracks')
+
     def __init__(
         self, track_thresh=0.45, match_thresh=0.8, track_buffer=25, frame_rate=30, per_class=False,
     ):
@@ -135,6 +162,13 @@ class BYTETracker(BaseTracker):
         self.max_time_lost = self.buffer_size
         self.kalman_filter = KalmanFilter()
 
+    def reset(self):
+        super().reset()
+        self.lost_stracks = []  # type: list[STrack]
+        self.removed_stracks = []  # type: list[STrack]
+        self.frame_id = 0
+        BaseTrack.clear_count()
+
     @PerClassDecorator
     def update(self, dets, im=None, embs=None):
         assert isinstance(
@@ -167,7 +201,7 @@ class BYTETracker(BaseTracker):
         if len(dets) > 0:
             """Detections"""
             detections = [
-                STrack(det) for det in dets
+                STrack(det, keep_history=self.keep_history) for det in dets
             ]
         else:
             detections = []
@@ -192,15 +226,21 @@ class BYTETracker(BaseTracker):
             dists, thresh=self.match_thresh
         )
 
+        # the Kalman filters of the matched tracks are corrected together, once all the
+        # associations are done, none of them reads the state of a track matched before
+        matched_stracks = []
+        matched_detections = []
         for itracked, idet in matches:
             track = strack_pool[itracked]
             det = detections[idet]
             if track.state == TrackState.Tracked:
-                track.update(detections[idet], self.frame_count)
+                track.update(detections[idet], self.frame_count, update_kf=False)
                 activated_starcks.append(track)
             else:
-                track.re_activate(det, self.frame_count, new_id=False)
+                track.re_activate(det, self.frame_count, new_id=False, update_kf=False)
                 refind_stracks.append(track)
+            matched_stracks.append(track)
+            matched_detections.append(det)
 
         """ Step 3: Second association, with low conf detection boxes"""
         # association the untrack to the low conf detections
@@ -220,11 +260,13 @@ class BYTETracker(BaseTracker):
             track = r_tracked_stracks[itracked]
             det = detections_second[idet]
             if track.state == TrackState.Tracked:
-                track.update(det, self.frame_count)
+                track.update(det, self.frame_count, update_kf=False)
                 activated_starcks.append(track)
             else:
-                track.re_activate(det, self.frame_count, new_id=False)
+                track.re_activate(det, self.frame_count, new_id=False, update_kf=False)
                 refind_stracks.append(track)
+            matched_stracks.append(track)
+            matched_detections.append(det)
 
         for it in u_track:
             track = r_tracked_stracks[it]
@@ -239,8 +281,11 @@ class BYTETracker(BaseTracker):
         dists = fuse_score(dists, detections)
         matches, u_unconfirmed, u_detection = linear_assignment(dists, thresh=0.7)
         for itracked, idet in matches:
-            unconfirmed[itracked].update(detections[idet], self.frame_count)
+            unconfirmed[itracked].update(detections[idet], self.frame_count, update_kf=False)
             activated_starcks.append(unconfirmed[itracked])
+            matched_stracks.append(unconfirmed[itracked])
+            matched_detections.append(detections[idet])
+        STrack.multi_update(matched_stracks, matched_detections)
         for it in u_unconfirmed:
             track = unconfirmed[it]
             track.mark_removed()
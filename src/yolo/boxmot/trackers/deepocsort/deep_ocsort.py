@@ -5,24 +5,14 @@ from collections import deque
 
 from src.yolo.boxmot.appearance.reid_auto_backend import ReidAutoBackend
 from src.yolo.boxmot.motion.cmc import get_cmc_method
-from src.yolo.boxmot.motion.kalman_filters.deepocsort_kf import KalmanFilter
+from src.yolo.boxmot.motion.kalman_filters.batched_kf import BatchedKalmanFilter
 from src.yolo.boxmot.utils.association import associate, linear_assignment
 from src.yolo.boxmot.utils.iou import get_asso_func
+from src.yolo.boxmot.utils.observations import ObservationHistory, k_previous_obs
 from src.yolo.boxmot.trackers.basetracker import BaseTracker
 from src.yolo.boxmot.utils import PerClassDecorator
 
 
-def k_previous_obs(observations, cur_age, k):
-    if len(observations) == 0:
-        return [-1, -1, -1, -1, -1]
-    for i in range(k):
-        dt = k - i
-        if cur_age - dt in observations:
-            return observations[cur_age - dt]
-    max_age = max(observations.keys())
-    return observations[max_age]
-
-
 def convert_bbox_to_z(bbox):
     """
     Takes a bounding box in the form [x1,y1,x2,y2] and returns z in the form
@@ -72,8 +62,14 @@ def speed_direction(bbox1, bbox2):
     return speed / norm
 
 
+def _diag(d):
+    # diagonal matrices of the last axis, one per w, h when they are arrays
+    d = np.stack(np.broadcast_arrays(*d), axis=-1).astype(float)
+    return d[..., None] * np.eye(d.shape[-1])
+
+
 def new_kf_process_noise(w, h, p=1 / 20, v=1 / 160):
-    Q = np.diag(
+    Q = _diag(
         ((p * w) ** 2, (p * h) ** 2, (p * w) ** 2, (p * h) ** 2, (v * w) ** 2, (v * h) ** 2, (v * w) ** 2, (v * h) ** 2)
     )
     return Q
@@ -82,20 +78,132 @@ def new_kf_process_noise(w, h, p=1 / 20, v=1 / 160):
 def new_kf_measurement_noise(w, h, m=1 / 20):
     w_var = (m * w) ** 2
     h_var = (m * h) ** 2
-    R = np.diag((w_var, h_var, w_var, h_var))
+    R = _diag((w_var, h_var, w_var, h_var))
     return R
 
 
+def kalman_filter(new_kf=True):
+    """
+    Filter of the tracks, with [x, y, w, h, x', y', w', h'] states if new_kf, whose noises
+    depend on the box sizes, else [x, y, s, r, x', y', s'] ones as in OC-SORT.
+    """
+    if new_kf:
+        F = np.array(
+            [
+                # x y w h x' y' w' h'
+                [1, 0, 0, 0, 1, 0, 0, 0],
+                [0, 1, 0, 0, 0, 1, 0, 0],
+                [0, 0, 1, 0, 0, 0, 1, 0],
+                [0, 0, 0, 1, 0, 0, 0, 1],
+                [0, 0, 0, 0, 1, 0, 0, 0],
+                [0, 0, 0, 0, 0, 1, 0, 0],
+                [0, 0, 0, 0, 0, 0, 1, 0],
+                [0, 0, 0, 0, 0, 0, 0, 1],
+            ]
+        )
+        H = np.array(
+            [
+                [1, 0, 0, 0, 0, 0, 0, 0],
+                [0, 1, 0, 0, 0, 0, 0, 0],
+                [0, 0, 1, 0, 0, 0, 0, 0],
+                [0, 0, 0, 1, 0, 0, 0, 0],
+            ]
+        )
+        # Process and measurement uncertainty happen in functions, these only serve the
+        # re-update of the tracks observed again
+        return BatchedKalmanFilter(F, H, np.eye(8), np.eye(4), np.eye(8))
+
+    F = np.array(
+        [
+            # x  y  s  r  x' y' s'
+            [1, 0, 0, 0, 1, 0, 0],
+            [0, 1, 0, 0, 0, 1, 0],
+            [0, 0, 1, 0, 0, 0, 1],
+            [0, 0, 0, 1, 0, 0, 0],
+            [0, 0, 0, 0, 1, 0, 0],
+            [0, 0, 0, 0, 0, 1, 0],
+            [0, 0, 0, 0, 0, 0, 1],
+        ]
+    )
+    H = np.array(
+        [
+            [1, 0, 0, 0, 0, 0, 0],
+            [0, 1, 0, 0, 0, 0, 0],
+            [0, 0, 1, 0, 0, 0, 0],
+            [0, 0, 0, 1, 0, 0, 0],
+        ]
+    )
+    R = np.eye(4)
+    R[2:, 2:] *= 10.0
+    P = np.eye(7)
+    P[4:, 4:] *= 1000.0  # give high uncertainty to the unobservable initial velocities
+    P *= 10.0
+    Q = np.eye(7)
+    Q[-1, -1] *= 0.01
+    Q[4:, 4:] *= 0.01
+    return BatchedKalmanFilter(F, H, Q, R, P)
+
+
+def predict_tracks(kf, tracks, new_kf=True):
+    """Predicts the state vectors of the tracks, all at once."""
+    if not tracks:
+        return
+    rows = [trk.row for trk in tracks]
+    x = kf.x
+    # Don't allow negative bounding boxes
+    if new_kf:
+        x[rows, 6] = np.where(x[rows, 2] + x[rows, 6] <= 0, 0.0, x[rows, 6])
+        x[rows, 7] = np.where(x[rows, 3] + x[rows, 7] <= 0, 0.0, x[rows, 7])
+
+        # Stop velocity, will update in kf during OOS
+        frozen = [trk.row for trk in tracks if trk.frozen]
+        x[frozen, 6:8] = 0
+        Q = new_kf_process_noise(x[rows, 2], x[rows, 3])
+    else:
+        x[rows, 6] = np.where(x[rows, 6] + x[rows, 2] <= 0, 0.0, x[rows, 6])
+        Q = None
+    kf.predict(rows, Q=Q)
+
+
+def apply_affine_correction(kf, tracks, affine, new_kf=True):
+    """Moves the state vectors of the tracks, and the frozen ones, by the camera motion."""
+    if not tracks:
+        return
+    m = affine[:, :2]
+    t = affine[:, 2]
+    if new_kf:
+        A = np.kron(np.eye(4, dtype=float), m)
+        A_z = np.kron(np.eye(2, dtype=float), m)
+        b = np.zeros(8)
+        b_z = np.zeros(4)
+    else:
+        # velocities of the center only, scale and aspect ratio are kept
+        A = np.eye(7)
+        A[:2, :2] = A[4:6, 4:6] = m
+        A_z = np.eye(4)
+        A_z[:2, :2] = m
+        b = np.zeros(7)
+        b_z = np.zeros(4)
+    b[:2] = b_z[:2] = t
+    kf.apply_affine_correction([trk.row for trk in tracks], A, b, A_z, b_z)
+
+
 class KalmanBoxTracker(object):
     """
     This class represents the internal state of individual tracked objects observed as bbox.
     """
 
     count = 0
+    __slots__ = (
+        'new_kf', 'conf', 'cls', 'det_ind', 'kf', 'bbox_to_z_func', 'x_to_bbox_func', 'row', 'time_since_update',
+        'id', 'history', 'hits', 'hit_streak', 'age', 'last_observation', 'observations', 'velocity', 'delta_t',
+        'history_observations', 'emb', 'frozen',
+    )
 
-    def __init__(self, det, delta_t=3, emb=None, alpha=0, new_kf=False):
+    def __init__(self, det, delta_t=3, emb=None, alpha=0, new_kf=False, kf=None, keep_history=False):
         """
-        Initialises a tracker using initial bounding box.
+        Initialises a tracker using initial bounding box. The predicted and observed boxes are
+        only recorded (history, history_observations) with keep_history, None otherwise.
 
         """
         # define constant velocity model
@@ -106,72 +214,26 @@ class KalmanBoxTracker(object):
         self.cls = det[5]
         self.det_ind = det[6]
 
+        # the filters of all the tracks of a tracker share one BatchedKalmanFilter
+        self.kf = kf if kf is not None else kalman_filter(new_kf)
         if new_kf:
-            self.kf = KalmanFilter(dim_x=8, dim_z=4)
-            self.kf.F = np.array(
-                [
-                    # x y w h x' y' w' h'
-                    [1, 0, 0, 0, 1, 0, 0, 0],
-                    [0, 1, 0, 0, 0, 1, 0, 0],
-                    [0, 0, 1, 0, 0, 0, 1, 0],
-                    [0, 0, 0, 1, 0, 0, 0, 1],
-                    [0, 0, 0, 0, 1, 0, 0, 0],
-                    [0, 0, 0, 0, 0, 1, 0, 0],
-                    [0, 0, 0, 0, 0, 0, 1, 0],
-                    [0, 0, 0, 0, 0, 0, 0, 1],
-                ]
-            )
-            self.kf.H = np.array(
-                [
-                    [1, 0, 0, 0, 0, 0, 0, 0],
-                    [0, 1, 0, 0, 0, 0, 0, 0],
-                    [0, 0, 1, 0, 0, 0, 0, 0],
-                    [0, 0, 0, 1, 0, 0, 0, 0],
-                ]
-            )
             _, _, w, h = convert_bbox_to_z_new(bbox).reshape(-1)
-            self.kf.P = new_kf_process_noise(w, h)
-            self.kf.P[:4, :4] *= 4
-            self.kf.P[4:, 4:] *= 100
-            # Process and measurement uncertainty happen in functions
+            P = new_kf_process_noise(w, h)
+            P[:4, :4] *= 4
+            P[4:, 4:] *= 100
             self.bbox_to_z_func = convert_bbox_to_z_new
             self.x_to_bbox_func = convert_x_to_bbox_new
         else:
-            self.kf = OCSortKalmanFilterAdapter(dim_x=7, dim_z=4)
-            self.kf.F = np.array(
-                [
-                    # x  y  s  r  x' y' s'
-                    [1, 0, 0, 0, 1, 0, 0],
-                    [0, 1, 0, 0, 0, 1, 0],
-                    [0, 0, 1, 0, 0, 0, 1],
-                    [0, 0, 0, 1, 0, 0, 0],
-                    [0, 0, 0, 0, 1, 0, 0],
-                    [0, 0, 0, 0, 0, 1, 0],
-                    [0, 0, 0, 0, 0, 0, 1],
-                ]
-            )
-            self.kf.H = np.array(
-                [
-                    [1, 0, 0, 0, 0, 0, 0],
-                    [0, 1, 0, 0, 0, 0, 0],
-                    [0, 0, 1, 0, 0, 0, 0],
-                    [0, 0, 0, 1, 0, 0, 0],
-                ]
-            )
-            self.kf.R[2:, 2:] *= 10.0
-            self.kf.P[4:, 4:] *= 1000.0  # give high uncertainty to the unobservable initial velocities
-            self.kf.P *= 10.0
-            self.kf.Q[-1, -1] *= 0.01
-            self.kf.Q[4:, 4:] *= 0.01
+            P = None
             self.bbox_to_z_func = convert_bbox_to_z
             self.x_to_bbox_func = convert_x_to_bbox
 
-        self.kf.x[:4] = self.bbox_to_z_func(bbox)
+        self.row = self.kf.add(self.bbox_to_z_func(bbox), P)
 
         self.time_since_update = 0
         self.id = KalmanBoxTracker.count
         KalmanBoxTracker.count += 1
-        self.history = deque([], maxlen=50)
+        self.history = deque([], maxlen=50) if keep_history else None
         self.hits = 0
         self.hit_streak = 0
         self.age = 0
@@ -183,13 +245,12 @@ class KalmanBoxTracker(object):
         """
         # Used for OCR
         self.last_observation = np.array([-1, -1, -1, -1, -1])  # placeholder
-        # Used to output track after min_hits reached
-        self.features = deque([], maxlen=50)
         # Used for velocity
-        self.observations = dict()
+        # observations of the last delta_t frames, by age
+        self.observations = ObservationHistory(delta_t + 1)
         self.velocity = None
         self.delta_t = delta_t
-        self.history_observations = deque([], maxlen=50)
+        self.history_observations = deque([], maxlen=50) if keep_history else None
 
         self.emb = emb
 
@@ -210,8 +271,8 @@ class KalmanBoxTracker(object):
             if self.last_observation.sum() >= 0:  # no previous observation
                 previous_box = None
                 for dt in range(self.delta_t, 0, -1):
-                    if self.age - dt in self.observations:
-                        previous_box = self.observations[self.age - dt]
+                    previous_box = self.observations.get(self.age - dt)
+                    if previous_box is not None:
                         break
                 if previous_box is None:
                     previous_box = self.last_observation
@@ -223,20 +284,20 @@ class KalmanBoxTracker(object):
               Insert new observations. This is a ugly way to maintain both self.observations
               and self.history_observations. Bear it for the moment.
             """
-            self.last_observation = bbox
-            self.observations[self.age] = bbox
-            self.history_observations.append(bbox)
+            self.last_observation = self.observations.add(self.age, bbox)
+            if self.history_observations is not None:
+                self.history_observations.append(bbox)
 
             self.time_since_update = 0
             self.hits += 1
             self.hit_streak += 1
             if self.new_kf:
-                R = new_kf_measurement_noise(self.kf.x[2, 0], self.kf.x[3, 0])
-                self.kf.update(self.bbox_to_z_func(bbox), R=R)
+                R = new_kf_measurement_noise(self.kf.x[self.row, 2], self.kf.x[self.row, 3])
+                self.kf.observe(self.row, self.bbox_to_z_func(bbox), R=R)
             else:
-                self.kf.update(self.bbox_to_z_func(bbox))
+                self.kf.observe(self.row, self.bbox_to_z_func(bbox))
         else:
-            self.kf.update(det)
+            self.kf.observe(self.row, det)
             self.frozen = True
 
     def update_emb(self, emb, alpha=0.9):
@@ -247,6 +308,10 @@ class KalmanBoxTracker(object):
         return self.emb
 
     def apply_affine_correction(self, affine):
+        """
+        Moves the observations by the camera motion, the state vector is moved by the
+        module level apply_affine_correction(), with the other tracks.
+        """
         m = affine[:, :2]
         t = affine[:, 2].reshape(2, 1)
         # For OCR
@@ -256,52 +321,34 @@ class KalmanBoxTracker(object):
             self.last_observation[:4] = ps.T.reshape(-1)
 
         # Apply to each box in the range of velocity computation
-        for dt in range(self.delta_t, -1, -1):
-            if self.age - dt in self.observations:
-                ps = self.observations[self.age - dt][:4].reshape(2, 2).T
-                ps = m @ ps + t
-                self.observations[self.age - dt][:4] = ps.T.reshape(-1)
-
-        # Also need to change kf state, but might be frozen
-        self.kf.apply_affine_correction(m, t, self.new_kf)
+        rows = self.observations.window(self.age - self.delta_t, self.age)
+        ps = self.observations.boxes[rows, :4].reshape(-1, 2, 2)
+        ps = ps @ m.T + t.T
+        self.observations.boxes[rows, :4] = ps.reshape(-1, 4)
 
     def predict(self):
         """
-        Advances the state vector and returns the predicted bounding box estimate.
+        Advances the track by a frame and returns the predicted bounding box estimate. The
+        state vector was already predicted by predict_tracks(), with the other tracks.
         """
-        # Don't allow negative bounding boxes
-        if self.new_kf:
-            if self.kf.x[2] + self.kf.x[6] <= 0:
-                self.kf.x[6] = 0
-            if self.kf.x[3] + self.kf.x[7] <= 0:
-                self.kf.x[7] = 0
-
-            # Stop velocity, will update in kf during OOS
-            if self.frozen:
-                self.kf.x[6] = self.kf.x[7] = 0
-            Q = new_kf_process_noise(self.kf.x[2, 0], self.kf.x[3, 0])
-        else:
-            if (self.kf.x[6] + self.kf.x[2]) <= 0:
-                self.kf.x[6] *= 0.0
-            Q = None
-
-        self.kf.predict(Q=Q)
         self.age += 1
         if self.time_since_update > 0:
             self.hit_streak = 0
         self.time_since_update += 1
-        self.history.append(self.x_to_bbox_func(self.kf.x))
-        return self.history[-1]
+        bbox = self.x_to_bbox_func(self.kf.x[self.row])
+        if self.history is not None:
+            self.history.append(bbox)
+        return bbox
 
     def get_state(self):
         """
         Returns the current bounding box estimate.
         """
-        return self.x_to_bbox_func(self.kf.x)
+        return self.x_to_bbox_func(self.kf.x[self.row])
 
     def mahalanobis(self, bbox):
         """Should be run after a predict() call for accuracy."""
-        return self.kf.md_for_measurement(self.bbox_to_z_func(bbox))
+        return self.kf.mahalanobis(self.row, self.bbox_to_z_func(bbox))
 
 
 class DeepOCSort(BaseTracker):
@@ -354,6 +401,24 @@ class DeepOCSort(BaseTracker):
         self.cmc_off = cmc_off
         self.aw_off = aw_off
         self.new_kf_off = new_kf_off
+        self.kf = kalman_filter(not new_kf_off)
+
+    def reset(self):
+        super().reset()
+        self.kf = kalman_filter(not self.new_kf_off)
+        KalmanBoxTracker.count = 1
+
+    def get_embs(self, dets, img):
+        """Features of the detections with a conf above det_thresh"""
+        if self.embedding_off:
+            return None
+        return self._reid_features(dets, img, dets[:, 4] > self.det_thresh)
+
+    def get_track_embs(self):
+        """Smoothed embedding of every active track, keyed by its output id"""
+        if self.embedding_off:
+            return None
+        return {trk.id: trk.get_emb() for trk in self._all_active_tracks()}
 
     @PerClassDecorator
     def update(self, dets, img, embs=None):
@@ -379,22 +444,23 @@ class DeepOCSort(BaseTracker):
         dets = np.hstack([dets, np.arange(len(dets)).reshape(-1, 1)])
         assert dets.shape[1] == 7
         remain_inds = scores > self.det_thresh
-        dets = dets[remain_inds]
 
         # appearance descriptor extraction
-        if self.embedding_off or dets.shape[0] == 0:
-            dets_embs = np.ones((dets.shape[0], 1))
-        elif embs is not None:
-            dets_embs = embs
+        if self.embedding_off or not remain_inds.any():
+            dets_embs = np.ones((remain_inds.sum(), 1))
         else:
-            # (Ndets x X) [512, 1024, 2048]
-            dets_embs = self.model.get_features(dets[:, 0:4], img)
+            if embs is None:
+                # (Ndets x X) [512, 1024, 2048]
+                embs = self.get_embs(dets, img)
+            dets_embs = embs[remain_inds]
+        dets = dets[remain_inds]
 
         # CMC
         if not self.cmc_off:
-            transform = self.cmc.apply(img, dets[:, :4])
+            transform = self.camera_motion(img, dets[:, :4])
             for trk in self.active_tracks:
                 trk.apply_affine_correction(transform)
+            apply_affine_correction(self.kf, self.active_tracks, transform, not self.new_kf_off)
 
         trust = (dets[:, 4] - self.det_thresh) / (1 - self.det_thresh)
         af = self.alpha_fixed_emb
@@ -406,6 +472,7 @@ class DeepOCSort(BaseTracker):
         trk_embs = []
         to_del = []
         ret = []
+        predict_tracks(self.kf, self.active_tracks, not self.new_kf_off)
         for t, trk in enumerate(trks):
             pos = self.active_tracks[t].predict()[0]
             trk[:] = [pos[0], pos[1], pos[2], pos[3], 0]
@@ -421,11 +488,13 @@ class DeepOCSort(BaseTracker):
             trk_embs = np.array(trk_embs)
 
         for t in reversed(to_del):
-            self.active_tracks.pop(t)
+            self.kf.release(self.active_tracks.pop(t).row)
 
         velocities = np.array([trk.velocity if trk.velocity is not None else np.array((0, 0)) for trk in self.active_tracks])
         last_boxes = np.array([trk.last_observation for trk in self.active_tracks])
-        k_observations = np.array([k_previous_obs(trk.observations, trk.age, self.delta_t) for trk in self.active_tracks])
+        k_observations = k_previous_obs(
+            [trk.observations for trk in self.active_tracks], [trk.age for trk in self.active_tracks], self.delta_t
+        )
 
         """
             First round of association
@@ -491,6 +560,8 @@ class DeepOCSort(BaseTracker):
 
         for m in unmatched_trks:
             self.active_tracks[m].update(None)
+        # the filters of the matched and unmatched tracks are updated together
+        self.kf.flush()
 
         # create and initialise new trackers for unmatched detections
         for i in unmatched_dets:
@@ -499,7 +570,9 @@ class DeepOCSort(BaseTracker):
                 delta_t=self.delta_t,
                 emb=dets_embs[i],
                 alpha=dets_alpha[i],
-                new_kf=not self.new_kf_off
+                new_kf=not self.new_kf_off,
+                kf=self.kf,
+                keep_history=self.keep_history,
             )
             self.active_tracks.append(trk)
         i = len(self.active_tracks)
@@ -518,7 +591,7 @@ class DeepOCSort(BaseTracker):
             i -= 1
             # remove dead tracklet
             if trk.time_since_update > self.max_age:
-                self.active_tracks.pop(i)
+                self.kf.release(self.active_tracks.pop(i).row)
         if len(ret) > 0:
             return np.concatenate(ret)
         return np.array([])
@@ -10,11 +10,13 @@ import numpy as np
 
 from src.yolo.boxmot.appearance.reid_auto_backend import ReidAutoBackend
 from src.yolo.boxmot.motion.cmc import get_cmc_method
+from src.yolo.boxmot.motion.kalman_filters.batched_kf import BatchedKalmanFilter
 from src.yolo.boxmot.trackers.hybridsort.association import (
     associate_4_points_with_score, associate_4_points_with_score_with_reid,
     cal_score_dif_batch_two_score, embedding_distance, linear_assignment)
 from src.yolo.boxmot.utils import PerClassDecorator
 from src.yolo.boxmot.utils.iou import get_asso_func
+from src.yolo.boxmot.utils.observations import ObservationHistory, k_previous_obs
 from src.yolo.boxmot.trackers.basetracker import BaseTracker
 from src.yolo.boxmot.utils import PerClassDecorator
 
@@ -22,17 +24,6 @@ from src.yolo.boxmot.utils import PerClassDecorator
 np.random.seed(0)
 
 
-def k_previous_obs(observations, cur_age, k):
-    if len(observations) == 0:
-        return [-1, -1, -1, -1, -1]
-    for i in range(k):
-        dt = k - i
-        if cur_age - dt in observations:
-            return observations[cur_age - dt]
-    max_age = max(observations.keys())
-    return observations[max_age]
-
-
 def convert_bbox_to_z(bbox):
     """
     Takes a bounding box in the form [x1,y1,x2,y2] and returns z in the form
@@ -111,6 +102,12 @@ class KalmanBoxTracker(object):
     This class represents the internal state of individual tracked objects observed as bbox.
     """
     count = 0
+    __slots__ = (
+        'kf', 'row', 'time_since_update', 'id', 'history', 'hits', 'hit_streak', 'age', 'conf', 'cls', 'det_ind',
+        'adapfs', 'last_observation', 'last_observation_save', 'observations', 'history_observations',
+        'velocity_lt', 'velocity_rt', 'velocity_lb', 'velocity_rb', 'delta_t', 'confidence_pre', 'confidence',
+        'smooth_feat', 'curr_feat', 'features', 'alpha',
+    )
 
     def __init__(
         self,
@@ -122,46 +119,24 @@ class KalmanBoxTracker(object):
         orig=False,
         buffer_size=30,
         longterm_bank_length=30,
-        alpha=0.8
+        alpha=0.8,
+        kf=None,
+        keep_history=False
     ):     # 'temp_feat' and 'buffer_size' for reid feature
         """
-        Initialises a tracker using initial bounding box.
+        Initialises a tracker using initial bounding box. The predicted and observed boxes are
+        only recorded (history, history_observations) with keep_history, None otherwise.
 
         """
         # define constant velocity model
-        # if not orig and not args.kalman_GPR:
-        from src.yolo.boxmot.motion.kalman_filters.hybridsort_kf import KalmanFilter
-        self.kf = KalmanFilter(dim_x=9, dim_z=5)
-
-        # u, v, s, c, r, ~u, ~v, ~s, ~c
-        self.kf.F = np.array([[1, 0, 0, 0, 0, 1, 0, 0, 0],
-                              [0, 1, 0, 0, 0, 0, 1, 0, 0],
-                              [0, 0, 1, 0, 0, 0, 0, 1, 0],
-                              [0, 0, 0, 1, 0, 0, 0, 0, 1],
-                              [0, 0, 0, 0, 1, 0, 0, 0, 0],
-                              [0, 0, 0, 0, 0, 1, 0, 0, 0],
-                              [0, 0, 0, 0, 0, 0, 1, 0, 0],
-                              [0, 0, 0, 0, 0, 0, 0, 1, 0],
-                              [0, 0, 0, 0, 0, 0, 0, 0, 1]])
-        self.kf.H = np.array([[1, 0, 0, 0, 0, 0, 0, 0, 0],
-                              [0, 1, 0, 0, 0, 0, 0, 0, 0],
-                              [0, 0, 1, 0, 0, 0, 0, 0, 0],
-                              [0, 0, 0, 1, 0, 0, 0, 0, 0],
-                              [0, 0, 0, 0, 1, 0, 0, 0, 0]])
-
-        self.kf.R[2:, 2:] *= 10.
-        self.kf.P[5:, 5:] *= 1000.  # give high uncertainty to the unobservable initial velocities
-        self.kf.P *= 10.
-        self.kf.Q[-1, -1] *= 0.01
-        self.kf.Q[-2, -2] *= 0.01
-        self.kf.Q[5:, 5:] *= 0.01
-
-        self.kf.x[:5] = convert_bbox_to_z(bbox)
+        # the filters of all the tracks of a tracker share one BatchedKalmanFilter
+        self.kf = kf if kf is not None else kalman_filter()
+        self.row = self.kf.add(convert_bbox_to_z(bbox))
 
         self.time_since_update = 0
         self.id = KalmanBoxTracker.count
         KalmanBoxTracker.count += 1
-        self.history = deque([], maxlen=50)
+        self.history = deque([], maxlen=50) if keep_history else None
         self.hits = 0
         self.hit_streak = 0
         self.age = 0
@@ -177,8 +152,9 @@ class KalmanBoxTracker(object):
         """
         self.last_observation = np.array([-1, -1, -1, -1, -1])  # placeholder
         self.last_observation_save = np.array([-1, -1, -1, -1, -1])
-        self.observations = dict()
-        self.history_observations = deque([], maxlen=50)
+        # observations of the last delta_t frames, by age
+        self.observations = ObservationHistory(delta_t + 1)
+        self.history_observations = deque([], maxlen=50) if keep_history else None
         self.velocity_lt = None
         self.velocity_rt = None
         self.velocity_lb = None
@@ -223,12 +199,12 @@ class KalmanBoxTracker(object):
         ----------
         warp_matrix: warp matrix computed by ECC.
         """
-        x1, y1, x2, y2, s = convert_x_to_bbox(self.kf.x)[0]
+        x1, y1, x2, y2, s = convert_x_to_bbox(self.kf.x[self.row])[0]
         x1_, y1_ = warp_matrix @ np.array([x1, y1, 1]).T
         x2_, y2_ = warp_matrix @ np.array([x2, y2, 1]).T
         # w, h = x2_ - x1_, y2_ - y1_
         # cx, cy = x1_ + w / 2, y1_ + h / 2
-        self.kf.x[:5] = convert_bbox_to_z([x1_, y1_, x2_, y2_, s])
+        self.kf.x[self.row, :5] = convert_bbox_to_z([x1_, y1_, x2_, y2_, s]).reshape(-1)
 
     def update(self, bbox, cls, det_ind, id_feature, update_feature=True):
         """
@@ -247,7 +223,7 @@ class KalmanBoxTracker(object):
                 for i in range(self.delta_t):
                     # dt = self.delta_t - i
                     if self.age - i - 1 in self.observations:
-                        previous_box = self.observations[self.age - i - 1]
+                        previous_box = self.observations.get(self.age - i - 1)
                         if velocity_lt is not None:
                             velocity_lt += speed_direction_lt(previous_box, bbox)
                             velocity_rt += speed_direction_rt(previous_box, bbox)
@@ -274,16 +250,18 @@ class KalmanBoxTracker(object):
               Insert new observations. This is a ugly way to maintain both self.observations
               and self.history_observations. Bear it for the moment.
             """
-            self.last_observation = bbox
-            self.last_observation_save = bbox
-            self.observations[self.age] = bbox
-            self.history_observations.append(bbox)
+            # the row of the history, a view of bbox would keep all the detections of its frame
+            self.last_observation = self.observations.add(self.age, bbox)
+            self.last_observation_save = self.last_observation
+            if self.history_observations is not None:
+                self.history_observations.append(bbox)
 
             self.time_since_update = 0
-            self.history = []
+            if self.history is not None:
+                self.history.clear()
             self.hits += 1
             self.hit_streak += 1
-            self.kf.update(convert_bbox_to_z(bbox))
+            self.kf.observe(self.row, convert_bbox_to_z(bbox))
             # add interface for update feature or not
             if update_feature:
                 if self.adapfs:
@@ -293,32 +271,32 @@ class KalmanBoxTracker(object):
             self.confidence_pre = self.confidence
             self.confidence = bbox[4]
         else:
-            self.kf.update(bbox)
+            self.kf.observe(self.row, bbox)
             self.confidence_pre = None
 
     def predict(self, track_thresh=0.6):
         """
-        Advances the state vector and returns the predicted bounding box estimate.
+        Advances the track by a frame and returns the predicted bounding box estimate. The
+        state vector was already predicted by predict_tracks(), with the other tracks.
         """
-        if ((self.kf.x[7] + self.kf.x[2]) <= 0):
-            self.kf.x[7] *= 0.0
-
-        self.kf.predict()
+        x = self.kf.x[self.row]
         self.age += 1
         if (self.time_since_update > 0):
             self.hit_streak = 0
         self.time_since_update += 1
-        self.history.append(convert_x_to_bbox(self.kf.x))
+        bbox = convert_x_to_bbox(x)
+        if self.history is not None:
+            self.history.append(bbox)
         if not self.confidence_pre:
             return (
-                self.history[-1],
-                np.clip(self.kf.x[3], track_thresh, 1.0),
+                bbox,
+                np.clip(x[3:4], track_thresh, 1.0),
                 np.clip(self.confidence, 0.1, track_thresh)
             )
         else:
             return (
-                self.history[-1],
-                np.clip(self.kf.x[3], track_thresh, 1.0),
+                bbox,
+                np.clip(x[3:4], track_thresh, 1.0),
                 np.clip(self.confidence - (self.confidence_pre - self.confidence), 0.1, track_thresh)
             )
 
@@ -326,7 +304,47 @@ class KalmanBoxTracker(object):
         """
         Returns the current bounding box estimate.
         """
-        return convert_x_to_bbox(self.kf.x)
+        return convert_x_to_bbox(self.kf.x[self.row])
+
+
+def kalman_filter():
+    """Constant velocity filter of the [u, v, s, c, r, ~u, ~v, ~s, ~c] states of the tracks."""
+    # u, v, s, c, r, ~u, ~v, ~s, ~c
+    F = np.array([[1, 0, 0, 0, 0, 1, 0, 0, 0],
+                  [0, 1, 0, 0, 0, 0, 1, 0, 0],
+                  [0, 0, 1, 0, 0, 0, 0, 1, 0],
+                  [0, 0, 0, 1, 0, 0, 0, 0, 1],
+                  [0, 0, 0, 0, 1, 0, 0, 0, 0],
+                  [0, 0, 0, 0, 0, 1, 0, 0, 0],
+                  [0, 0, 0, 0, 0, 0, 1, 0, 0],
+                  [0, 0, 0, 0, 0, 0, 0, 1, 0],
+                  [0, 0, 0, 0, 0, 0, 0, 0, 1]])
+    H = np.array([[1, 0, 0, 0, 0, 0, 0, 0, 0],
+                  [0, 1, 0, 0, 0, 0, 0, 0, 0],
+                  [0, 0, 1, 0, 0, 0, 0, 0, 0],
+                  [0, 0, 0, 1, 0, 0, 0, 0, 0],
+                  [0, 0, 0, 0, 1, 0, 0, 0, 0]])
+
+    R = np.eye(5)
+    R[2:, 2:] *= 10.
+    P = np.eye(9)
+    P[5:, 5:] *= 1000.  # give high uncertainty to the unobservable initial velocities
+    P *= 10.
+    Q = np.eye(9)
+    Q[-1, -1] *= 0.01
+    Q[-2, -2] *= 0.01
+    Q[5:, 5:] *= 0.01
+    return BatchedKalmanFilter(F, H, Q, R, P)
+
+
+def predict_tracks(kf, tracks):
+    """Predicts the state vectors of the tracks, all at once."""
+    if not tracks:
+        return
+    rows = [trk.row for trk in tracks]
+    x = kf.x
+    x[rows, 7] = np.where(x[rows, 7] + x[rows, 2] <= 0, 0.0, x[rows, 7])
+    kf.predict(rows)
 
 
 class HybridSORT(BaseTracker):
@@ -362,6 +380,7 @@ class HybridSORT(BaseTracker):
         self.TCM_byte_step_weight = 1.0
         self.dataset = 'dancetrack'
         self.ECC = False
+        self.kf = kalman_filter()
         KalmanBoxTracker.count = 0
 
         rab = ReidAutoBackend(
@@ -374,6 +393,19 @@ class HybridSORT(BaseTracker):
         for tracker in trackers:
             tracker.camera_update(warp_matrix)
 
+    def reset(self):
+        super().reset()
+        self.kf = kalman_filter()
+        KalmanBoxTracker.count = 0
+
+    def get_embs(self, dets, img):
+        """Features of all the detections, both association stages use them"""
+        return self.model.get_features(dets[:, 0:4], img)
+
+    def get_track_embs(self):
+        """Smoothed features of the active tracks that have any, keyed by their output id"""
+        return {trk.id + 1: trk.smooth_feat for trk in self._all_active_tracks() if trk.smooth_feat is not None}
+
     @PerClassDecorator
     def update(self, dets, im, embs=None):
         """
@@ -388,7 +420,7 @@ class HybridSORT(BaseTracker):
             return np.empty((0, 7))
 
         if self.ECC:
-            warp_matrix = self.cmc.apply(im, dets)
+            warp_matrix = self.camera_motion(im, dets)
             if warp_matrix is not None:
                 self.camera_update(self.active_tracks, warp_matrix)
 
@@ -396,7 +428,7 @@ class HybridSORT(BaseTracker):
         scores = dets[:, 4]
         bboxes = dets[:, :4]
 
-        dets_embs = self.model.get_features(bboxes, im)
+        dets_embs = embs if embs is not None else self.get_embs(dets, im)
         dets0 = np.concatenate((dets, np.expand_dims(scores, axis=-1)), axis=1)
         dets = np.concatenate((bboxes, np.expand_dims(scores, axis=-1)), axis=1)
         inds_low = scores > self.low_thresh
@@ -411,6 +443,7 @@ class HybridSORT(BaseTracker):
         trks = np.zeros((len(self.active_tracks), 8))
         to_del = []
         ret = []
+        predict_tracks(self.kf, self.active_tracks)
         for t, trk in enumerate(trks):
             pos, kalman_score, simple_score = self.active_tracks[t].predict()
             trk[:6] = [pos[0][0], pos[0][1], pos[0][2], pos[0][3], kalman_score[0], simple_score]
@@ -418,7 +451,7 @@ class HybridSORT(BaseTracker):
                 to_del.append(t)
         trks = np.ma.compress_rows(np.ma.masked_invalid(trks))
         for t in reversed(to_del):
-            self.active_tracks.pop(t)
+            self.kf.release(self.active_tracks.pop(t).row)
 
         velocities_lt = np.array(
             [trk.velocity_lt if trk.velocity_lt is not None else np.array((0, 0)) for trk in self.active_tracks])
@@ -429,8 +462,8 @@ class HybridSORT(BaseTracker):
         velocities_rb = np.array(
             [trk.velocity_rb if trk.velocity_rb is not None else np.array((0, 0)) for trk in self.active_tracks])
         last_boxes = np.array([trk.last_observation for trk in self.active_tracks])
-        k_observations = np.array(
-            [k_previous_obs(trk.observations, trk.age, self.delta_t) for trk in self.active_tracks])
+        k_observations = k_previous_obs(
+            [trk.observations for trk in self.active_tracks], [trk.age for trk in self.active_tracks], self.delta_t)
 
         """
             First round of association
@@ -548,10 +581,15 @@ class HybridSORT(BaseTracker):
 
         for m in unmatched_trks:
             self.active_tracks[m].update(None, None, None, None)
+        # the filters of the matched and unmatched tracks are updated together
+        self.kf.flush()
 
         # create and initialise new trackers for unmatched detections
         for i in unmatched_dets:
-            trk = KalmanBoxTracker(dets[i, :], dets0[i, 5], dets0[i, 6], id_feature_keep[i, :], delta_t=self.delta_t)
+            trk = KalmanBoxTracker(
+                dets[i, :], dets0[i, 5], dets0[i, 6], id_feature_keep[i, :], delta_t=self.delta_t, kf=self.kf,
+                keep_history=self.keep_history
+            )
             self.active_tracks.append(trk)
         i = len(self.active_tracks)
         for trk in reversed(self.active_tracks):
@@ -569,7 +607,7 @@ class HybridSORT(BaseTracker):
             i -= 1
             # remove dead tracklet
             if (trk.time_since_update > self.max_age):
-                self.active_tracks.pop(i)
+                self.kf.release(self.active_tracks.pop(i).row)
         if (len(ret) > 0):
             return np.concatenate(ret)
         return np.empty((0, 7))
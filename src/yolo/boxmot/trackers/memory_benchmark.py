@@ -0,0 +1,147 @@
+# Mikel Broström 🔥 Yolo Tracking 🧾 AGPL-3.0 license
+
+"""
+Memory taken by the tracks of the motion only trackers on a long, crowded synthetic
+sequence, with and without the box histories only the visualization needs (keep_history):
+
+    python -m src.yolo.boxmot.trackers.memory_benchmark --people 150 --frames 2000
+
+The trackers with a ReID model (DeepOCSort, HybridSORT, StrongSORT, BoTSORT with ReID)
+need its weights and are left out, BoTSORT runs without ReID.
+"""
+
+import argparse
+import gc
+import sys
+import time
+import types
+
+import numpy as np
+
+from src.yolo.boxmot.trackers.botsort.bot_sort import BoTSORT
+from src.yolo.boxmot.trackers.bytetrack.byte_tracker import BYTETracker
+from src.yolo.boxmot.trackers.ocsort.ocsort import OCSort
+
+TRACKERS = {
+    'ocsort': lambda: OCSort(),
+    'bytetrack': lambda: BYTETracker(),
+    'botsort': lambda: BoTSORT(None, 'cpu', False, with_reid=False),
+}
+
+
+def crowded_sequence(people=150, frames=2000, size=(1920, 1080), seed=0):
+    """
+    Detections (x1, y1, x2, y2, conf, cls) of people walking across the frame, each one
+    for 100 to 600 frames before somebody new takes their place, and missed 10% of the time.
+    """
+    rng = np.random.default_rng(seed)
+    w, h = size
+
+    def spawn(n):
+        return (
+            rng.uniform([0, 0], [w, h], (n, 2)),
+            rng.normal(0, 2, (n, 2)),
+            rng.uniform([20, 50], [60, 160], (n, 2)),
+            rng.integers(100, 600, n),
+        )
+
+    pos, vel, wh, left = spawn(people)
+    for _ in range(frames):
+        pos += vel + rng.normal(0, 0.5, pos.shape)
+        left -= 1
+        gone = left <= 0
+        if gone.any():
+            pos[gone], vel[gone], wh[gone], left[gone] = spawn(gone.sum())
+
+        seen = rng.random(people) > 0.1
+        xy = pos[seen] + rng.normal(0, 1, (seen.sum(), 2))
+        half = wh[seen] * rng.uniform(0.95, 1.05, (seen.sum(), 2)) / 2
+        yield np.column_stack([xy - half, xy + half, rng.uniform(0.5, 0.95, seen.sum()), np.zeros(seen.sum())])
+
+
+def _held_tracks(tracker):
+    """The track objects kept by a tracker, active and lost (and removed, for BoTSORT and ByteTrack)."""
+    tracks = {}
+    for name in ('active_tracks', 'lost_stracks', 'removed_stracks'):
+        for t in getattr(tracker, name, []):
+            tracks[id(t)] = t
+    return list(tracks.values())
+
+
+def memory_size(objs):
+    """
+    Bytes taken by objs and everything they reference, each object counted once, with the
+    buffers the numpy views keep alive. Classes, functions and modules are left out, they
+    are shared by the whole program.
+    """
+    shared = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+    seen = set()
+    size = 0
+    todo = list(objs)
+    while todo:
+        obj = todo.pop()
+        if id(obj) in seen or isinstance(obj, shared):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, np.ndarray):
+            if obj.base is not None:
+                todo.append(obj.base)
+        else:
+            todo.extend(gc.get_referents(obj))
+    return size
+
+
+def benchmark(tracker_name, keep_history, people=150, frames=2000, seed=0):
+    """
+    Runs a tracker on crowded_sequence() and measures the memory its tracks take at the end,
+    the filter bank of the OC-SORT trackers included.
+
+    :return: dict of the tracks held at the end, the memory they take (MB) and per track
+        (bytes), and the run time (s)
+    """
+    tracker = TRACKERS[tracker_name]()
+    tracker.keep_history = keep_history
+    img = np.zeros((1080, 1920, 3), dtype=np.uint8)
+
+    t = time.perf_counter()
+    for dets in crowded_sequence(people, frames, seed=seed):
+        tracker.update(dets, img)
+    elapsed = time.perf_counter() - t
+
+    tracks = _held_tracks(tracker)
+    memory = memory_size(tracks)
+    return {
+        'tracker': tracker_name,
+        'keep_history': keep_history,
+        'tracks': len(tracks),
+        'memory_mb': memory / 2 ** 20,
+        'bytes_per_track': memory / max(len(tracks), 1),
+        'time_s': elapsed,
+    }
+
+
+def print_results(results):
+    print(f"{'tracker':<11}{'history':>8}{'tracks':>8}{'memory':>11}{'per track':>11}{'time':>8}")
+    for r in results:
+        print(f"{r['tracker']:<11}{str(r['keep_history']):>8}{r['tracks']:>8}"
+              f"{r['memory_mb']:>9.2f}MB{r['bytes_per_track']:>10.0f}B{r['time_s']:>7.1f}s")
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser(description="Memory per track of the trackers")
+    parser.add_argument('--tracker', nargs='+', default=list(TRACKERS),
+                        help=f'trackers, of {list(TRACKERS)}')
+    parser.add_argument('--people', type=int, default=150,
+                        help='people in the frame at any time')
+    parser.add_argument('--frames', type=int, default=2000,
+                        help='length of the sequence')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    opt = parse_opt()
+    print_results([
+        benchmark(name, keep_history, opt.people, opt.frames)
+        for name in opt.tracker for keep_history in (True, False)
+    ])
@@ -7,25 +7,15 @@ import numpy as np
 from collections import deque
 
 
-from src.yolo.boxmot.motion.kalman_filters.ocsort_kf import KalmanFilter
+from src.yolo.boxmot.motion.kalman_filters.batched_kf import BatchedKalmanFilter
 from src.yolo.boxmot.utils.association import associate, linear_assignment
 from src.yolo.boxmot.utils.iou import get_asso_func
 from src.yolo.boxmot.utils.iou import run_asso_func
+from src.yolo.boxmot.utils.observations import ObservationHistory, k_previous_obs
 from src.yolo.boxmot.trackers.basetracker import BaseTracker
 from src.yolo.boxmot.utils import PerClassDecorator
 
 
-def k_previous_obs(observations, cur_age, k):
-    if len(observations) == 0:
-        return [-1, -1, -1, -1, -1]
-    for i in range(k):
-        dt = k - i
-        if cur_age - dt in observations:
-            return observations[cur_age - dt]
-    max_age = max(observations.keys())
-    return observations[max_age]
-
-
 def convert_bbox_to_z(bbox):
     """
     Takes a bounding box in the form [x1,y1,x2,y2] and returns z in the form
@@ -72,48 +62,26 @@ class KalmanBoxTracker(object):
     """
 
     count = 0
+    __slots__ = (
+        'det_ind', 'kf', 'row', 'time_since_update', 'id', 'history', 'hits', 'hit_streak', 'age', 'conf',
+        'cls', 'last_observation', 'observations', 'history_observations', 'velocity', 'delta_t',
+    )
 
-    def __init__(self, bbox, cls, det_ind, delta_t=3):
+    def __init__(self, bbox, cls, det_ind, delta_t=3, kf=None, keep_history=False):
         """
-        Initialises a tracker using initial bounding box.
+        Initialises a tracker using initial bounding box. The predicted and observed boxes are
+        only recorded (history, history_observations) with keep_history, None otherwise.
 
         """
         # define constant velocity model
         self.det_ind = det_ind
-        self.kf = KalmanFilter(dim_x=7, dim_z=4)
-        self.kf.F = np.array(
-            [
-                [1, 0, 0, 0, 1, 0, 0],
-                [0, 1, 0, 0, 0, 1, 0],
-                [0, 0, 1, 0, 0, 0, 1],
-                [0, 0, 0, 1, 0, 0, 0],
-                [0, 0, 0, 0, 1, 0, 0],
-                [0, 0, 0, 0, 0, 1, 0],
-                [0, 0, 0, 0, 0, 0, 1],
-            ]
-        )
-        self.kf.H = np.array(
-            [
-                [1, 0, 0, 0, 0, 0, 0],
-                [0, 1, 0, 0, 0, 0, 0],
-                [0, 0, 1, 0, 0, 0, 0],
-                [0, 0, 0, 1, 0, 0, 0],
-            ]
-        )
-
-        self.kf.R[2:, 2:] *= 10.0
-        self.kf.P[
-            4:, 4:
-        ] *= 1000.0  # give high uncertainty to the unobservable initial velocities
-        self.kf.P *= 10.0
-        self.kf.Q[-1, -1] *= 0.01
-        self.kf.Q[4:, 4:] *= 0.01
-
-        self.kf.x[:4] = convert_bbox_to_z(bbox)
+        # the filters of all the tracks of a tracker share one BatchedKalmanFilter
+        self.kf = kf if kf is not None else kalman_filter()
+        self.row = self.kf.add(convert_bbox_to_z(bbox))
         self.time_since_update = 0
         self.id = KalmanBoxTracker.count
         KalmanBoxTracker.count += 1
-        self.history = deque([], maxlen=50)
+        self.history = deque([], maxlen=50) if keep_history else None
         self.hits = 0
         self.hit_streak = 0
         self.age = 0
@@ -126,8 +94,9 @@ class KalmanBoxTracker(object):
         let's bear it for now.
         """
         self.last_observation = np.array([-1, -1, -1, -1, -1])  # placeholder
-        self.observations = dict()
-        self.history_observations = deque([], maxlen=50)
+        # observations of the last delta_t frames, by age
+        self.observations = ObservationHistory(delta_t + 1)
+        self.history_observations = deque([], maxlen=50) if keep_history else None
         self.velocity = None
         self.delta_t = delta_t
 
@@ -143,8 +112,8 @@ class KalmanBoxTracker(object):
                 previous_box = None
                 for i in range(self.delta_t):
                     dt = self.delta_t - i
-                    if self.age - dt in self.observations:
-                        previous_box = self.observations[self.age - dt]
+                    previous_box = self.observations.get(self.age - dt)
+                    if previous_box is not None:
                         break
                 if previous_box is None:
                     previous_box = self.last_observation
@@ -157,37 +126,81 @@ class KalmanBoxTracker(object):
               Insert new observations. This is a ugly way to maintain both self.observations
               and self.history_observations. Bear it for the moment.
             """
-            self.last_observation = bbox
-            self.observations[self.age] = bbox
-            self.history_observations.append(bbox)
+            # the row of the history, a view of bbox would keep all the detections of its frame
+            self.last_observation = self.observations.add(self.age, bbox)
+            if self.history_observations is not None:
+                self.history_observations.append(bbox)
 
             self.time_since_update = 0
             self.hits += 1
             self.hit_streak += 1
-            self.kf.update(convert_bbox_to_z(bbox))
+            self.kf.observe(self.row, convert_bbox_to_z(bbox))
         else:
-            self.kf.update(bbox)
+            self.kf.observe(self.row, bbox)
 
     def predict(self):
         """
-        Advances the state vector and returns the predicted bounding box estimate.
+        Advances the track by a frame and returns the predicted bounding box estimate. The
+        state vector was already predicted by predict_tracks(), with the other tracks.
         """
-        if (self.kf.x[6] + self.kf.x[2]) <= 0:
-            self.kf.x[6] *= 0.0
-
-        self.kf.predict()
         self.age += 1
         if self.time_since_update > 0:
             self.hit_streak = 0
         self.time_since_update += 1
-        self.history.append(convert_x_to_bbox(self.kf.x))
-        return self.history[-1]
+        bbox = convert_x_to_bbox(self.kf.x[self.row])
+        if self.history is not None:
+            self.history.append(bbox)
+        return bbox
 
     def get_state(self):
         """
         Returns the current bounding box estimate.
         """
-        return convert_x_to_bbox(self.kf.x)
+        return convert_x_to_bbox(self.kf.x[self.row])
+
+
+def kalman_filter():
+    """Constant velocity filter of the [x, y, s, r, x', y', s'] states of the tracks."""
+    F = np.array(
+        [
+            [1, 0, 0, 0, 1, 0, 0],
+            [0, 1, 0, 0, 0, 1, 0],
+            [0, 0, 1, 0, 0, 0, 1],
+            [0, 0, 0, 1, 0, 0, 0],
+            [0, 0, 0, 0, 1, 0, 0],
+            [0, 0, 0, 0, 0, 1, 0],
+            [0, 0, 0, 0, 0, 0, 1],
+        ]
+    )
+    H = np.array(
+        [
+            [1, 0, 0, 0, 0, 0, 0],
+            [0, 1, 0, 0, 0, 0, 0],
+            [0, 0, 1, 0, 0, 0, 0],
+            [0, 0, 0, 1, 0, 0, 0],
+        ]
+    )
+
+    R = np.eye(4)
+    R[2:, 2:] *= 10.0
+    P = np.eye(7)
+    P[4:, 4:] *= 1000.0  # give high uncertainty to the unobservable initial velocities
+    P *= 10.0
+    Q = np.eye(7)
+    Q[-1, -1] *= 0.01
+    Q[4:, 4:] *= 0.01
+    return BatchedKalmanFilter(F, H, Q, R, P)
+
+
+def predict_tracks(kf, tracks):
+    """Predicts the state vectors of the tracks, all at once."""
+    if not tracks:
+        return
+    rows = [trk.row for trk in tracks]
+    x = kf.x
+    # don't allow negative scales
+    x[rows, 6] = np.where(x[rows, 6] + x[rows, 2] <= 0, 0.0, x[rows, 6])
+    kf.predict(rows)
 
 
 class OCSort(BaseTracker):
@@ -217,6 +230,12 @@ class OCSort(BaseTracker):
         self.asso_func = get_asso_func(asso_func)
         self.inertia = inertia
         self.use_byte = use_byte
+        self.kf = kalman_filter()
+        KalmanBoxTracker.count = 0
+
+    def reset(self):
+        super().reset()
+        self.kf = kalman_filter()
         KalmanBoxTracker.count = 0
 
     @PerClassDecorator
@@ -259,6 +278,7 @@ class OCSort(BaseTracker):
         trks = np.zeros((len(self.active_tracks), 5))
         to_del = []
         ret = []
+        predict_tracks(self.kf, self.active_tracks)
         for t, trk in enumerate(trks):
             pos = self.active_tracks[t].predict()[0]
             trk[:] = [pos[0], pos[1], pos[2], pos[3], 0]
@@ -266,7 +286,7 @@ class OCSort(BaseTracker):
                 to_del.append(t)
         trks = np.ma.compress_rows(np.ma.masked_invalid(trks))
         for t in reversed(to_del):
-            self.active_tracks.pop(t)
+            self.kf.release(self.active_tracks.pop(t).row)
 
         velocities = np.array(
             [
@@ -275,11 +295,10 @@ class OCSort(BaseTracker):
             ]
         )
         last_boxes = np.array([trk.last_observation for trk in self.active_tracks])
-        k_observations = np.array(
-            [
-                k_previous_obs(trk.observations, trk.age, self.delta_t)
-                for trk in self.active_tracks
-            ]
+        k_observations = k_previous_obs(
+            [trk.observations for trk in self.active_tracks],
+            [trk.age for trk in self.active_tracks],
+            self.delta_t,
         )
 
         """
@@ -351,10 +370,14 @@ class OCSort(BaseTracker):
 
         for m in unmatched_trks:
             self.active_tracks[m].update(None, None, None)
+        # the filters of the matched and unmatched tracks are updated together
+        self.kf.flush()
 
         # create and initialise new trackers for unmatched detections
         for i in unmatched_dets:
-            trk = KalmanBoxTracker(dets[i, :5], dets[i, 5], dets[i, 6], delta_t=self.delta_t)
+            trk = KalmanBoxTracker(
+                dets[i, :5], dets[i, 5], dets[i, 6], delta_t=self.delta_t, kf=self.kf, keep_history=self.keep_history
+            )
             self.active_tracks.append(trk)
         i = len(self.active_tracks)
         for trk in reversed(self.active_tracks):
@@ -378,7 +401,7 @@ class OCSort(BaseTracker):
             i -= 1
             # remove dead tracklet
             if trk.time_since_update > self.max_age:
-                self.active_tracks.pop(i)
+                self.kf.release(self.active_tracks.pop(i).row)
         if len(ret) > 0:
             return np.concatenate(ret)
         return np.array([])
@@ -64,9 +64,17 @@ class Track:
     features : List[ndarray]
         A cache of features. On each measurement update, the associated feature
         vector is added to this list.
+    kf : KalmanFilter
+        The Kalman filter of the tracks, stateless and shared by all of them.
 
     """
 
+    kf = KalmanFilter()
+    __slots__ = (
+        'id', 'bbox', 'conf', 'cls', 'det_ind', 'hits', 'age', 'time_since_update', 'ema_alpha', 'state',
+        'features', '_n_init', '_max_age', 'mean', 'covariance',
+    )
+
     def __init__(
         self,
         detection,
@@ -94,7 +102,6 @@ class Track:
         self._n_init = n_init
         self._max_age = max_age
 
-        self.kf = KalmanFilter()
         self.mean, self.covariance = self.kf.initiate(self.bbox)
 
     def to_tlwh(self):
@@ -42,6 +42,27 @@ class StrongSORT(object):
         )
         self.cmc = get_cmc_method('ecc')()
 
+    def reset(self):
+        """
+        Drops all tracks and gallery samples, keeping the loaded ReID model.
+        """
+        self.tracker.tracks = []
+        self.tracker._next_id = 1
+        self.tracker.metric.samples = {}
+        self.tracker.cmc.reset()
+        self.cmc.reset()
+
+    def get_track_embs(self):
+        """
+        Smoothed features of the confirmed tracks, keyed by their output id, as computed by
+        the ReID model while tracking.
+        """
+        return {
+            track.id: track.features[-1]
+            for track in self.tracker.tracks
+            if track.is_confirmed() and track.features
+        }
+
     @PerClassDecorator
     def update(self, dets, img, embs=None):
         assert isinstance(
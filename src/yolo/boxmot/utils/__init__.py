@@ -22,62 +22,65 @@ logger.add(sys.stderr, colorize=True, level="INFO")
 
 
 class PerClassDecorator:
+    """
+    Runs the decorated update of a tracker once per class of the frame when its per_class is
+    set, only for the classes with detections or with tracks left from earlier frames. The
+    tracks of every class are kept in instance.per_class_state, keyed by class, and the
+    attributes of instance.per_class_attributes are swapped in for the update of their class.
+    The appearance features (get_embs) and the camera motion (camera_motion) of the frame are
+    computed once, for all its detections, and shared by the updates of its classes.
+    """
+
     def __init__(self, method):
         # Store the method that will be decorated
         self.update = method
-        self.nr_classes = 80
-        self.per_class_active_tracks = {}
-        for i in range(self.nr_classes):
-            self.per_class_active_tracks[i] = []
 
     def __get__(self, instance, owner):
         # This makes PerClassDecorator a non-data descriptor that binds the method to the instance
-        def wrapper(*args, **kwargs):
-            # Unpack arguments for clarity
-            args = list(args)
-            dets = args[0]
-            im = args[1]
-            
-            if instance.per_class is True:
-
-                # Initialize an array to store the tracks for each class
-                per_class_tracks = []
-                
-                frame_count = instance.frame_count
-
-                for i, cls_id in enumerate(range(self.nr_classes)):
- 
-                    if dets.size > 0:
-                        class_dets = dets[dets[:, 5] == cls_id]
-                    else:
-                        class_dets = np.empty((0, 6))
-                    logger.debug(f"Processing class {int(cls_id)}: {class_dets.shape}")
+        def wrapper(dets, img=None, embs=None):
+            if instance.per_class is not True:
+                return self.update(instance, dets, img, embs)
+
+            per_class_state = instance.per_class_state
+            classes = set(per_class_state)
+            if dets.size > 0:
+                classes.update(np.unique(dets[:, 5]).tolist())
+
+            frame_count = instance.frame_count
+            if embs is None and len(dets) > 0:
+                embs = instance.get_embs(dets, img)
+            instance.shared_frame = {'dets': dets}
+
+            per_class_tracks = []
+            try:
+                for cls_id in sorted(classes):
+                    mask = dets[:, 5] == cls_id if dets.size > 0 else np.zeros(len(dets), dtype=bool)
+                    logger.debug(f"Processing class {int(cls_id)}: {int(mask.sum())} detections")
 
-                    # activate the specific active tracks for this class id
-                    instance.active_tracks = self.per_class_active_tracks[cls_id]
-                    
-                    # reset frame count for every class
+                    # swap in the tracks of this class, every class update starts from the frame count
+                    state = per_class_state.get(cls_id, {})
+                    for name in instance.per_class_attributes:
+                        setattr(instance, name, state.get(name, []))
                     instance.frame_count = frame_count
-                    
-                    # Update detections using the decorated method
-                    tracks = self.update(instance, class_dets, im)
 
-                    # save the updated active tracks
-                    self.per_class_active_tracks[cls_id] = instance.active_tracks
+                    tracks = self.update(instance, dets[mask], img, embs[mask] if embs is not None else None)
+
+                    if instance.active_tracks or getattr(instance, 'lost_stracks', None):
+                        per_class_state[cls_id] = {
+                            name: getattr(instance, name) for name in instance.per_class_attributes
+                        }
+                    else:
+                        # nothing left to track, the class is visited again once it is detected
+                        per_class_state.pop(cls_id, None)
 
                     if tracks.size > 0:
                         per_class_tracks.append(tracks)
-                
-                # when all active tracks lists have been updated
-                instance.per_class_active_tracks = self.per_class_active_tracks
-                
-                instance.frame_count = instance.frame_count - 1
-
-                tracks = np.vstack(per_class_tracks) if per_class_tracks else np.empty((0, 8))
-            else:
-                # Process all detections at once if per_class is False or detections are empty
-                tracks = self.update(instance, dets, im)
-            
-            return tracks
-
-        return wrapper
\ No newline at end of file
+            finally:
+                instance.shared_frame = None
+                for name in instance.per_class_attributes:
+                    setattr(instance, name, [])
+                instance.frame_count = frame_count + 1
+
+            return np.vstack(per_class_tracks) if per_class_tracks else np.empty((0, 8))
+
+        return wrapper
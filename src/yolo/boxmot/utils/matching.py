@@ -173,11 +173,13 @@ def gate_cost_matrix(kf, cost_matrix, tracks, detections, only_position=False):
     gating_dim = 2 if only_position else 4
     gating_threshold = chi2inv95[gating_dim]
     measurements = np.asarray([det.to_xyah() for det in detections])
-    for row, track in enumerate(tracks):
-        gating_distance = kf.gating_distance(
-            track.mean, track.covariance, measurements, only_position
-        )
-        cost_matrix[row, gating_distance > gating_threshold] = np.inf
+    gating_distance = kf.multi_gating_distance(
+        np.asarray([track.mean for track in tracks]),
+        np.asarray([track.covariance for track in tracks]),
+        measurements,
+        only_position,
+    )
+    cost_matrix[gating_distance > gating_threshold] = np.inf
     return cost_matrix
 
 
@@ -187,12 +189,15 @@ def fuse_motion(kf, cost_matrix, tracks, detections, only_position=False, lambda
     gating_dim = 2 if only_position else 4
     gating_threshold = chi2inv95[gating_dim]
     measurements = np.asarray([det.to_xyah() for det in detections])
-    for row, track in enumerate(tracks):
-        gating_distance = kf.gating_distance(
-            track.mean, track.covariance, measurements, only_position, metric="maha"
-        )
-        cost_matrix[row, gating_distance > gating_threshold] = np.inf
-        cost_matrix[row] = lambda_ * cost_matrix[row] + (1 - lambda_) * gating_distance
+    gating_distance = kf.multi_gating_distance(
+        np.asarray([track.mean for track in tracks]),
+        np.asarray([track.covariance for track in tracks]),
+        measurements,
+        only_position,
+        metric="maha",
+    )
+    cost_matrix[gating_distance > gating_threshold] = np.inf
+    cost_matrix[:] = lambda_ * cost_matrix + (1 - lambda_) * gating_distance
     return cost_matrix
 
 
@@ -0,0 +1,74 @@
+# Mikel Broström 🔥 Yolo Tracking 🧾 AGPL-3.0 license
+
+import numpy as np
+
+
+class ObservationHistory(object):
+    """
+    The last observations of a track and the ages (frames since the track started) they
+    were made at, in a ring buffer. The OC-SORT style trackers never look further back
+    than delta_t frames (k_previous_obs, the velocity and the camera motion correction),
+    so delta_t + 1 observations are enough and a track keeps the same memory however
+    long it lives.
+
+    :param size: observations kept, delta_t + 1
+    :param dim: values per observation, [x1, y1, x2, y2, conf]
+    """
+
+    def __init__(self, size, dim=5):
+        self.boxes = np.zeros((size, dim))
+        # -1 for the slots not written yet
+        self.ages = np.full(size, -1, dtype=int)
+        self._last = -1
+
+    def __len__(self):
+        return int((self.ages >= 0).sum())
+
+    def __contains__(self, age):
+        return self.get(age) is not None
+
+    def add(self, age, box):
+        """Stores the observation made at age over the oldest one, returns its row (a view)."""
+        self._last = (self._last + 1) % len(self.ages)
+        self.boxes[self._last] = box
+        self.ages[self._last] = age
+        return self.boxes[self._last]
+
+    def get(self, age):
+        """The observation made at age (a view), None if there is none (anymore)."""
+        if age < 0:
+            return None
+        rows = np.flatnonzero(self.ages == age)
+        return self.boxes[rows[0]] if len(rows) else None
+
+    def last(self):
+        """The most recent observation (a view), None if there is none."""
+        return self.boxes[self._last] if self._last >= 0 else None
+
+    def window(self, first, last):
+        """Rows of the observations made between the ages first and last, both included."""
+        return np.flatnonzero((self.ages >= max(first, 0)) & (self.ages <= last))
+
+
+def k_previous_obs(histories, cur_ages, k):
+    """
+    For every track, the observation made k frames ago or, if there is none, the closest
+    one after it in the last k frames, or else the most recent one. [-1, -1, -1, -1, -1]
+    for tracks never observed.
+
+    :param histories: ObservationHistory of the tracks
+    :param cur_ages: current ages of the tracks
+    :return: (N, dim) observations
+    """
+    if len(histories) == 0:
+        return np.empty((0, 5))
+    boxes = np.stack([h.boxes for h in histories])
+    ages = np.stack([h.ages for h in histories])
+    cur_ages = np.asarray(cur_ages)[:, None]
+
+    in_window = (ages >= cur_ages - k) & (ages < cur_ages) & (ages >= 0)
+    oldest = np.where(in_window, ages, np.iinfo(ages.dtype).max).argmin(axis=1)
+    latest = ages.argmax(axis=1)
+    obs = boxes[np.arange(len(boxes)), np.where(in_window.any(axis=1), oldest, latest)]
+    obs[(ages < 0).all(axis=1)] = -1
+    return obs
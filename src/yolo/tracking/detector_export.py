@@ -0,0 +1,87 @@
+# Mikel Broström 🔥 Yolo Tracking 🧾 AGPL-3.0 license
+
+"""
+Exports a YOLOv8 detector for CPU inference with ONNX Runtime and / or OpenVINO:
+
+    python -m yolo.tracking.detector_export --yolo-model yolov8n.pt --include onnx openvino
+
+The exported yolov8n.onnx or yolov8n_openvino_model can then be passed as yolo_model to
+TrackingSession (or track.run), which runs it with YoloRuntimeStrategy.
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+from ultralytics import YOLO
+
+from src.yolo.boxmot.utils import WEIGHTS
+from src.yolo.boxmot.utils import logger as LOGGER
+
+EXPORT_FORMATS = ('onnx', 'openvino')
+
+
+def export_detector(yolo_model, include=('onnx',), imgsz=640, batch=1, half=False, dynamic=False, simplify=True, opset=12):
+    """
+    Exports yolo_model to every format in include, next to the weights.
+
+    The input size is fixed to imgsz (letterboxed, like the predictor does for exported
+    models), batch > 1 or dynamic suit process_many, which batches several videos.
+
+    :return: list of the exported model paths
+    """
+    for fmt in include:
+        assert fmt in EXPORT_FORMATS, f"'{fmt}' is not supported. Supported ones are {EXPORT_FORMATS}"
+
+    model = YOLO(yolo_model)
+    exported = []
+    for fmt in include:
+        t = time.time()
+        f = model.export(
+            format=fmt,
+            imgsz=imgsz,
+            batch=batch,
+            # ONNX Runtime does not run FP16 on the CPU, OpenVINO compresses the weights
+            half=half and fmt == 'openvino',
+            dynamic=dynamic,
+            simplify=simplify,
+            opset=opset,
+        )
+        LOGGER.info(f"Exported {yolo_model} to {f} ({time.time() - t:.1f}s)")
+        exported.append(f)
+    return exported
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser(description="YOLO detector export")
+    parser.add_argument('--yolo-model', type=Path, default=WEIGHTS / 'yolov8n.pt',
+                        help='yolov8 model path')
+    parser.add_argument('--include', nargs='+', default=['onnx'],
+                        help=f'export formats, of {EXPORT_FORMATS}')
+    parser.add_argument('--imgsz', '--img-size', type=int, default=640,
+                        help='inference size')
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help='batch size')
+    parser.add_argument('--half', action='store_true',
+                        help='OpenVINO: FP16 compressed weights')
+    parser.add_argument('--dynamic', action='store_true',
+                        help='dynamic batch and input size')
+    parser.add_argument('--no-simplify', dest='simplify', action='store_false',
+                        help='ONNX: do not simplify the graph')
+    parser.add_argument('--opset', type=int, default=12,
+                        help='ONNX: opset version')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    opt = parse_opt()
+    export_detector(
+        opt.yolo_model,
+        include=[x.lower() for x in opt.include],
+        imgsz=opt.imgsz,
+        batch=opt.batch_size,
+        half=opt.half,
+        dynamic=opt.dynamic,
+        simplify=opt.simplify,
+        opset=opt.opset,
+    )
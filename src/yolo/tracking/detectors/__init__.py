@@ -1,14 +1,31 @@
 # Mikel Broström 🔥 Yolo Tracking 🧾 AGPL-3.0 license
 
+from pathlib import Path
+
 from src.yolo.boxmot.utils import logger as LOGGER
 from src.yolo.boxmot.utils.checks import TestRequirements
 
 tr = TestRequirements()
 
 
+def is_runtime_model(yolo_model):
+    """Whether yolo_model is a detector exported for ONNX Runtime or OpenVINO."""
+    yolo_model = Path(yolo_model)
+    return yolo_model.suffix in ('.onnx', '.xml') or yolo_model.name.endswith('_openvino_model')
+
+
+def is_ultralytics_model(yolo_model):
+    """Whether yolo_model is run by the ultralytics YOLO object itself, without a strategy."""
+    return 'yolov8' in str(yolo_model) and not is_runtime_model(yolo_model)
+
+
 def get_yolo_inferer(yolo_model):
 
-    if 'yolox' in str(yolo_model):
+    if is_runtime_model(yolo_model):
+        # exported with tracking/detector_export.py
+        from .yolo_runtime import YoloRuntimeStrategy
+        return YoloRuntimeStrategy
+    elif 'yolox' in str(yolo_model):
         try:
             import yolox  # for linear_assignment
             assert yolox.__version__
@@ -32,5 +49,5 @@ def get_yolo_inferer(yolo_model):
         return YoloNASStrategy
     else:
         LOGGER.error('Failed to infer inference mode from yolo model name')
-        LOGGER.error('Your model name has to contain either yolox, yolo_nas or yolov8')
+        LOGGER.error('Your model name has to contain either yolox, yolo_nas or yolov8, or be an exported .onnx / *_openvino_model')
         exit()
@@ -0,0 +1,124 @@
+# Mikel Broström 🔥 Yolo Tracking 🧾 AGPL-3.0 license
+
+import ast
+from pathlib import Path
+
+import numpy as np
+import torch
+import yaml
+from ultralytics.engine.results import Results
+from ultralytics.utils import ops
+
+from src.yolo.boxmot.utils import logger as LOGGER
+from src.yolo.boxmot.utils.checks import TestRequirements
+from .yolo_interface import YoloInterface
+
+tr = TestRequirements()
+
+
+class YoloRuntimeStrategy(YoloInterface):
+    """
+    YOLOv8 detector exported with tracking/detector_export.py, run by ONNX Runtime (.onnx)
+    or OpenVINO (*_openvino_model folder or its .xml) on the CPU.
+
+    Both runtimes use as many threads as torch was given (see TrackingExecutor), so several
+    tracking processes do not oversubscribe the cores. Models exported with a fixed batch
+    size run batches of another size image by image.
+    """
+    pt = False
+    stride = 32
+    fp16 = False
+    triton = False
+
+    def __init__(self, model, device, args):
+        self.args = args
+        self.device = device
+        model = Path(model)
+        threads = torch.get_num_threads()
+
+        if model.suffix == '.onnx':
+            self.names = self._load_onnx(model, threads)
+        else:
+            self.names = self._load_openvino(model, threads)
+        LOGGER.info(f'Loading {model} for {self.runtime} inference')
+
+    def _load_onnx(self, model, threads):
+        tr.check_packages(("onnxruntime==1.16.3", ))
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(str(model), options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.batch_size = self.session.get_inputs()[0].shape[0]
+        self.runtime = 'ONNX Runtime'
+
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        return ast.literal_eval(metadata['names']) if 'names' in metadata else {}
+
+    def _load_openvino(self, model, threads):
+        tr.check_packages(("openvino>=2023.0", ))
+        from openvino.runtime import Core
+
+        if not model.is_file():
+            # get *.xml file from *_openvino_model dir
+            model = next(model.glob('*.xml'))
+        core = Core()
+        network = core.read_model(model=model, weights=model.with_suffix('.bin'))
+        self.compiled = core.compile_model(
+            network,
+            device_name='CPU',
+            config={'PERFORMANCE_HINT': 'LATENCY', 'INFERENCE_NUM_THREADS': str(threads)},
+        )
+        self.output_layer = next(iter(self.compiled.outputs))
+        batch = network.get_parameters()[0].get_partial_shape()[0]
+        self.batch_size = batch.get_length() if batch.is_static else None
+        self.runtime = 'OpenVINO'
+
+        metadata = model.parent / 'metadata.yaml'
+        if metadata.exists():
+            with open(metadata, 'r', encoding='utf-8') as f:
+                return yaml.safe_load(f).get('names', {})
+        return {}
+
+    def _forward(self, im):
+        if self.runtime == 'ONNX Runtime':
+            return self.session.run(None, {self.input_name: im})[0]
+        return self.compiled([im])[self.output_layer]
+
+    @torch.no_grad()
+    def __call__(self, im, augment=False, visualize=False):
+        im = im.cpu().numpy().astype(np.float32)
+        if isinstance(self.batch_size, int) and self.batch_size != len(im):
+            preds = np.concatenate([self._forward(im[i:i + 1]) for i in range(len(im))])
+        else:
+            preds = self._forward(im)
+        if not self.names:
+            # no metadata, (B, 4 + classes, anchors) output
+            self.names = {i: str(i) for i in range(preds.shape[1] - 4)}
+        return torch.from_numpy(preds)
+
+    def warmup(self, imgsz):
+        pass
+
+    def postprocess(self, path, preds, im, im0s):
+        preds = ops.non_max_suppression(
+            preds,
+            self.args.conf,
+            self.args.iou,
+            agnostic=self.args.agnostic_nms,
+            max_det=self.args.max_det,
+            classes=self.args.classes,
+        )
+
+        results = []
+        for i, pred in enumerate(preds):
+            pred[:, :4] = ops.scale_boxes(im.shape[2:], pred[:, :4], im0s[i].shape)
+            results.append(Results(
+                path=path[i] if isinstance(path, (list, tuple)) else path,
+                boxes=pred,
+                orig_img=im0s[i],
+                names=self.names
+            ))
+        return results
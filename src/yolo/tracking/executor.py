@@ -0,0 +1,99 @@
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import torch
+
+from src.yolo.tracking.track import TrackingSession
+
+# per worker process state, filled by _init_worker
+_session = None
+_task = None
+
+
+def video_duration(video_path):
+    """Return the duration of a video in seconds, 0 if it cannot be read."""
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        return 0
+    frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+    return frames / fps if fps > 0 else 0
+
+
+def _init_worker(num_threads, session_kwargs, task):
+    global _session, _task
+    # every worker gets its own slice of the cores, otherwise N workers x all-core
+    # torch/opencv pools oversubscribe the machine
+    torch.set_num_threads(num_threads)
+    cv2.setNumThreads(num_threads)
+    _session = TrackingSession(**session_kwargs)
+    _task = task
+
+
+def _run_task(video, *args):
+    return _task(_session, video, *args)
+
+
+class TrackingExecutor:
+    """
+    Runs per-video tracking in a pool of worker processes.
+
+    Every worker owns one TrackingSession, so models are loaded once per worker and stay
+    resident for all the videos it processes. task(session, video) is called in the
+    worker and its (picklable) return value, e.g. a metrics dict, is sent back.
+
+    :param task: module level function taking (session, video, *args), args being the
+        extra (picklable) arguments given to submit/process
+    :param workers: number of worker processes, defaults to the number of cores
+    :param threads_per_worker: torch/opencv threads per worker, defaults to cores // workers
+    :param session_kwargs: forwarded to TrackingSession
+    """
+
+    def __init__(self, task, workers=None, threads_per_worker=None, **session_kwargs):
+        cpus = os.cpu_count() or 1
+        self.workers = workers or cpus
+        self.threads_per_worker = threads_per_worker or max(1, cpus // self.workers)
+        # torch does not survive fork well, start clean interpreters instead
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.threads_per_worker, session_kwargs, task),
+        )
+
+    def submit(self, video, *args):
+        return self.pool.submit(_run_task, video, *args)
+
+    def process(self, video, *args):
+        """Blocking variant of submit, returns the task result."""
+        return self.submit(video, *args).result()
+
+    def map(self, videos):
+        """
+        Processes all videos, longest first so that the pool does not end up waiting
+        on a single long video started last. Failed videos are reported and skipped.
+
+        :return: list of task results in scheduling order
+        """
+        videos = sorted(videos, key=video_duration, reverse=True)
+        futures = [self.submit(v) for v in videos]
+
+        results = []
+        for video, future in zip(videos, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"Tracking failed on {video}: {e}")
+        return results
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
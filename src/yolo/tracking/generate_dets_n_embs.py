@@ -9,7 +9,7 @@ import torch
 
 from src.yolo.boxmot.utils import ROOT, WEIGHTS
 from src.yolo.boxmot.utils.checks import TestRequirements
-from tracking.detectors import get_yolo_inferer
+from tracking.detectors import get_yolo_inferer, is_ultralytics_model
 from src.yolo.boxmot.appearance.reid_auto_backend import ReidAutoBackend
 
 __tr = TestRequirements()
@@ -25,7 +25,7 @@ def run(args):
     WEIGHTS.mkdir(parents=True, exist_ok=True)
 
     yolo = YOLO(
-        args.yolo_model if 'yolov8' in str(args.yolo_model) else 'yolov8n.pt',
+        args.yolo_model if is_ultralytics_model(args.yolo_model) else 'yolov8n.pt',
     )
 
     results = yolo(
@@ -44,7 +44,7 @@ def run(args):
         vid_stride=args.vid_stride,
     )
 
-    if 'yolov8' not in str(args.yolo_model):
+    if not is_ultralytics_model(args.yolo_model):
         # replace yolov8 model
         m = get_yolo_inferer(args.yolo_model)
         model = m(
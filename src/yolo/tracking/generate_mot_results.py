@@ -22,6 +22,7 @@ from ultralytics import YOLO
 from ultralytics.data.utils import VID_FORMATS
 
 from tracking.utils import convert_to_mot_format, write_mot_results
+from tracking.motion_gate import MotionGate
 
 
 __tr = TestRequirements()
@@ -55,6 +56,8 @@ def generate_mot_results(args):
     )
 
     dataset = LoadImages(args.source)
+    # replays what gated detection would have fed the tracker, to measure its HOTA impact
+    gate = MotionGate() if getattr(args, 'motion_gate', False) else None
     
     txt_path = args.exp_folder_path / (Path(args.source).parent.name + '.txt')
     for frame_idx, d in enumerate(tqdm(dataset, desc="Frames")):
@@ -71,11 +74,17 @@ def generate_mot_results(args):
         # frame id, x1, y1, x2, y2, conf, cls
         dets = frame_dets_n_embs[:, 1:7]
         embs = frame_dets_n_embs[:, 7:]
+        if gate is not None and not gate.should_detect([im]):
+            dets = dets[:0]
+            embs = embs[:0]
         tracks = tracker.update(dets, im, embs)
 
         mot_results = convert_to_mot_format(tracks, frame_idx + 1)
         write_mot_results(txt_path, mot_results)
 
+    if gate is not None:
+        LOGGER.info(gate.summary())
+
 
 def parse_opt():
     parser = argparse.ArgumentParser()
@@ -136,6 +145,8 @@ def parse_opt():
                         help='class-agnostic NMS')
     parser.add_argument('--benchmark', type=str, default='MOT17',
                         help='MOT16, MOT17, MOT20')
+    parser.add_argument('--motion-gate', action='store_true',
+                        help='feed no detections on frames the motion gate would skip')
 
     opt = parser.parse_args()
     return opt
@@ -147,6 +158,8 @@ def run_generate_mot_results(opt):
         opt = opt
 
     exp_folder_path = opt.project / (str(opt.dets) + "_" + str(opt.embs) + "_" + str(opt.tracking_method))
+    if getattr(opt, 'motion_gate', False):
+        exp_folder_path = exp_folder_path.with_name(exp_folder_path.name + "_gated")
     exp_folder_path = increment_path(path=exp_folder_path, sep="_", exist_ok=False)
     opt.exp_folder_path = exp_folder_path
     dets_file_paths = [item for item in (opt.project.parent / "dets_n_embs" / opt.dets / 'dets').glob('*.txt')]
@@ -0,0 +1,182 @@
+import cv2
+
+from utility.ffmpeg_reader import FFmpegCapture
+
+
+class LoadFFmpegVideo:
+    """
+    Drop-in replacement for the ultralytics LoadImages loader on a single video, reading
+    frames from FFmpegCapture instead of decoding a re-encoded intermediate file.
+
+    Striding is done by ffmpeg, so the predictor must run with vid_stride=1. skip reads
+    only every skip-th of the frames ffmpeg delivers, for a stride that changes on the fly.
+    """
+
+    def __init__(self, path, width=640, vid_stride=1):
+        self.files = [str(path)]
+        self.nf = 1
+        self.video_flag = [True]
+        self.mode = 'video'
+        self.bs = 1
+        self.vid_stride = vid_stride
+        self.skip = 1
+        self.count = 0
+        self.frame = 0
+        self.cap = FFmpegCapture(str(path), width, vid_stride)
+        self.frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    def __iter__(self):
+        self.count = 0
+        return self
+
+    def __next__(self):
+        if self.count == self.nf:
+            raise StopIteration
+
+        for _ in range(self.skip - 1):
+            self.cap.grab()
+        success, im0 = self.cap.read()
+        if not success:
+            self.count += 1
+            self.cap.release()
+            raise StopIteration
+
+        self.frame += 1
+        path = self.files[0]
+        s = f'video 1/1 ({self.frame}/{self.frames}) {path}: '
+        return [path], [im0], self.cap, s
+
+    def __len__(self):
+        return self.nf
+
+
+class LoadVideoStreams:
+    """
+    Loader of several videos at once: every batch holds the next frame of each video that
+    has not ended yet, so one detector forward pass serves all of them.
+
+    Streams that end drop out of the batch, bs always is the size of the current batch and
+    active the indices of its streams, which the trackers are dispatched by. frame counts
+    the batches, i.e. the processed frames of every stream still running.
+
+    :param paths: video paths
+    :param vid_stride: keep every vid_stride-th frame
+    :param ingest: 'ffmpeg' to read through FFmpegCapture, OpenCV otherwise
+    :param width: frame width of the ffmpeg ingest
+    """
+
+    def __init__(self, paths, vid_stride=1, ingest=None, width=640):
+        self.files = [str(path) for path in paths]
+        self.nf = len(self.files)
+        self.video_flag = [True] * self.nf
+        self.mode = 'video'
+        self.vid_stride = vid_stride
+        self.ingest = ingest
+        self.frame = 0
+        self.count = 0
+        if ingest == 'ffmpeg':
+            self.caps = [FFmpegCapture(path, width, vid_stride) for path in self.files]
+        else:
+            self.caps = [cv2.VideoCapture(path) for path in self.files]
+        self.frames = max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) for cap in self.caps) // (1 if ingest == 'ffmpeg' else vid_stride)
+        self.active = list(range(self.nf))
+        self.bs = self.nf
+
+    def __iter__(self):
+        self.count = 0
+        return self
+
+    def _read(self, cap):
+        if self.ingest != 'ffmpeg':
+            for _ in range(self.vid_stride - 1):
+                cap.grab()
+        return cap.read()
+
+    def __next__(self):
+        active, im0s = [], []
+        for i in self.active:
+            success, im0 = self._read(self.caps[i])
+            if success:
+                active.append(i)
+                im0s.append(im0)
+            else:
+                self.caps[i].release()
+        self.active = active
+        if not active:
+            self.bs = 0
+            raise StopIteration
+
+        self.bs = len(active)
+        self.frame += 1
+        paths = [self.files[i] for i in active]
+        s = f'{len(active)}/{self.nf} videos ({self.frame}/{self.frames}): '
+        return paths, im0s, None, s
+
+    def __len__(self):
+        return self.nf
+
+
+def setup_source(predictor, default_setup_source, source):
+    """
+    Wraps BasePredictor.setup_source: the default loader is built as usual (it only opens
+    the file) and is then swapped for LoadFFmpegVideo when custom_args.ingest == 'ffmpeg',
+    or for LoadVideoStreams over custom_args.sources when several videos are tracked at once.
+    """
+    default_setup_source(source)
+
+    args = getattr(predictor, 'custom_args', None)
+    if getattr(args, 'sources', None):
+        source_type = getattr(predictor.dataset, 'source_type', None)
+        if getattr(predictor.dataset, 'cap', None) is not None:
+            predictor.dataset.cap.release()
+        predictor.dataset = LoadVideoStreams(args.sources, args.vid_stride, args.ingest, args.ingest_width)
+        predictor.dataset.source_type = source_type
+        predictor.vid_path, predictor.vid_writer = [None] * predictor.dataset.bs, [None] * predictor.dataset.bs
+        return
+
+    if getattr(args, 'ingest', None) != 'ffmpeg':
+        return
+
+    source_type = getattr(predictor.dataset, 'source_type', None)
+    if getattr(predictor.dataset, 'cap', None) is not None:
+        predictor.dataset.cap.release()
+
+    predictor.dataset = LoadFFmpegVideo(source, args.ingest_width, getattr(args, 'ingest_stride', args.vid_stride))
+    predictor.dataset.source_type = source_type
+
+
+def set_stride(dataset, stride):
+    """Changes the stride of a video loader that is being iterated, from the next frame on."""
+    dataset = getattr(dataset, 'loader', dataset)
+    if isinstance(dataset, LoadFFmpegVideo):
+        dataset.skip = max(1, stride // dataset.vid_stride)
+    else:
+        # LoadImages grabs vid_stride frames before every retrieve
+        dataset.vid_stride = stride
+
+
+def dispatch_trackers(predictor):
+    """
+    on_predict_batch_start callback: the trackers of the streams in the batch, in batch
+    order, since the tracking callback takes tracker i for result i.
+    """
+    active = getattr(predictor.dataset, 'active', None)
+    trackers = getattr(predictor, 'boxmot_trackers', None)
+    if active is not None and trackers is not None:
+        predictor.trackers = [trackers[i] for i in active]
+
+
+def stream_write_results(predictor, default_write_results, idx, results, batch):
+    """
+    Wraps BasePredictor.write_results: with several videos at once, the label files of
+    every stream go to the folder custom_args.stream_dirs gives its path (batch[0]).
+    """
+    stream_dirs = getattr(getattr(predictor, 'custom_args', None), 'stream_dirs', None)
+    if not stream_dirs:
+        return default_write_results(idx, results, batch)
+    save_dir = predictor.save_dir
+    predictor.save_dir = stream_dirs[str(batch[0])]
+    try:
+        return default_write_results(idx, results, batch)
+    finally:
+        predictor.save_dir = save_dir
@@ -0,0 +1,318 @@
+# Mikel Broström 🔥 Yolo Tracking 🧾 AGPL-3.0 license
+
+"""
+INT8 post-training quantization of the detector and the ReID model for CPU inference,
+calibrated on frames of our own shop videos and on person crops of those frames:
+
+    python -m yolo.boxmot.appearance.reid_export --weights osnet_x0_25_msmt17.pt --include onnx --dynamic
+    python -m yolo.tracking.int8_export --videos data/incoming/*/*.mp4 \\
+        --yolo-model yolov8n.pt --reid-model osnet_x0_25_msmt17.onnx
+
+Both models are quantized with ONNX Runtime static quantization (QDQ, per-channel INT8
+weights, activations calibrated on the sample). A report of the latency of FP32 and INT8
+and of how far the INT8 outputs drift from the FP32 ones (detections matched by IoU,
+cosine similarity of the embeddings) on held-out frames is printed and saved as
+int8_report.json next to the models. The HOTA delta is measured with val.py, once with
+the FP32 and once with the INT8 models, the commands are part of the report.
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import torch
+from ultralytics.data.augment import LetterBox
+
+from src.yolo.boxmot.utils import WEIGHTS
+from src.yolo.boxmot.utils import logger as LOGGER
+from src.yolo.boxmot.utils.checks import TestRequirements
+from src.yolo.tracking.detector_export import export_detector
+from src.yolo.tracking.detectors.yolo_runtime import YoloRuntimeStrategy
+
+tr = TestRequirements()
+
+# ReID input, see BaseModelBackend.get_crops
+REID_SIZE = (128, 256)
+REID_MEAN = np.array([0.485, 0.456, 0.406])
+REID_STD = np.array([0.229, 0.224, 0.225])
+
+
+def sample_frames(videos, frames_per_video=20):
+    """Frames evenly spread over every video, BGR."""
+    frames = []
+    for video in videos:
+        cap = cv2.VideoCapture(str(video))
+        count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        for index in np.linspace(0, max(count - 1, 0), frames_per_video).astype(int):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(index))
+            ok, frame = cap.read()
+            if ok:
+                frames.append(frame)
+        cap.release()
+    return frames
+
+
+def detector_input(frame, imgsz):
+    """(1, 3, imgsz, imgsz) float32 input, letterboxed like the predictor does for exported models."""
+    im = LetterBox((imgsz, imgsz), auto=False)(image=frame)
+    im = im[..., ::-1].transpose(2, 0, 1)[None]
+    return np.ascontiguousarray(im, dtype=np.float32) / 255
+
+
+def reid_input(frame, boxes):
+    """(N, 3, 256, 128) float32 input of the person crops, as in BaseModelBackend.get_crops."""
+    h, w = frame.shape[:2]
+    crops = []
+    for x1, y1, x2, y2 in boxes.astype(int):
+        crop = frame[max(0, y1):min(h - 1, y2), max(0, x1):min(w - 1, x2)]
+        crop = cv2.cvtColor(cv2.resize(crop, REID_SIZE, interpolation=cv2.INTER_LINEAR), cv2.COLOR_BGR2RGB)
+        crops.append((crop / 255.0 - REID_MEAN) / REID_STD)
+    return np.stack(crops).transpose(0, 3, 1, 2).astype(np.float32)
+
+
+def _calibration_reader(input_name, batches):
+    from onnxruntime.quantization import CalibrationDataReader
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self.batches = iter(batches)
+
+        def get_next(self):
+            batch = next(self.batches, None)
+            return None if batch is None else {input_name: batch}
+
+    return Reader()
+
+
+def quantize(fp32_model, batches, output=None):
+    """
+    Statically quantizes an ONNX model, activations calibrated on batches.
+
+    :return: path of the INT8 model, <name>_int8.onnx next to the FP32 one unless given
+    """
+    tr.check_packages(("onnxruntime==1.16.3", "onnx"))
+    import onnxruntime
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+
+    fp32_model = Path(fp32_model)
+    output = Path(output) if output else fp32_model.with_name(fp32_model.stem + '_int8.onnx')
+    input_name = onnxruntime.InferenceSession(str(fp32_model), providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    t = time.time()
+    quantize_static(
+        str(fp32_model),
+        str(output),
+        _calibration_reader(input_name, batches),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        weight_type=QuantType.QInt8,
+        activation_type=QuantType.QUInt8,
+        # robust to the few saturated pixels of shop cameras (windows, lamps)
+        calibrate_method=CalibrationMethod.Percentile,
+    )
+    LOGGER.info(f"Quantized {fp32_model} to {output} on {len(batches)} batches ({time.time() - t:.1f}s)")
+    return output
+
+
+def _session(model):
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = torch.get_num_threads()
+    return onnxruntime.InferenceSession(str(model), options, providers=["CPUExecutionProvider"])
+
+
+def latency_ms(model, batches, warmup=3):
+    """Median latency of one batch in ms."""
+    session = _session(model)
+    name = session.get_inputs()[0].name
+    for batch in batches[:warmup]:
+        session.run(None, {name: batch})
+    times = []
+    for batch in batches:
+        t = time.perf_counter()
+        session.run(None, {name: batch})
+        times.append((time.perf_counter() - t) * 1000)
+    return float(np.median(times))
+
+
+def _detector(model, conf):
+    args = SimpleNamespace(conf=conf, iou=0.7, agnostic_nms=False, max_det=300, classes=[0])
+    return YoloRuntimeStrategy(model, torch.device('cpu'), args)
+
+
+def detect(detector, frame, im):
+    """Person boxes (N, 4) of a frame, in frame pixels."""
+    im = torch.from_numpy(im)
+    result = detector.postprocess('', detector(im), im, [frame])[0]
+    return result.boxes.xyxy.cpu().numpy()
+
+
+def _iou(a, b):
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(rb - lt, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def detection_agreement(reference, boxes, threshold=0.5):
+    """
+    Recall and precision of boxes against the reference boxes (greedy IoU matching) and
+    the mean IoU of the matches, summed over frames.
+    """
+    matched, ious, n_ref, n_boxes = 0, [], 0, 0
+    for ref, b in zip(reference, boxes):
+        n_ref += len(ref)
+        n_boxes += len(b)
+        if not len(ref) or not len(b):
+            continue
+        iou = _iou(ref, b)
+        while iou.size and iou.max() >= threshold:
+            i, j = np.unravel_index(iou.argmax(), iou.shape)
+            ious.append(iou[i, j])
+            matched += 1
+            iou[i, :] = 0
+            iou[:, j] = 0
+    return {
+        'recall': matched / n_ref if n_ref else 1.0,
+        'precision': matched / n_boxes if n_boxes else 1.0,
+        'mean_iou': float(np.mean(ious)) if ious else 0.0,
+    }
+
+
+def embedding_agreement(fp32_model, int8_model, batches):
+    """Cosine similarity of the INT8 to the FP32 embedding of every crop."""
+    fp32, int8 = _session(fp32_model), _session(int8_model)
+    name = fp32.get_inputs()[0].name
+    sims = []
+    for batch in batches:
+        a = fp32.run(None, {name: batch})[0]
+        b = int8.run(None, {name: batch})[0]
+        a = a / np.linalg.norm(a, axis=1, keepdims=True)
+        b = b / np.linalg.norm(b, axis=1, keepdims=True)
+        sims.append((a * b).sum(axis=1))
+    sims = np.concatenate(sims) if sims else np.zeros(0)
+    return {
+        'mean_cosine': float(sims.mean()) if len(sims) else 0.0,
+        'min_cosine': float(sims.min()) if len(sims) else 0.0,
+    }
+
+
+def run(videos, yolo_model=WEIGHTS / 'yolov8n.pt', reid_model=None, imgsz=640, frames_per_video=20, holdout=0.25, conf=0.5):
+    """
+    Quantizes the detector (and the ReID model if given) and reports the latency and
+    accuracy deltas to FP32.
+
+    :param videos: shop videos the calibration and held-out frames are sampled from
+    :param yolo_model: yolov8 .pt (exported to ONNX first) or FP32 .onnx
+    :param reid_model: FP32 ReID .onnx exported with reid_export.py --dynamic
+    :param holdout: fraction of the frames kept out of calibration for the report
+    :return: the report dict
+    """
+    frames = sample_frames(videos, frames_per_video)
+    assert frames, f'no frames could be read from {videos}'
+    rng = np.random.default_rng(0)
+    order = rng.permutation(len(frames))
+    n_eval = max(1, int(len(frames) * holdout))
+    calib = [frames[i] for i in order[n_eval:]] or frames
+    evaluation = [frames[i] for i in order[:n_eval]]
+
+    yolo_model = Path(yolo_model)
+    if yolo_model.suffix != '.onnx':
+        yolo_model = Path(export_detector(yolo_model, include=['onnx'], imgsz=imgsz)[0])
+    calib_inputs = [detector_input(frame, imgsz) for frame in calib]
+    eval_inputs = [detector_input(frame, imgsz) for frame in evaluation]
+    yolo_int8 = quantize(yolo_model, calib_inputs)
+
+    fp32, int8 = _detector(yolo_model, conf), _detector(yolo_int8, conf)
+    fp32_boxes = [detect(fp32, frame, im) for frame, im in zip(evaluation, eval_inputs)]
+    int8_boxes = [detect(int8, frame, im) for frame, im in zip(evaluation, eval_inputs)]
+    report = {
+        'frames': {'calibration': len(calib), 'evaluation': len(evaluation)},
+        'detector': {
+            'fp32': str(yolo_model),
+            'int8': str(yolo_int8),
+            'fp32_ms': latency_ms(yolo_model, eval_inputs),
+            'int8_ms': latency_ms(yolo_int8, eval_inputs),
+            # INT8 detections against the FP32 ones
+            **detection_agreement(fp32_boxes, int8_boxes),
+        },
+    }
+
+    if reid_model is not None:
+        # person crops of the FP32 detector, the crops the tracker embeds
+        def crops(frames_):
+            batches = []
+            for frame in frames_:
+                boxes = detect(fp32, frame, detector_input(frame, imgsz))
+                boxes = boxes[(boxes[:, 2] - boxes[:, 0] >= 2) & (boxes[:, 3] - boxes[:, 1] >= 2)]
+                if len(boxes):
+                    batches.append(reid_input(frame, boxes))
+            return batches
+
+        calib_crops, eval_crops = crops(calib), crops(evaluation)
+        assert calib_crops, 'no persons detected in the calibration frames'
+        reid_int8 = quantize(reid_model, calib_crops)
+        report['reid'] = {
+            'fp32': str(reid_model),
+            'int8': str(reid_int8),
+            'fp32_ms': latency_ms(reid_model, eval_crops) if eval_crops else None,
+            'int8_ms': latency_ms(reid_int8, eval_crops) if eval_crops else None,
+            **embedding_agreement(reid_model, reid_int8, eval_crops),
+        }
+
+    reid = report.get('reid', {})
+    report['hota'] = [
+        f"python -m yolo.tracking.val --yolo-model {yolo_model} --reid-model {reid.get('fp32', WEIGHTS / 'osnet_x0_25_msmt17.pt')}",
+        f"python -m yolo.tracking.val --yolo-model {yolo_int8} --reid-model {reid.get('int8', WEIGHTS / 'osnet_x0_25_msmt17.pt')}",
+    ]
+
+    path = yolo_int8.parent / 'int8_report.json'
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    LOGGER.info(f"Report saved to {path}")
+    return report
+
+
+def print_report(report):
+    print(f"{'model':<10}{'fp32 ms':>10}{'int8 ms':>10}{'speedup':>10}  agreement")
+    for key in ('detector', 'reid'):
+        if key not in report:
+            continue
+        r = report[key]
+        speedup = r['fp32_ms'] / r['int8_ms'] if r.get('fp32_ms') and r.get('int8_ms') else float('nan')
+        agreement = ', '.join(f'{k} {r[k]:.3f}' for k in ('recall', 'precision', 'mean_iou', 'mean_cosine', 'min_cosine') if k in r)
+        print(f"{key:<10}{r['fp32_ms'] or 0:>10.1f}{r['int8_ms'] or 0:>10.1f}{speedup:>10.2f}  {agreement}")
+    print("HOTA delta:\n  " + "\n  ".join(report['hota']))
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser(description="INT8 export of the detector and the ReID model")
+    parser.add_argument('--videos', nargs='+', type=Path, required=True,
+                        help='shop videos to sample calibration and evaluation frames from')
+    parser.add_argument('--yolo-model', type=Path, default=WEIGHTS / 'yolov8n.pt',
+                        help='yolov8 .pt or FP32 .onnx')
+    parser.add_argument('--reid-model', type=Path, default=None,
+                        help='FP32 ReID .onnx (reid_export.py --include onnx --dynamic)')
+    parser.add_argument('--imgsz', '--img-size', type=int, default=640,
+                        help='detector input size')
+    parser.add_argument('--frames-per-video', type=int, default=20,
+                        help='frames sampled from every video')
+    parser.add_argument('--holdout', type=float, default=0.25,
+                        help='fraction of the frames kept for the report')
+    parser.add_argument('--conf', type=float, default=0.5,
+                        help='detector confidence threshold')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    opt = parse_opt()
+    run(**vars(opt))
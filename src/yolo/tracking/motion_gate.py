@@ -0,0 +1,120 @@
+import cv2
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+
+class MotionGate:
+    """
+    Decides per frame whether the detector has to run, from the difference between a small
+    blurred grayscale copy of the frame and the last frame the detector ran on.
+
+    Comparing against the last detected frame (not the previous one) keeps slow changes
+    from slipping through. max_skip bounds the detector-free stretch, so people standing
+    still are re-detected before their tracks age out (keep it below the tracker max_age).
+
+    :param pixel_threshold: gray level difference from which a pixel counts as changed
+    :param area_threshold: fraction of changed pixels from which the frame counts as moving
+    :param width: width of the copy the difference is computed on
+    :param max_skip: detect at least every max_skip + 1 frames
+    """
+
+    def __init__(self, pixel_threshold=25, area_threshold=0.002, width=160, max_skip=10):
+        self.pixel_threshold = pixel_threshold
+        self.area_threshold = area_threshold
+        self.width = width
+        self.max_skip = max_skip
+        self.reference = None
+        # whether the batch being predicted skips the detector, and the last letterboxed
+        # batch, handed on for skipped ones (ultralytics still logs its shape)
+        self.skipping = False
+        self.last_im = None
+        self.skipped_in_row = 0
+        self.frames = 0
+        self.skipped = 0
+
+    def _small_gray(self, img):
+        h, w = img.shape[:2]
+        small = cv2.resize(img, (self.width, max(1, round(h * self.width / w))), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def should_detect(self, imgs):
+        """Whether the detector has to run on this batch of frames (any of them moving)."""
+        self.frames += 1
+        grays = [self._small_gray(img) for img in imgs]
+
+        detect = self.reference is None or self.skipped_in_row >= self.max_skip or any(
+            gray.shape != ref.shape or
+            np.count_nonzero(cv2.absdiff(gray, ref) > self.pixel_threshold) > self.area_threshold * gray.size
+            for gray, ref in zip(grays, self.reference)
+        )
+        if detect:
+            self.reference = grays
+            self.skipped_in_row = 0
+        else:
+            self.skipped += 1
+            self.skipped_in_row += 1
+        self.skipping = not detect
+        return detect
+
+    @property
+    def skip_ratio(self):
+        return self.skipped / self.frames if self.frames else 0.0
+
+    def summary(self):
+        return f"motion gate skipped detection on {self.skipped}/{self.frames} frames ({self.skip_ratio:.1%})"
+
+
+def _gate(predictor):
+    return getattr(getattr(predictor, 'custom_args', None), 'motion_gate', None)
+
+
+def gated_preprocess(predictor, default_preprocess, im):
+    """Wraps BasePredictor.preprocess: static batches are not even letterboxed."""
+    gate = _gate(predictor)
+    if gate is None:
+        return default_preprocess(im)
+    if not gate.should_detect(im) and gate.last_im is not None:
+        return gate.last_im
+    gate.skipping = False
+    gate.last_im = default_preprocess(im)
+    return gate.last_im
+
+
+def gated_inference(predictor, default_inference, im, *args, **kwargs):
+    gate = _gate(predictor)
+    if gate is not None and gate.skipping:
+        return None
+    return default_inference(im, *args, **kwargs)
+
+
+def gated_postprocess(predictor, default_postprocess, preds, img, orig_imgs, *args, **kwargs):
+    """
+    Wraps BasePredictor.postprocess: a skipped batch gets empty results and its trackers a
+    predict-only update (no detections), so their motion models and ages keep advancing.
+
+    Skipped batches are told by their missing predictions, not by gate.skipping: with a
+    pipelined predictor the gate may already be deciding on a later batch.
+    """
+    if _gate(predictor) is None or preds is not None:
+        return default_postprocess(preds, img, orig_imgs, *args, **kwargs)
+    return _skipped_results(predictor, predictor.batch[0], orig_imgs)
+
+
+def gated_model_postprocess(predictor, default_postprocess, path, preds, im, im0s):
+    """Same as gated_postprocess, for the postprocess(path, preds, im, im0s) of the detector strategies."""
+    if _gate(predictor) is None or preds is not None:
+        return default_postprocess(path, preds, im, im0s)
+    paths = path if isinstance(path, (list, tuple)) else [path] * len(im0s)
+    return _skipped_results(predictor, paths, im0s)
+
+
+def _skipped_results(predictor, paths, orig_imgs):
+    trackers = getattr(predictor, 'trackers', None) or []
+    results = []
+    for i, orig_img in enumerate(orig_imgs):
+        results.append(Results(orig_img, path=paths[i], names=predictor.model.names, boxes=torch.zeros((0, 6))))
+        if i < len(trackers):
+            trackers[i].update(np.empty((0, 6)), orig_img)
+    return results
@@ -0,0 +1,173 @@
+import queue
+import threading
+
+import torch
+
+_END = object()
+
+
+class PipelinedLoader:
+    """
+    Wraps the loader of the predictor so that decoding and detection run ahead of the
+    tracking loop: a decode thread reads batches from the loader, a detection thread runs
+    preprocess and inference on them, and the predictor only postprocesses, tracks and
+    writes results, while the threads already work on the next batches.
+
+    Both stages are single threads connected by bounded FIFO queues, so batches come out
+    in order. Loader state read per batch by the predictor and the callbacks (bs, frame,
+    active) is captured with the batch, the loader itself is already further ahead.
+
+    :param loader: the loader built by setup_source
+    :param preprocess: preprocess of the predictor, run in the detection thread
+    :param inference: inference of the predictor, run in the detection thread
+    :param queue_size: batches buffered between two stages
+    """
+
+    def __init__(self, loader, preprocess, inference, queue_size=4):
+        self.loader = loader
+        self.preprocess = preprocess
+        self.inference = inference
+        self.queue_size = queue_size
+        # letterboxed batch and predictions of the batch handed out last
+        self.stash = None
+        self.bs = loader.bs
+        self.frame = getattr(loader, 'frame', 0)
+        self.active = getattr(loader, 'active', None)
+        self._stop = threading.Event()
+        self._threads = []
+        self._out = None
+
+    def __getattr__(self, name):
+        if name == 'loader':
+            raise AttributeError(name)
+        return getattr(self.loader, name)
+
+    def _state(self):
+        active = getattr(self.loader, 'active', None)
+        return {
+            'bs': self.loader.bs,
+            'frame': getattr(self.loader, 'frame', 0),
+            'active': list(active) if active is not None else None,
+        }
+
+    @staticmethod
+    def _put(q, item, stop):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _decode(self, out, stop):
+        try:
+            for batch in self.loader:
+                if not self._put(out, (batch, self._state()), stop):
+                    return
+        except Exception as e:
+            self._put(out, e, stop)
+            return
+        self._put(out, _END, stop)
+
+    def _detect(self, src, out, stop):
+        # grad mode is per thread, the predictor's inference mode does not reach here
+        with torch.no_grad():
+            while not stop.is_set():
+                try:
+                    item = src.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is _END or isinstance(item, Exception):
+                    self._put(out, item, stop)
+                    return
+                batch, state = item
+                try:
+                    im = self.preprocess(batch[1])
+                    preds = self.inference(im)
+                except Exception as e:
+                    self._put(out, e, stop)
+                    return
+                if not self._put(out, (batch, state, im, preds), stop):
+                    return
+
+    def __iter__(self):
+        self._join()
+        # every run of the threads has its own stop event, so threads of an earlier run
+        # that are still winding down never read the one of the new run
+        stop = self._stop = threading.Event()
+        decoded = queue.Queue(self.queue_size)
+        self._out = queue.Queue(self.queue_size)
+        self._threads = [
+            threading.Thread(target=self._decode, args=(decoded, stop), daemon=True),
+            threading.Thread(target=self._detect, args=(decoded, self._out, stop), daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def __next__(self):
+        item = self._out.get()
+        if item is _END:
+            raise StopIteration
+        if isinstance(item, Exception):
+            raise item
+        batch, state, im, preds = item
+        self.__dict__.update(state)
+        self.stash = (im, preds)
+        return batch
+
+    def __len__(self):
+        return len(self.loader)
+
+    def _join(self, timeout=5.0):
+        """Stops the threads, True once they are all done."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        done = not any(thread.is_alive() for thread in self._threads)
+        self._threads = []
+        # the batches still queued are dropped with their queues
+        self._out = None
+        self.stash = None
+        return done
+
+    def close(self):
+        """
+        Stops the threads and releases the video captures of the loader, e.g. when the
+        tracking loop is left early.
+        """
+        if not self._join():
+            # the decode thread is still in a read, the captures are released with the loader
+            return
+        caps = [getattr(self.loader, 'cap', None)] + list(getattr(self.loader, 'caps', None) or [])
+        for cap in caps:
+            if cap is not None:
+                cap.release()
+
+
+def pipelined_setup_source(predictor, default_setup_source, source):
+    """Wraps BasePredictor.setup_source: the loader is wrapped when custom_args.pipelined is set."""
+    default_setup_source(source)
+
+    args = getattr(predictor, 'custom_args', None)
+    if not getattr(args, 'pipelined', False):
+        return
+    preprocess, inference = predictor.pipeline_stages
+    predictor.dataset = PipelinedLoader(predictor.dataset, preprocess, inference, getattr(args, 'pipeline_queue', 4))
+
+
+def pipelined_preprocess(predictor, default_preprocess, im):
+    dataset = predictor.dataset
+    if isinstance(dataset, PipelinedLoader) and dataset.stash is not None:
+        return dataset.stash[0]
+    return default_preprocess(im)
+
+
+def pipelined_inference(predictor, default_inference, im, *args, **kwargs):
+    dataset = predictor.dataset
+    if isinstance(dataset, PipelinedLoader) and dataset.stash is not None:
+        preds = dataset.stash[1]
+        dataset.stash = None
+        return preds
+    return default_inference(im, *args, **kwargs)
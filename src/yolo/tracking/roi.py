@@ -0,0 +1,116 @@
+import cv2
+import numpy as np
+from ultralytics.engine.results import Results
+
+
+class RegionOfInterest:
+    """
+    Part of a camera view the detector runs on: a crop rectangle and, optionally, polygons
+    inside of it that are blanked out (a street window, a mirror, a TV screen).
+
+    Coordinates are relative to the full frame (0..1), so the same region works for every
+    ingest width. The detector only sees the crop, its boxes are shifted back to full-frame
+    coordinates before they reach the trackers, which keep working on the full frames (the
+    ReID crops are cut from the full frame at the remapped boxes).
+
+    :param crop: (x1, y1, x2, y2) of the rectangle kept, the whole frame if not given
+    :param mask: list of polygons [[x, y], ...] blanked out in the crop
+    """
+
+    def __init__(self, crop=None, mask=None):
+        self.crop = tuple(crop) if crop is not None else (0.0, 0.0, 1.0, 1.0)
+        self.mask = [np.asarray(polygon, dtype=np.float64).reshape(-1, 2) for polygon in mask or []]
+        # pixel rectangle and mask of the last frame size, a camera never changes it
+        self._shape = None
+        self._rect = None
+        self._keep = None
+
+    @classmethod
+    def from_config(cls, config):
+        """RegionOfInterest from a shops.json "rois" entry, passed through if already one."""
+        if config is None or isinstance(config, cls):
+            return config
+        return cls(config.get('crop'), config.get('mask'))
+
+    def _setup(self, shape):
+        if shape == self._shape:
+            return
+        h, w = shape
+        x1, y1, x2, y2 = self.crop
+        x1, x2 = int(np.clip(round(x1 * w), 0, w - 1)), int(np.clip(round(x2 * w), 1, w))
+        y1, y2 = int(np.clip(round(y1 * h), 0, h - 1)), int(np.clip(round(y2 * h), 1, h))
+        self._rect = (x1, y1, max(x2, x1 + 1), max(y2, y1 + 1))
+
+        self._keep = None
+        if self.mask:
+            keep = np.full((self._rect[3] - self._rect[1], self._rect[2] - self._rect[0]), 255, dtype=np.uint8)
+            polygons = [np.round(p * (w, h) - (x1, y1)).astype(np.int32) for p in self.mask]
+            cv2.fillPoly(keep, polygons, 0)
+            self._keep = keep
+        self._shape = shape
+
+    def rect(self, shape):
+        """(x1, y1, x2, y2) of the crop in pixels, for a frame of shape (h, w)."""
+        self._setup(tuple(shape[:2]))
+        return self._rect
+
+    def cut(self, img):
+        """The crop of a frame, a view."""
+        x1, y1, x2, y2 = self.rect(img.shape)
+        return img[y1:y2, x1:x2]
+
+    def apply(self, img):
+        """The cropped (a view) and masked (a copy) frame the detector runs on."""
+        crop = self.cut(img)
+        if self._keep is None:
+            return crop
+        return cv2.bitwise_and(crop, crop, mask=self._keep)
+
+    def to_frame(self, boxes, shape):
+        """Shifts (N, 4+) boxes (a tensor) from crop to full-frame coordinates, in place."""
+        x1, y1, _, _ = self.rect(shape)
+        boxes[:, [0, 2]] += x1
+        boxes[:, [1, 3]] += y1
+        return boxes
+
+
+def _roi(predictor):
+    return getattr(getattr(predictor, 'custom_args', None), 'roi', None)
+
+
+def _to_frame(roi, results, orig_imgs):
+    """Results of the crops turned into results of the full frames."""
+    remapped = []
+    for r, orig_img in zip(results, orig_imgs):
+        boxes = roi.to_frame(r.boxes.data.clone(), orig_img.shape)
+        remapped.append(Results(orig_img, path=r.path, names=r.names, boxes=boxes))
+    return remapped
+
+
+def roi_preprocess(predictor, default_preprocess, im):
+    """Wraps BasePredictor.preprocess: only the region of interest is letterboxed."""
+    roi = _roi(predictor)
+    if roi is None:
+        return default_preprocess(im)
+    return default_preprocess([roi.apply(img) for img in im])
+
+
+def roi_postprocess(predictor, default_postprocess, preds, img, orig_imgs, *args, **kwargs):
+    """
+    Wraps BasePredictor.postprocess: the boxes are scaled to the crops they were detected
+    on and then shifted to the full frames.
+    """
+    roi = _roi(predictor)
+    if roi is None:
+        return default_postprocess(preds, img, orig_imgs, *args, **kwargs)
+    crops = [roi.cut(orig_img) for orig_img in orig_imgs]
+    return _to_frame(roi, default_postprocess(preds, img, crops, *args, **kwargs), orig_imgs)
+
+
+def roi_model_postprocess(predictor, default_postprocess, path, preds, im, im0s):
+    """Same as roi_postprocess, for the postprocess(path, preds, im, im0s) of the detector strategies."""
+    roi = _roi(predictor)
+    if roi is None:
+        return default_postprocess(path, preds, im, im0s)
+    crops = [roi.cut(im0) for im0 in im0s]
+    return _to_frame(roi, default_postprocess(path, preds, im, crops), im0s)
@@ -0,0 +1,117 @@
+import math
+import threading
+import time
+
+import numpy as np
+
+
+class StrideController:
+    """
+    Adapts vid_stride to the scene while a video is tracked.
+
+    The stride drops to min_stride as soon as two tracked boxes overlap (someone is being
+    served), is base_stride while anybody is tracked and doubles, up to max_stride, after
+    every idle_frames processed frames without any track. Strides are kept multiples of
+    min_stride, so an ffmpeg ingest striding by min_stride can skip the rest.
+
+    :param base_stride: stride while people are tracked
+    :param min_stride: stride while tracked boxes overlap
+    :param max_stride: stride cap for an empty scene
+    :param idle_frames: processed frames without tracks before the stride is doubled
+    """
+
+    def __init__(self, base_stride=3, min_stride=1, max_stride=None, idle_frames=10):
+        self.min_stride = max(1, min_stride)
+        self.base_stride = self._round(max(base_stride, self.min_stride))
+        self.max_stride = self._round(max(max_stride or 8 * self.base_stride, self.base_stride))
+        self.idle_frames = idle_frames
+        self.stride = self.base_stride
+        self.idle = 0
+
+    def _round(self, stride):
+        return max(self.min_stride, stride - stride % self.min_stride)
+
+    def update(self, boxes):
+        """
+        :param boxes: array (N, 5) of x1, y1, x2, y2, track_id of the last processed frame
+        :return: the stride to read the next frame with
+        """
+        boxes = np.asarray(boxes).reshape(-1, 5)
+        if len(boxes) == 0:
+            self.idle += 1
+            if self.idle >= self.idle_frames:
+                self.idle = 0
+                self.stride = self._round(min(2 * self.stride, self.max_stride))
+            return self.stride
+
+        self.idle = 0
+        self.stride = self.min_stride if _any_overlap(boxes) else self.base_stride
+        return self.stride
+
+
+def _any_overlap(boxes):
+    if len(boxes) < 2:
+        return False
+    left = np.minimum(boxes[:, 0], boxes[:, 2])
+    right = np.maximum(boxes[:, 0], boxes[:, 2])
+    top = np.minimum(boxes[:, 1], boxes[:, 3])
+    bottom = np.maximum(boxes[:, 1], boxes[:, 3])
+    overlap = (
+        (np.minimum.outer(right, right) > np.maximum.outer(left, left)) &
+        (np.minimum.outer(bottom, bottom) > np.maximum.outer(top, top))
+    )
+    np.fill_diagonal(overlap, False)
+    return bool(overlap.any())
+
+
+class StrideBudget:
+    """
+    Picks the stride of every video so that the whole backlog is tracked within a
+    wall-clock window.
+
+    The cost of tracking one second of video at stride 1 is learned from the finished
+    videos (tracking time scales with 1 / stride); the backlog that is not downloaded yet
+    is estimated from its size with the seconds per byte of the videos seen so far.
+    Videos that are being tracked while a stride is picked are not counted, so the
+    estimate is optimistic by at most one video per worker. Thread-safe.
+
+    :param window_seconds: wall-clock time available for the whole backlog
+    :param sizes: {video path: size in bytes} of the whole backlog
+    :param workers: videos tracked in parallel
+    :param min_stride: lowest stride ever used
+    :param max_stride: highest stride ever used
+    :param cost: initial guess of the tracking seconds per video second at stride 1
+    """
+
+    def __init__(self, window_seconds, sizes, workers=1, min_stride=1, max_stride=30, cost=1.0):
+        self.deadline = time.monotonic() + window_seconds
+        self.remaining = dict(sizes)
+        self.workers = max(1, workers)
+        self.min_stride = min_stride
+        self.max_stride = max_stride
+        self.cost = cost
+        self.seconds_per_byte = None
+        self.seen_seconds = 0.0
+        self.seen_bytes = 0
+        self.lock = threading.Lock()
+
+    def stride_for(self, video, duration):
+        """Stride for video (duration in seconds), given what is left of the window."""
+        with self.lock:
+            size = self.remaining.pop(video, 0)
+            if size:
+                self.seen_seconds += duration
+                self.seen_bytes += size
+                self.seconds_per_byte = self.seen_seconds / self.seen_bytes
+
+            backlog = duration + sum(self.remaining.values()) * (self.seconds_per_byte or 0)
+            capacity = max(self.deadline - time.monotonic(), 1e-6) * self.workers
+            stride = math.ceil(backlog * self.cost / capacity)
+        return int(min(max(stride, self.min_stride), self.max_stride))
+
+    def done(self, duration, stride, seconds):
+        """Learns the cost from a tracked video: seconds of tracking for duration at stride."""
+        if duration > 0 and seconds > 0:
+            with self.lock:
+                # running average, weighting recent videos more
+                self.cost = 0.5 * (self.cost + seconds * stride / duration)
@@ -12,7 +12,12 @@ from src.yolo.boxmot import TRACKERS
 from src.yolo.boxmot.tracker_zoo import create_tracker
 from src.yolo.boxmot.utils import ROOT, WEIGHTS, TRACKER_CONFIGS
 from src.yolo.boxmot.utils.checks import TestRequirements
-from src.yolo.tracking.detectors import get_yolo_inferer
+from src.yolo.tracking.detectors import get_yolo_inferer, is_ultralytics_model
+from src.yolo.tracking.ingest import setup_source, set_stride, dispatch_trackers, stream_write_results
+from src.yolo.tracking.stride import StrideController
+from src.yolo.tracking.motion_gate import MotionGate, gated_preprocess, gated_inference, gated_postprocess, gated_model_postprocess
+from src.yolo.tracking.roi import RegionOfInterest, roi_preprocess, roi_postprocess, roi_model_postprocess
+from src.yolo.tracking.pipeline import PipelinedLoader, pipelined_setup_source, pipelined_preprocess, pipelined_inference
 
 __tr = TestRequirements()
 __tr.check_packages(('ultralytics @ git+https://github.com/mikel-brostrom/ultralytics.git', ))  # install
@@ -25,6 +30,10 @@ from ultralytics.utils.plotting import save_one_box
 from types import SimpleNamespace
 
 from metrics_evaluation import utils
+from metrics_evaluation.online_metrics import OnlineMetrics
+from metrics_evaluation.track_log import TrackLogWriter, load_track_table, write_salesman_ids
+from metrics_evaluation.track_table import TrackTable
+from metrics_evaluation.salesman_gallery import SalesmanGallery, SalesmanIdentifier
 
 
 def on_predict_start(predictor, persist=False):
@@ -33,15 +42,23 @@ def on_predict_start(predictor, persist=False):
 
     Args:
         predictor (object): The predictor object to initialize trackers for.
-        persist (bool, optional): Whether to persist the trackers if they already exist. Defaults to False.
+        persist (bool, optional): Whether to reuse the trackers (and their loaded ReID models)
+            if they already exist. Reused trackers are reset so no state leaks between sources.
+            Defaults to False.
     """
 
     assert predictor.custom_args.tracking_method in TRACKERS, \
         f"'{predictor.custom_args.tracking_method}' is not supported. Supported ones are {TRACKERS}"
 
+    # keep our own reference, ultralytics may overwrite predictor.trackers with its own
+    trackers = getattr(predictor, 'boxmot_trackers', None) if persist else None
+    trackers = list(trackers or [])[:predictor.dataset.bs]
+    for tracker in trackers:
+        tracker.reset()
+
+    # more streams than ever before, only the missing trackers are created
     tracking_config = TRACKER_CONFIGS / (predictor.custom_args.tracking_method + '.yaml')
-    trackers = []
-    for i in range(predictor.dataset.bs):
+    for i in range(len(trackers), predictor.dataset.bs):
         tracker = create_tracker(
             predictor.custom_args.tracking_method,
             tracking_config,
@@ -55,64 +72,493 @@ def on_predict_start(predictor, persist=False):
             tracker.model.warmup()
         trackers.append(tracker)
 
+    # the box history of the tracks is only drawn by the tracker display
+    for tracker in trackers:
+        tracker.keep_history = bool(getattr(predictor.custom_args, 'show', False))
+
     predictor.trackers = trackers
+    # a smaller batch keeps the trackers it does not use for later ones
+    previous = getattr(predictor, 'boxmot_trackers', None) or []
+    predictor.boxmot_trackers = trackers + list(previous[len(trackers):]) if persist else trackers
+
 
+class TrackingSession:
+    """
+    Long-lived tracking session that keeps the detector, the trackers and their ReID
+    models resident in memory across videos.
 
-@torch.no_grad()
+    The YOLO model is built once, the trackers are created on the first processed video
+    and only reset (not rebuilt) for every following one, so weights are loaded and
+    warmed up a single time per session.
+    """
 
-def run(yolo_model=WEIGHTS / 'yolov8n', source='0', imgsz=[640], conf=0.5, iou=0.7, device='', show=False, save=True, classes=None, project='', name='exp', exist_ok=False, half=False, vid_stride=1, show_labels=False, show_conf=False, show_trajectories=True, save_txt=True, save_id_crops=False, line_width=None, per_class=False, verbose=True, agnostic_nms=False, reid_model=WEIGHTS / 'osnet_x0_25_msmt17.pt', tracking_method='deepocsort'):
+    def __init__(self, yolo_model=WEIGHTS / 'yolov8n', imgsz=[640], conf=0.5, iou=0.7, device='', half=False, classes=None, agnostic_nms=False, per_class=False, reid_model=WEIGHTS / 'osnet_x0_25_msmt17.pt', tracking_method='deepocsort'):
+        self.yolo_model = yolo_model
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+        self.device = device
+        self.half = half
+        self.classes = classes
+        self.agnostic_nms = agnostic_nms
+        self.per_class = per_class
+        self.reid_model = reid_model
+        self.tracking_method = tracking_method
 
-    yolo = YOLO(
-        yolo_model if 'yolov8' in str(yolo_model) else 'yolov8n.pt',
-    )
+        self.yolo = YOLO(
+            yolo_model if is_ultralytics_model(yolo_model) else 'yolov8n.pt',
+        )
+        self.predictor_ready = False
+
+    def _setup_predictor(self, **kwargs):
+        # the callback and the detector only have to be set up once, ultralytics reuses the
+        # predictor (and its model) for every subsequent track() call on the same YOLO object
+        if not self.predictor_ready:
+            # registered after the first track() call so that it runs after the ultralytics
+            # tracker callback and the boxmot trackers win
+            self.yolo.add_callback('on_predict_start', partial(on_predict_start, persist=True))
+            # with several videos at once, the trackers of the streams left in the batch
+            self.yolo.add_callback('on_predict_batch_start', dispatch_trackers)
+
+            if not is_ultralytics_model(self.yolo_model):
+                # replace yolov8 model
+                m = get_yolo_inferer(self.yolo_model)
+                model = m(
+                    model=self.yolo_model,
+                    device=self.yolo.predictor.device,
+                    args=self.yolo.predictor.args
+                )
+                model.postprocess = partial(roi_model_postprocess, self.yolo.predictor, model.postprocess)
+                model.postprocess = partial(gated_model_postprocess, self.yolo.predictor, model.postprocess)
+                self.yolo.predictor.model = model
+
+            # lets process(ingest='ffmpeg') swap in the ffmpeg pipe loader
+            self.yolo.predictor.setup_source = partial(setup_source, self.yolo.predictor, self.yolo.predictor.setup_source)
+            # lets process_many() write the labels of every video to its own folder
+            self.yolo.predictor.write_results = partial(stream_write_results, self.yolo.predictor, self.yolo.predictor.write_results)
+            # lets process(motion_gate=True) skip the detector on static frames
+            self.yolo.predictor.preprocess = partial(gated_preprocess, self.yolo.predictor, self.yolo.predictor.preprocess)
+            self.yolo.predictor.inference = partial(gated_inference, self.yolo.predictor, self.yolo.predictor.inference)
+            self.yolo.predictor.postprocess = partial(roi_postprocess, self.yolo.predictor, self.yolo.predictor.postprocess)
+            self.yolo.predictor.postprocess = partial(gated_postprocess, self.yolo.predictor, self.yolo.predictor.postprocess)
+            # lets process(roi=...) detect on a region of the frame only, the gate compares
+            # that region too
+            self.yolo.predictor.preprocess = partial(roi_preprocess, self.yolo.predictor, self.yolo.predictor.preprocess)
+            # lets process(pipelined=True) run the preprocess and inference chains above in a
+            # thread of their own, ahead of postprocessing and tracking
+            self.yolo.predictor.pipeline_stages = (self.yolo.predictor.preprocess, self.yolo.predictor.inference)
+            self.yolo.predictor.setup_source = partial(pipelined_setup_source, self.yolo.predictor, self.yolo.predictor.setup_source)
+            self.yolo.predictor.preprocess = partial(pipelined_preprocess, self.yolo.predictor, self.yolo.predictor.preprocess)
+            self.yolo.predictor.inference = partial(pipelined_inference, self.yolo.predictor, self.yolo.predictor.inference)
+            self.predictor_ready = True
+
+        # store custom args in predictor
+        self.yolo.predictor.custom_args = SimpleNamespace(
+            yolo_model=self.yolo_model,
+            imgsz=self.imgsz,
+            conf=self.conf,
+            iou=self.iou,
+            device=self.device,
+            half=self.half,
+            classes=self.classes,
+            agnostic_nms=self.agnostic_nms,
+            per_class=self.per_class,
+            reid_model=self.reid_model,
+            tracking_method=self.tracking_method,
+            **kwargs
+        )
+
+    @torch.no_grad()
+    def process(self, source, project='', name='exp', exist_ok=False, vid_stride=1, show=False, save=True, save_txt=True, show_labels=False, show_conf=False, show_trajectories=True, line_width=None, verbose=True, ingest=None, ingest_width=640, render=True, clip_length=100, clip_every=None, max_clips=10, online_metrics=False, track_log=False, salesman_gallery=None, motion_gate=False, adaptive_stride=False, min_stride=1, max_stride=None, roi=None, pipelined=False, pipeline_queue=4):
+        """
+        Tracks a single video with the resident models.
+
+        Args:
+            source (str): Path to the video to track.
+            project (str): Root folder for the results.
+            name (str): Results sub-folder for this video.
+            vid_stride (int): Process every vid_stride-th frame, the base stride with adaptive_stride.
+            ingest (str, optional): 'ffmpeg' to let ffmpeg scale and stride the original video
+                and pipe raw frames to the detector, instead of decoding the file with OpenCV.
+            ingest_width (int): Frame width produced by the ffmpeg ingest.
+            render (bool): Write the salesman overlay video. Disable it when nobody watches the output.
+            clip_length (int): Processed frames per sampled clip, see clip_every.
+            clip_every (int, optional): Only render clips of clip_length frames starting every
+                clip_every processed frames (salesman_clips.mp4), collected during tracking
+                instead of decoding the whole video again for salesman_labeled.mp4.
+            max_clips (int): Maximum number of sampled clips.
+            online_metrics (bool): Compute the metrics while tracking, from the tracker output
+                instead of the label files, so save_txt can be disabled.
+            track_log (bool): Write all tracked boxes to a single columnar track log
+                (<save_dir>/tracks, see TrackLogWriter) instead of, or besides, the label files.
+            salesman_gallery (str, optional): Gallery folder of the shop. The salesman is then
+                identified online by matching the embeddings the tracker's ReID model computed
+                for its new tracks against it (the longest non-overlapping tracks when
+                nothing or overlapping tracks match), and the gallery is updated with the
+                salesman tracks of this video.
+            motion_gate (bool): Only run the detector on frames that differ from the last
+                detected one (see MotionGate), the trackers get a predict-only update on the
+                others. The gate, with its skip statistics, is kept as self.motion_gate.
+            adaptive_stride (bool): Adapt the stride to the scene (see StrideController):
+                min_stride while tracked people overlap, vid_stride while anybody is tracked,
+                up to max_stride in an empty scene. Online metrics are weighted accordingly,
+                label files are numbered by processed frame and no longer map to a fixed stride.
+            min_stride (int): Stride while tracked people overlap, see adaptive_stride.
+            max_stride (int, optional): Stride cap for an empty scene, see adaptive_stride.
+            roi (dict or RegionOfInterest, optional): Region of the camera view the detector
+                runs on, e.g. the shops.json "rois" entry of the shop: {"crop": [x1, y1, x2, y2],
+                "mask": [polygon, ...]} relative to the frame. Boxes and outputs stay in
+                full-frame coordinates.
+            pipelined (bool): Decode in one thread and run the detector in another, ahead of
+                the tracking loop, through queues of pipeline_queue batches (see
+                PipelinedLoader). Ignored with adaptive_stride, which sets the stride of the
+                very next frame.
+            pipeline_queue (int): Batches buffered between two pipeline stages.
+
+        Returns:
+            Path: The directory where the results (labels, videos) were saved. The size of the
+            tracked frames is available as self.frame_size afterwards, the metrics as
+            self.metrics when online_metrics is set.
+        """
+        results = self.yolo.track(
+            source=source,
+            conf=self.conf,
+            iou=self.iou,
+            agnostic_nms=self.agnostic_nms,
+            show=show,
+            stream=True,
+            device=self.device,
+            show_conf=show_conf,
+            save_txt=save_txt,
+            show_labels=show_labels,
+            save=save,
+            verbose=verbose,
+            exist_ok=exist_ok,
+            project=project,
+            name=name,
+            classes=self.classes,
+            imgsz=self.imgsz,
+            # ffmpeg already drops the strided frames
+            vid_stride=1 if ingest == 'ffmpeg' else vid_stride,
+            line_width=line_width
+        )
+
+        self.motion_gate = MotionGate() if motion_gate else None
+        if pipelined and adaptive_stride:
+            print("pipelined is ignored with adaptive_stride")
+        self._setup_predictor(
+            pipelined=pipelined and not adaptive_stride,
+            pipeline_queue=pipeline_queue,
+            motion_gate=self.motion_gate,
+            roi=RegionOfInterest.from_config(roi),
+            source=source,
+            project=project,
+            name=name,
+            vid_stride=vid_stride,
+            show=show,
+            save=save,
+            save_txt=save_txt,
+            show_trajectories=show_trajectories,
+            ingest=ingest,
+            ingest_width=ingest_width,
+            # with an adaptive stride ffmpeg only drops what every stride drops
+            ingest_stride=min_stride if adaptive_stride else vid_stride,
+        )
+        save_dir = self.yolo.predictor.save_dir
+        print(save_dir)
+
+        # the overlay sink only exists (and only costs anything) when clips are requested
+        clip_sink = None
+        if render and clip_every:
+            # one clip frame per processed frame, so the clips play at real speed (with
+            # adaptive_stride, at the stride used while people are tracked)
+            fps = _video_fps(source) / vid_stride
+            # 10 when the file does not store its frame rate
+            clip_sink = utils.SalesmanClipSink(Path(save_dir) / 'salesman_clips.mp4', fps=fps or 10, clip_length=clip_length, clip_every=clip_every, max_clips=max_clips)
+
+        metrics = OnlineMetrics() if online_metrics else None
+        log = TrackLogWriter(Path(save_dir) / 'tracks') if track_log else None
+        # built on the first frame, the trackers only exist once the iteration has started
+        identifier = None
+        controller = StrideController(vid_stride, min_stride, max_stride) if adaptive_stride else None
+        # position of the current frame in processed frames at vid_stride, see OnlineMetrics
+        stride = controller.stride if controller is not None else vid_stride
+        position = 0
+
+        # the tracker overlay is only drawn when somebody watches it
+        display = TrackerDisplay(show_trajectories) if show is True else None
+
+        self.frame_size = None
+        self.metrics = None
+        try:
+            for frame_index, r in enumerate(results, start=1):
+                self.frame_size = r.orig_img.shape[1::-1]
+                position += stride / vid_stride
+                if frame_index == 1 and salesman_gallery:
+                    identifier = self._salesman_identifier(salesman_gallery)
+
+                wants_clip = clip_sink is not None and clip_sink.wants(frame_index)
+                if metrics is not None or log is not None or identifier is not None or controller is not None or wants_clip:
+                    boxes = _tracked_boxes(r)
+                    if controller is not None:
+                        stride = controller.update(boxes)
+                        set_stride(self.yolo.predictor.dataset, stride)
+                    if identifier is not None:
+                        identifier.update(boxes)
+                    if metrics is not None:
+                        metrics.update(frame_index, boxes, position if controller is not None else None)
+                    if log is not None and len(boxes):
+                        log.append(frame_index, boxes, r.boxes.cls.cpu().numpy())
+                    # before the display, which draws on orig_img in place
+                    if wants_clip:
+                        clip_sink.add(frame_index, r.orig_img, boxes)
+
+                if display is not None and not display.add(self.yolo.predictor.trackers[0], r.orig_img):
+                    break
+        finally:
+            # the pipeline threads hold the video and queued batches, also when the loop
+            # is left early or raises
+            if isinstance(self.yolo.predictor.dataset, PipelinedLoader):
+                self.yolo.predictor.dataset.close()
+
+        if self.motion_gate is not None:
+            print(self.motion_gate.summary())
+        if log is not None:
+            log.close()
+
+        # frames of every track, to check the gallery matches and to pick what the gallery learns
+        track_frames = self._track_frames(metrics, log, save_txt, save_dir) if identifier is not None else None
+        if identifier is not None and identifier.gallery.ready:
+            salesman_ids = identifier.salesman_ids(track_frames)
+            if save_txt:
+                utils.relabel_salesman_tracks(f'{save_dir}/labels', salesman_ids)
+        elif save_txt:
+            salesman_ids = utils.find_main_character_tracks(f'{save_dir}/labels')
+        elif metrics is not None:
+            salesman_ids = utils.select_main_character_tracks(metrics.track_frames())
+        elif log is not None:
+            salesman_ids = utils.select_main_character_tracks(load_track_table(log.folder, salesman_ids=()).track_frames())
+        else:
+            salesman_ids = []
+
+        if identifier is not None:
+            identifier.commit(salesman_ids, track_frames)
+
+        if log is not None:
+            # the log is never rewritten, the salesman tracks are stored next to it
+            write_salesman_ids(log.folder, salesman_ids)
+
+        if metrics is not None:
+            self.metrics = metrics.result(salesman_ids)
+
+        if clip_sink is not None:
+            clip_sink.close(salesman_ids)
+        elif render and save_txt and controller is not None:
+            print("salesman_labeled.mp4 needs a constant stride, use clip_every with adaptive_stride")
+        elif render and save_txt:
+            # the overlay is drawn from the relabeled label files
+            utils.process_video_and_plot_boxes(source, vid_stride, f'{save_dir}/labels',  f'{save_dir}/salesman_labeled.mp4')
+        return save_dir
+
+
+    @torch.no_grad()
+    def process_many(self, sources, project='', name='exp', exist_ok=False, vid_stride=1, names=None, save_txt=True, verbose=True, ingest=None, ingest_width=640, online_metrics=False, track_log=False):
+        """
+        Tracks several videos at once: every batch holds the next frame of each video, so
+        the detector runs one forward pass for all of them, and every video gets its own
+        tracker. Meant for videos of similar length, a video that ends leaves the batch.
+
+        Nothing is rendered, the outputs of every video are written to its own folder
+        under the run folder, as process() does for a single one.
+
+        Args:
+            sources (list): Paths to the videos to track.
+            project (str): Root folder for the results.
+            name (str): Results sub-folder for this run.
+            vid_stride (int): Process every vid_stride-th frame.
+            names (list, optional): Sub-folder of every video in the run folder, defaults to
+                its index and file name (video names of different shops may be the same).
+            save_txt (bool): Write the label files of every video to <folder>/labels.
+            ingest (str, optional): 'ffmpeg' to let ffmpeg scale and stride the videos.
+            ingest_width (int): Frame width produced by the ffmpeg ingest.
+            online_metrics (bool): Compute the metrics of every video while tracking.
+            track_log (bool): Write a track log per video to <folder>/tracks.
+
+        Returns:
+            dict: {source: folder of its results}. The frame sizes are available as
+            self.frame_sizes and, when online_metrics is set, the metrics as self.metrics,
+            both keyed by source.
+        """
+        # normalized like the paths ultralytics hands to write_results
+        sources = [str(Path(source)) for source in sources]
+        names = names or [f'{i}_{Path(source).stem}' for i, source in enumerate(sources)]
+
+        results = self.yolo.track(
+            source=sources[0],
+            conf=self.conf,
+            iou=self.iou,
+            agnostic_nms=self.agnostic_nms,
+            stream=True,
+            device=self.device,
+            save_txt=save_txt,
+            # per stream video writers are not supported
+            save=False,
+            verbose=verbose,
+            exist_ok=exist_ok,
+            project=project,
+            name=name,
+            classes=self.classes,
+            imgsz=self.imgsz,
+            vid_stride=vid_stride,
+        )
+
+        self._setup_predictor(
+            sources=sources,
+            project=project,
+            name=name,
+            vid_stride=vid_stride,
+            save=False,
+            save_txt=save_txt,
+            ingest=ingest,
+            ingest_width=ingest_width,
+        )
+        save_dir = Path(self.yolo.predictor.save_dir)
+        stream_dirs = {source: save_dir / stream for source, stream in zip(sources, names)}
+        for stream_dir in stream_dirs.values():
+            (stream_dir / 'labels').mkdir(parents=True, exist_ok=True)
+        self.yolo.predictor.custom_args.stream_dirs = stream_dirs
+
+        metrics = {source: OnlineMetrics() for source in sources} if online_metrics else None
+        logs = {source: TrackLogWriter(stream_dirs[source] / 'tracks') for source in sources} if track_log else None
+
+        self.frame_sizes = {}
+        frame_indices = dict.fromkeys(sources, 0)
+        for r in results:
+            source = r.path
+            frame_indices[source] += 1
+            self.frame_sizes[source] = r.orig_img.shape[1::-1]
+            if metrics is not None or logs is not None:
+                boxes = _tracked_boxes(r)
+                if metrics is not None:
+                    metrics[source].update(frame_indices[source], boxes)
+                if logs is not None and len(boxes):
+                    logs[source].append(frame_indices[source], boxes, r.boxes.cls.cpu().numpy())
+
+        if logs is not None:
+            for log in logs.values():
+                log.close()
+
+        self.metrics = {} if metrics is not None else None
+        for source in sources:
+            if save_txt:
+                salesman_ids = utils.find_main_character_tracks(f'{stream_dirs[source]}/labels')
+            elif metrics is not None:
+                salesman_ids = utils.select_main_character_tracks(metrics[source].track_frames())
+            elif logs is not None:
+                salesman_ids = utils.select_main_character_tracks(load_track_table(logs[source].folder, salesman_ids=()).track_frames())
+            else:
+                salesman_ids = []
 
-    results = yolo.track(
-        source=source,
+            if logs is not None:
+                write_salesman_ids(logs[source].folder, salesman_ids)
+            if metrics is not None:
+                self.metrics[source] = metrics[source].result(salesman_ids)
+        return {source: str(stream_dir) for source, stream_dir in stream_dirs.items()}
+
+    def _track_frames(self, metrics, log, save_txt, save_dir):
+        """{track_id: frame indices} of the video just tracked, from whichever output has them."""
+        if metrics is not None:
+            return metrics.track_frames()
+        if log is not None:
+            return load_track_table(log.folder, salesman_ids=()).track_frames()
+        if save_txt and self.frame_size is not None:
+            return TrackTable.from_folder(f'{save_dir}/labels', *self.frame_size).track_frames()
+        return {}
+
+    def _salesman_identifier(self, gallery_folder):
+        tracker = self.yolo.predictor.trackers[0]
+        if tracker.get_track_embs() is None:
+            print(f"{self.tracking_method} has no ReID model, the salesman gallery is not used")
+            return None
+        return SalesmanIdentifier(SalesmanGallery(gallery_folder), tracker)
+
+
+class TrackerDisplay:
+    """
+    Shows the boxes and trajectories of a tracker in a window, frame by frame.
+
+    :param show_trajectories: also draw the trajectory of every track
+    :param window: name of the window
+    """
+
+    def __init__(self, show_trajectories=True, window='BoxMOT'):
+        self.show_trajectories = show_trajectories
+        self.window = window
+
+    def add(self, tracker, img):
+        """Draws the tracks on img (in place) and shows it, False once the user asks to stop."""
+        img = tracker.plot_results(img, self.show_trajectories)
+        cv2.imshow(self.window, img)
+        key = cv2.waitKey(1) & 0xFF
+        return key != ord(' ') and key != ord('q')
+
+
+def _video_fps(source):
+    """Frame rate stored in the video file, 0 if unknown."""
+    cap = cv2.VideoCapture(str(source))
+    fps = cap.get(cv2.CAP_PROP_FPS) if cap.isOpened() else 0.0
+    cap.release()
+    return max(fps, 0.0)
+
+
+def _tracked_boxes(r):
+    """(N, 5) array of x1, y1, x2, y2, track_id of the tracked boxes of one result."""
+    if r.boxes.id is None:
+        return np.empty((0, 5))
+    return np.column_stack([r.boxes.xyxy.cpu().numpy(), r.boxes.id.cpu().numpy()])
+
+
+def run(yolo_model=WEIGHTS / 'yolov8n', source='0', imgsz=[640], conf=0.5, iou=0.7, device='', show=False, save=True, classes=None, project='', name='exp', exist_ok=False, half=False, vid_stride=1, show_labels=False, show_conf=False, show_trajectories=True, save_txt=True, save_id_crops=False, line_width=None, per_class=False, verbose=True, agnostic_nms=False, reid_model=WEIGHTS / 'osnet_x0_25_msmt17.pt', tracking_method='deepocsort', track_log=False, pipelined=False):
+
+    session = TrackingSession(
+        yolo_model=yolo_model,
+        imgsz=imgsz,
         conf=conf,
         iou=iou,
+        device=device,
+        half=half,
+        classes=classes,
         agnostic_nms=agnostic_nms,
+        per_class=per_class,
+        reid_model=reid_model,
+        tracking_method=tracking_method,
+    )
+    if isinstance(source, (list, tuple)):
+        # several videos, batched through the detector together
+        return session.process_many(
+            source,
+            project=project,
+            name=name,
+            exist_ok=exist_ok,
+            vid_stride=vid_stride,
+            save_txt=save_txt,
+            verbose=verbose,
+            track_log=track_log,
+        )
+    return session.process(
+        source,
+        project=project,
+        name=name,
+        exist_ok=exist_ok,
+        vid_stride=vid_stride,
         show=show,
-        stream=True,
-        device=device,
-        show_conf=show_conf,
+        save=save,
         save_txt=save_txt,
         show_labels=show_labels,
-        save=save,
+        show_conf=show_conf,
+        show_trajectories=show_trajectories,
+        line_width=line_width,
         verbose=verbose,
-        exist_ok=exist_ok,
-        project=project,
-        name=name,
-        classes=classes,
-        imgsz=imgsz,
-        vid_stride=vid_stride,
-        line_width=line_width
+        track_log=track_log,
+        pipelined=pipelined,
     )
-
-    yolo.add_callback('on_predict_start', partial(on_predict_start, persist=True))
-
-    if 'yolov8' not in str(yolo_model):
-        # replace yolov8 model
-        m = get_yolo_inferer(yolo_model)
-        model = m(
-            model=yolo_model,
-            device=yolo.predictor.device,
-            args=yolo.predictor.args
-        )
-        yolo.predictor.model = model
-
-    # store custom args in predictor
-    yolo.predictor.custom_args = SimpleNamespace(**locals())
-    print(yolo.predictor.save_dir)
-
-    for r in results:
-
-        img = yolo.predictor.trackers[0].plot_results(r.orig_img, show_trajectories)
-
-        if show is True:
-            cv2.imshow('BoxMOT', img)     
-            key = cv2.waitKey(1) & 0xFF
-            if key == ord(' ') or key == ord('q'):
-                break
-    
-    utils.find_main_character_tracks(f'{yolo.predictor.save_dir}/labels')
-    utils.process_video_and_plot_boxes(source, vid_stride, f'{yolo.predictor.save_dir}/labels',  f'{yolo.predictor.save_dir}/salesman_labeled.mp4')
@@ -148,6 +148,8 @@ def parse_opt():
                         help='MOT16, MOT17, MOT20')
     parser.add_argument('--split', type=str, default='train',
                         help='existing project/name ok, do not increment')
+    parser.add_argument('--motion-gate', action='store_true',
+                        help='evaluate the results generated with --motion-gate by generate_mot_results.py')
 
     opt = parser.parse_args()
     return opt
@@ -157,6 +159,8 @@ def run_trackeval(opt):
     if opt is None:
         opt = parse_opt()
         exp_folder_path = opt.project / (str(opt.dets) + "_" + str(opt.embs) + "_" + str(opt.tracking_method))
+        if opt.motion_gate:
+            exp_folder_path = exp_folder_path.with_name(exp_folder_path.name + "_gated")
         exp_folder_path = increment_path(path=exp_folder_path, sep="_", exist_ok=opt.exist_ok)
         opt.exp_folder_path = exp_folder_path
     else: